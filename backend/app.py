@@ -1,14 +1,19 @@
 """Main Flask application for MedResilient backend"""
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
+import atexit
+import json
 from flask_cors import CORS
 import os
+import uuid
 from werkzeug.utils import secure_filename
 
 from config import Config
 from data_service import DataService
 from recommendation_service import RecommendationService
-from gee_service import GEEService
+from gee_service import get_gee_service
 from fema_service import FEMAService
+from risk_scheduler import RiskScheduler, RiskTable, HOSPITAL, PROVIDER
+from ingest import IngestManager, DONE
 
 
 app = Flask(__name__)
@@ -17,9 +22,80 @@ CORS(app)
 
 # Initialize services
 data_service = DataService()
-recommendation_service = RecommendationService()
-gee_service = GEEService()
+# Shared Earth Engine client, initialized in the background on first use
+gee_service = get_gee_service()
 fema_service = FEMAService()
+# Risk for known hospitals/providers is precomputed in the background and
+# published to the risk table once the scheduler runs
+risk_table = RiskTable()
+risk_scheduler = RiskScheduler(data_service, fema_service, gee_service, risk_table)
+# Share the FEMA flood zone cache between recommendations and map endpoints;
+# risk is computed on demand until the scheduler is started
+recommendation_service = RecommendationService(gee_service=gee_service,
+                                               fema_service=fema_service,
+                                               device_index=data_service.device_index)
+
+# Keep persisted routes for locations that did not move since the last run
+recommendation_service.route_matrix.sync(
+    data_service.get_all_hospitals(), data_service.get_all_providers()
+)
+# Routes found since the last background save are written on shutdown
+atexit.register(recommendation_service.route_matrix.flush)
+
+
+def start_risk_scheduler():
+    """Start background risk precomputation and read risk from its table"""
+    if Config.RISK_SCHEDULER_ENABLED:
+        risk_scheduler.start()
+        recommendation_service.risk_table = risk_table
+
+
+# Each worker of a multi-process server imports this module, so the
+# scheduler is only started here when explicitly asked for
+if Config.RISK_SCHEDULER_AUTOSTART:
+    start_risk_scheduler()
+
+
+def refresh_after_upload(csv_type, changes=None):
+    """
+    Bring derived data up to date once an upload has been applied
+    With the changed IDs known only those are re-scored and evicted
+    """
+    if csv_type not in ('hospitals', 'providers'):
+        return
+    
+    # Recompute routes only for added or moved locations, in the
+    # background; lookups route any cell still missing on demand
+    hospitals = data_service.get_all_hospitals()
+    providers = data_service.get_all_providers()
+    recommendation_service.route_matrix.sync(hospitals, providers)
+    recommendation_service.route_matrix.refresh_in_background(hospitals, providers)
+    recommendation_service.device_index = data_service.device_index
+    
+    if changes is None:
+        # Frontiers were built from the old locations
+        recommendation_service.frontier_cache.clear()
+        # Score new or moved locations without waiting for the interval
+        risk_scheduler.trigger()
+        return
+    
+    if csv_type == 'hospitals':
+        kind, lookup = HOSPITAL, data_service.get_hospital_by_id
+    else:
+        kind, lookup = PROVIDER, data_service.get_provider_by_id
+    changed = changes['added'] + changes['updated']
+    risk_table.remove(kind, changes['deleted'])
+    if risk_scheduler.running:
+        risk_scheduler.refresh(kind, [lookup(i) for i in changed if lookup(i)])
+    if kind == HOSPITAL:
+        recommendation_service.frontier_cache.invalidate(changes['updated'] + changes['deleted'])
+    elif changed or changes['deleted']:
+        # Every hospital's ranking can include a changed provider
+        recommendation_service.frontier_cache.clear()
+
+
+# Uploads are parsed in chunks by a single background worker
+ingest_manager = IngestManager(data_service, on_complete=refresh_after_upload)
 
 # Ensure upload folder exists
 os.makedirs(Config.UPLOAD_FOLDER, exist_ok=True)
@@ -34,9 +110,15 @@ def allowed_file(filename):
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
+    route_cache = recommendation_service.route_service.cache
     return jsonify({
         'status': 'healthy',
-        'gee_initialized': gee_service.initialized
+        'gee_initialized': gee_service.initialized,
+        'gee_status': gee_service.status,
+        'route_cache': route_cache.stats() if route_cache else None,
+        'fema_cache': fema_service.cache_stats(),
+        'risk_scheduler': risk_scheduler.status(),
+        'frontier_cache': recommendation_service.frontier_cache.stats()
     })
 
 
@@ -108,13 +190,16 @@ def get_provider(provider_id):
 
 @app.route('/api/orders', methods=['GET'])
 def get_orders():
-    """Get all orders or filter by hospital/device"""
+    """Get all orders or filter by hospital/provider/device"""
     try:
         hospital_id = request.args.get('hospital_id')
+        provider_id = request.args.get('provider_id')
         device_name = request.args.get('device_name')
         
         if hospital_id:
             orders = data_service.get_orders_by_hospital(hospital_id)
+        elif provider_id:
+            orders = data_service.get_orders_by_provider(provider_id)
         elif device_name:
             orders = data_service.get_orders_by_device(device_name)
         else:
@@ -193,6 +278,249 @@ def get_recommendations():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@app.route('/api/recommendations/frontier', methods=['POST'])
+def get_recommendation_frontier():
+    """
+    Get a hospital's flood risk / carbon trade-off and a ranking for α/β
+    Request body: same as /api/recommendations
+    The first call per hospital and device does all route and risk
+    lookups; later calls (e.g. while moving the α/β sliders) re-rank the
+    cached frontier without any lookups
+    """
+    try:
+        data = request.json
+        hospital_id = data.get('hospital_id')
+        alpha = data.get('alpha')
+        beta = data.get('beta')
+        
+        if not hospital_id:
+            return jsonify({
+                'success': False,
+                'error': 'hospital_id is required'
+            }), 400
+        
+        hospital = data_service.get_hospital_by_id(hospital_id)
+        if not hospital:
+            return jsonify({
+                'success': False,
+                'error': 'Hospital not found'
+            }), 404
+        
+        frontier = recommendation_service.get_frontier(
+            hospital, data_service.get_all_providers(), data.get('device')
+        )
+        recommendations = recommendation_service.rank_frontier(
+            frontier, alpha, beta, data.get('limit')
+        )
+        
+        return jsonify({
+            'success': True,
+            'hospital': hospital.to_dict(),
+            'provider_count': len(frontier),
+            'frontier': [r.to_dict() for r in frontier.frontier_recommendations(alpha, beta)],
+            'count': len(recommendations),
+            'recommendations': [r.to_dict() for r in recommendations]
+        })
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/recommendations/stream', methods=['POST'])
+def stream_recommendations():
+    """
+    Stream supplier recommendations for a hospital as they are refined
+    Same request body as /api/recommendations. Sends a 'provisional'
+    ranking straight away (straight-line distances, cached risk), a
+    'refined' ranking whenever route or risk lookups complete and a
+    'final' ranking at the end. Responds with Server-Sent Events when the
+    client accepts text/event-stream, newline-delimited JSON otherwise.
+    """
+    data = request.json or {}
+    hospital_id = data.get('hospital_id')
+    
+    if not hospital_id:
+        return jsonify({
+            'success': False,
+            'error': 'hospital_id is required'
+        }), 400
+    
+    hospital = data_service.get_hospital_by_id(hospital_id)
+    if not hospital:
+        return jsonify({
+            'success': False,
+            'error': 'Hospital not found'
+        }), 404
+    
+    providers = data_service.get_all_providers()
+    use_sse = 'text/event-stream' in request.headers.get('Accept', '')
+    
+    def encode(event, payload):
+        body = json.dumps({'event': event, **payload})
+        if use_sse:
+            return f"event: {event}\ndata: {body}\n\n"
+        return body + "\n"
+    
+    def generate():
+        try:
+            for event, recommendations in recommendation_service.stream_recommendations(
+                    hospital, providers, data.get('alpha'), data.get('beta'),
+                    data.get('limit'), data.get('device')):
+                yield encode(event, {
+                    'hospital': hospital.to_dict(),
+                    'count': len(recommendations),
+                    'recommendations': [r.to_dict() for r in recommendations]
+                })
+        except Exception as e:
+            yield encode('error', {'success': False, 'error': str(e)})
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream' if use_sse else 'application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@app.route('/api/recommendations/batch', methods=['POST'])
+def get_batch_recommendations():
+    """
+    Get supplier recommendations for many hospitals in one call
+    Request body: {
+        "hospital_ids": ["H001", {"hospital_id": "H002", "device": "CPAP", "limit": 3}],
+        "alpha": 0.6,  // optional default for every hospital
+        "beta": 0.4,   // optional default for every hospital
+        "limit": 5,    // optional default for every hospital
+        "device": "Ventilator"  // optional default for every hospital
+    }
+    Entries may be plain IDs or objects overriding device, alpha, beta, limit
+    """
+    try:
+        data = request.json
+        entries = data.get('hospital_ids')
+        
+        if not entries or not isinstance(entries, list):
+            return jsonify({
+                'success': False,
+                'error': 'hospital_ids must be a non-empty list'
+            }), 400
+        
+        hospital_requests = []
+        for entry in entries:
+            if not isinstance(entry, dict):
+                entry = {'hospital_id': entry}
+            
+            hospital_id = entry.get('hospital_id')
+            if not hospital_id:
+                return jsonify({
+                    'success': False,
+                    'error': 'hospital_id is required for every entry'
+                }), 400
+            
+            hospital = data_service.get_hospital_by_id(hospital_id)
+            if not hospital:
+                return jsonify({
+                    'success': False,
+                    'error': f'Hospital not found: {hospital_id}'
+                }), 404
+            
+            hospital_requests.append({
+                'hospital': hospital,
+                'alpha': entry.get('alpha', data.get('alpha')),
+                'beta': entry.get('beta', data.get('beta')),
+                'limit': entry.get('limit', data.get('limit')),
+                'device': entry.get('device', data.get('device'))
+            })
+        
+        providers = data_service.get_all_providers()
+        
+        rankings = recommendation_service.generate_batch_recommendations(
+            hospital_requests, providers
+        )
+        
+        return jsonify({
+            'success': True,
+            'count': len(rankings),
+            'results': [
+                {
+                    'hospital': req['hospital'].to_dict(),
+                    'device': req['device'],
+                    'count': len(recommendations),
+                    'recommendations': [r.to_dict() for r in recommendations]
+                }
+                for req, recommendations in zip(hospital_requests, rankings)
+            ]
+        })
+
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/recommendations/basket', methods=['POST'])
+def get_basket_recommendations():
+    """
+    Source several devices for a hospital from as few, good providers as possible
+    Request body: {
+        "hospital_id": "H001",
+        "devices": ["Ventilator", "Infusion pump"],
+        "alpha": 0.6,  // optional
+        "beta": 0.4    // optional
+    }
+    Substitutes are accepted; each device is assigned to one chosen provider
+    """
+    try:
+        data = request.json
+        hospital_id = data.get('hospital_id')
+        devices = data.get('devices')
+
+        if not hospital_id:
+            return jsonify({
+                'success': False,
+                'error': 'hospital_id is required'
+            }), 400
+
+        if not devices or not isinstance(devices, list) or \
+                not all(isinstance(d, str) and d.strip() for d in devices):
+            return jsonify({
+                'success': False,
+                'error': 'devices must be a non-empty list of device names'
+            }), 400
+
+        hospital = data_service.get_hospital_by_id(hospital_id)
+        if not hospital:
+            return jsonify({
+                'success': False,
+                'error': 'Hospital not found'
+            }), 404
+
+        providers = data_service.get_all_providers()
+        basket = recommendation_service.generate_basket(
+            hospital, providers, devices, data.get('alpha'), data.get('beta')
+        )
+
+        # Group the assigned devices into one shipment per chosen provider
+        shipments = {provider_id: [] for provider_id in basket['providers']}
+        for recommendation in basket['recommendations']:
+            if recommendation:
+                shipments[recommendation.provider.provider_id].append(
+                    recommendation.to_dict()
+                )
+
+        return jsonify({
+            'success': True,
+            'hospital': hospital.to_dict(),
+            'total_score': basket['total_score'],
+            'shipment_count': sum(1 for items in shipments.values() if items),
+            'shipments': [
+                {'provider_id': provider_id, 'items': items}
+                for provider_id, items in shipments.items() if items
+            ],
+            'unavailable': basket['unavailable']
+        })
+
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 @app.route('/api/analyze-provider', methods=['POST'])
 def analyze_provider():
     """
@@ -244,38 +572,26 @@ def get_map_data():
         hospitals = data_service.get_all_hospitals()
         providers = data_service.get_all_providers()
         
-        # Get flood risk for each location
+        # Precomputed risk; FEMA-only estimates for anything not scored yet
+        hospital_risks = recommendation_service.get_entity_risk_details(HOSPITAL, hospitals)
+        provider_risks = recommendation_service.get_entity_risk_details(PROVIDER, providers)
+        
         hospital_markers = []
-        for hospital in hospitals:
-            fema_data = fema_service.get_flood_zone(
-                hospital.latitude, hospital.longitude
-            )
+        for hospital, risk in zip(hospitals, hospital_risks):
             marker = hospital.to_dict()
-            marker['flood_zone'] = fema_data['zone']
-            marker['risk_level'] = fema_data['risk_level']
+            marker['flood_zone'] = risk['fema']['zone']
+            marker['risk_level'] = risk['fema']['risk_level']
             hospital_markers.append(marker)
         
         provider_markers = []
-        for provider in providers:
-            fema_data = fema_service.get_flood_zone(
-                provider.latitude, provider.longitude
-            )
-            
-            # Get GEE data for combined risk calculation
-            gee_risk = gee_service.get_flood_susceptibility(
-                provider.latitude, provider.longitude
-            )
-            
-            # Calculate combined risk score
-            combined_risk = fema_service.combine_risk_score(
-                fema_data['risk_score'], gee_risk
-            )
-            
+        for provider, risk in zip(providers, provider_risks):
+            fema_data = risk['fema']
             marker = provider.to_dict()
             marker['flood_zone'] = fema_data['zone']
             marker['risk_level'] = fema_data['risk_level']
             marker['fema_risk_score'] = fema_data['risk_score']  # FEMA-only score
-            marker['risk_score'] = combined_risk  # Combined score (for backward compatibility)
+            marker['risk_score'] = risk['risk_score']  # Combined score (for backward compatibility)
+            marker['risk_pending'] = risk['pending']
             provider_markers.append(marker)
         
         return jsonify({
@@ -347,6 +663,11 @@ def upload_file():
     Form data:
         - file: CSV file
         - type: 'hospitals', 'providers', or 'orders'
+        - mode: 'replace' (default) or 'upsert' to merge rows by ID;
+          rows with a truthy 'deleted' column are removed
+        - async: 'true' to always ingest in the background (files of at
+          least INGEST_ASYNC_MIN_BYTES always are); responds 202 with a
+          job to poll at /api/upload/jobs/<job_id>
     """
     try:
         if 'file' not in request.files:
@@ -370,23 +691,49 @@ def upload_file():
                 'error': 'No file selected'
             }), 400
         
+        mode = request.form.get('mode', 'replace')
+        if mode not in ('replace', 'upsert'):
+            return jsonify({
+                'success': False,
+                'error': 'Invalid mode. Must be replace or upsert'
+            }), 400
+        
         if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
+            # Saved under a unique name so queued uploads never overwrite
+            # each other; werkzeug streams the upload to disk in blocks
+            filename = f"{uuid.uuid4().hex}_{secure_filename(file.filename)}"
             filepath = os.path.join(Config.UPLOAD_FOLDER, filename)
             file.save(filepath)
             
-            # Update data from CSV
-            success = data_service.update_from_csv(csv_type, filepath)
+            # Large files are parsed in the background; poll the job URL
+            run_async = request.form.get('async', '').lower() in ('1', 'true') or \
+                os.path.getsize(filepath) >= Config.INGEST_ASYNC_MIN_BYTES
+            job = ingest_manager.submit(csv_type, filepath, run_async, mode)
+            
+            # Small files still go async when other uploads are queued
+            if not job.finished:
+                return jsonify({
+                    'success': True,
+                    'message': f'{csv_type} upload queued for processing',
+                    'job': job.to_dict(),
+                    'status_url': f'/api/upload/jobs/{job.job_id}'
+                }), 202
             
-            if success:
+            if job.status == DONE:
                 return jsonify({
                     'success': True,
-                    'message': f'{csv_type} data updated successfully'
+                    'message': f'{csv_type} data updated successfully',
+                    # Rows that could not be converted were skipped
+                    'skipped_rows': job.error_count,
+                    'row_errors': job.row_errors[:100],
+                    # Rows that were kept but not fully understood
+                    'warnings': job.warnings[:100],
+                    'changes': job.to_dict()['changes']
                 })
             else:
                 return jsonify({
                     'success': False,
-                    'error': 'Failed to parse CSV file'
+                    'error': job.error or 'Failed to parse CSV file'
                 }), 400
         else:
             return jsonify({
@@ -398,9 +745,24 @@ def upload_file():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@app.route('/api/upload/jobs/<job_id>', methods=['GET'])
+def get_upload_job(job_id):
+    """Progress of a CSV upload being ingested"""
+    job = ingest_manager.get(job_id)
+    if not job:
+        return jsonify({
+            'success': False,
+            'error': 'Upload job not found'
+        }), 404
+    return jsonify({'success': True, 'job': job.to_dict()})
+
+
 if __name__ == '__main__':
     Config.init_app(app)
     print("Starting MedResilient Backend API...")
     print(f"GEE Initialized: {gee_service.initialized}")
+    # With the debug reloader only the child process serves requests
+    if not Config.DEBUG or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_risk_scheduler()
     app.run(debug=Config.DEBUG, host='0.0.0.0', port=5000)
 
@@ -0,0 +1,103 @@
+"""Set-cover solver for sourcing a basket of devices from few, good providers"""
+import numpy as np
+from typing import List, Optional
+
+
+def solve_basket(costs: np.ndarray, coverage: np.ndarray,
+                 shipment_cost: float = 0.0,
+                 exact_max_devices: int = 8) -> Optional[List[int]]:
+    """
+    Choose providers covering every device at minimum total cost, where
+    each chosen provider costs its score plus a per-shipment penalty
+
+    costs: (P,) score per provider (lower is better)
+    coverage: (P, D) boolean, provider p supplies device d
+    Returns the chosen provider indices, or None if some device has no
+    supplier. Baskets of up to exact_max_devices devices are solved
+    exactly by dynamic programming over device subsets, larger ones
+    greedily.
+    """
+    costs = np.asarray(costs, dtype=float) + shipment_cost
+    coverage = np.asarray(coverage, dtype=bool)
+    n_devices = coverage.shape[1]
+    if n_devices == 0:
+        return []
+    if not coverage.any(axis=0).all():
+        return None
+
+    if n_devices <= exact_max_devices:
+        return _solve_exact(costs, coverage)
+    return _solve_greedy(costs, coverage)
+
+
+def _solve_exact(costs: np.ndarray, coverage: np.ndarray) -> List[int]:
+    """Minimum-cost cover via DP over device bitmasks"""
+    n_devices = coverage.shape[1]
+    masks = coverage.astype(np.int64) @ (1 << np.arange(n_devices, dtype=np.int64))
+
+    # Only the cheapest provider per distinct coverage mask can be optimal
+    order = np.lexsort((costs, masks))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = masks[order][1:] != masks[order][:-1]
+    candidates = order[first & (masks[order] > 0)]
+
+    full = (1 << n_devices) - 1
+    best = np.full(full + 1, np.inf)
+    best[0] = 0.0
+    choice = np.full(full + 1, -1, dtype=np.intp)
+    previous = np.zeros(full + 1, dtype=np.intp)
+    candidate_masks = masks[candidates]
+    candidate_costs = costs[candidates]
+    # States only ever grow, so visiting them in increasing order is enough
+    for state in range(full + 1):
+        if not np.isfinite(best[state]):
+            continue
+        nxt = state | candidate_masks
+        total = best[state] + candidate_costs
+        better = (nxt != state) & (total < best[nxt])
+        if not better.any():
+            continue
+        # Several candidates may reach the same state; write the cheapest last
+        order = np.argsort(-total[better], kind='stable')
+        targets = nxt[better][order]
+        best[targets] = total[better][order]
+        choice[targets] = candidates[better][order]
+        previous[targets] = state
+
+    chosen = []
+    state = full
+    while state:
+        chosen.append(int(choice[state]))
+        state = previous[state]
+    return sorted(chosen, key=lambda p: costs[p])
+
+
+def _solve_greedy(costs: np.ndarray, coverage: np.ndarray) -> List[int]:
+    """Greedy cost-per-newly-covered-device cover, then drop redundant picks"""
+    uncovered = np.ones(coverage.shape[1], dtype=bool)
+    chosen = []
+    while uncovered.any():
+        gain = coverage[:, uncovered].sum(axis=1)
+        with np.errstate(divide='ignore'):
+            ratio = np.where(gain > 0, costs / gain, np.inf)
+        p = int(np.argmin(ratio))
+        chosen.append(p)
+        uncovered &= ~coverage[p]
+
+    # Remove the most expensive picks whose devices are covered by others
+    for p in sorted(chosen, key=lambda p: -costs[p]):
+        others = [q for q in chosen if q != p]
+        if others and coverage[others].any(axis=0).all():
+            chosen = others
+    return sorted(chosen, key=lambda p: costs[p])
+
+
+def assign_devices(chosen: List[int], costs: np.ndarray,
+                   coverage: np.ndarray) -> List[int]:
+    """Cheapest chosen provider for each device"""
+    costs = np.asarray(costs, dtype=float)
+    assignment = []
+    for d in range(coverage.shape[1]):
+        suppliers = [p for p in chosen if coverage[p, d]]
+        assignment.append(min(suppliers, key=lambda p: costs[p]))
+    return assignment
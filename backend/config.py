@@ -16,10 +16,22 @@ class Config:
     GEE_PROJECT_ID = os.getenv('GEE_PROJECT_ID')
     GOOGLE_MAPS_API_KEY = os.getenv('GOOGLE_MAPS_API_KEY')
     
+    # Earth Engine initializes in the background; interactive authentication
+    # is only attempted when explicitly enabled (never in server mode)
+    GEE_INIT_TIMEOUT_SECONDS = float(os.getenv('GEE_INIT_TIMEOUT_SECONDS', 30))
+    GEE_INIT_RETRY_SECONDS = float(os.getenv('GEE_INIT_RETRY_SECONDS', 300))
+    GEE_REQUEST_TIMEOUT_SECONDS = float(os.getenv('GEE_REQUEST_TIMEOUT_SECONDS', 60))
+    GEE_INTERACTIVE_AUTH = os.getenv('GEE_INTERACTIVE_AUTH', 'False') == 'True'
+    
     # Upload settings
     UPLOAD_FOLDER = 'uploads'
-    MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
+    MAX_CONTENT_LENGTH = int(os.getenv('MAX_UPLOAD_MB', 16)) * 1024 * 1024  # max file size
     ALLOWED_EXTENSIONS = {'csv'}
+    # Uploads are parsed this many rows at a time; files of at least
+    # INGEST_ASYNC_MIN_BYTES are ingested in the background as a job
+    INGEST_CHUNK_ROWS = int(os.getenv('INGEST_CHUNK_ROWS', 50000))
+    INGEST_ASYNC_MIN_BYTES = int(os.getenv('INGEST_ASYNC_MIN_BYTES', 5 * 1024 * 1024))
+    INGEST_MAX_JOBS = int(os.getenv('INGEST_MAX_JOBS', 100))  # finished jobs kept for status
     
     # Data paths
     DATA_FOLDER = 'data'
@@ -27,10 +39,97 @@ class Config:
     PROVIDERS_CSV = os.path.join(DATA_FOLDER, 'providers.csv')
     ORDERS_CSV = os.path.join(DATA_FOLDER, 'orders.csv')
     
+    # Local FEMA NFHL flood hazard polygons (GeoJSON or .shp); the remote
+    # flood data API is only queried for points they do not cover
+    FEMA_FLOOD_ZONES_PATH = os.getenv('FEMA_FLOOD_ZONES_PATH', os.path.join(DATA_FOLDER, 'nfhl_flood_zones.geojson'))
+    FEMA_REMOTE_FALLBACK = os.getenv('FEMA_REMOTE_FALLBACK', 'True') == 'True'
+    
+    # National Flood Data API client
+    FLOOD_DATA_API_URL = 'https://api.nationalflooddata.com/v3/data'
+    FLOOD_DATA_API_KEY = os.getenv('FLOOD_DATA_API_KEY', 'd4NyIxwf632nCvJcHUqU62KSTnwghIfO8xWIsWdC')
+    FEMA_CONNECT_TIMEOUT = float(os.getenv('FEMA_CONNECT_TIMEOUT', 3.05))
+    FEMA_READ_TIMEOUT = float(os.getenv('FEMA_READ_TIMEOUT', 10))
+    FEMA_MAX_RETRIES = int(os.getenv('FEMA_MAX_RETRIES', 2))
+    FEMA_BACKOFF_SECONDS = float(os.getenv('FEMA_BACKOFF_SECONDS', 0.5))
+    FEMA_MAX_WORKERS = int(os.getenv('FEMA_MAX_WORKERS', 8))
+    
+    # Flood zone cache tiled by geohash (precision 8 is about 38 m x 19 m)
+    FEMA_CACHE_GEOHASH_PRECISION = int(os.getenv('FEMA_CACHE_GEOHASH_PRECISION', 8))
+    FEMA_CACHE_TTL_SECONDS = int(os.getenv('FEMA_CACHE_TTL_SECONDS', 7 * 24 * 3600))
+    FEMA_CACHE_NEGATIVE_TTL_SECONDS = int(os.getenv('FEMA_CACHE_NEGATIVE_TTL_SECONDS', 60))
+    FEMA_CACHE_MAX_ENTRIES = int(os.getenv('FEMA_CACHE_MAX_ENTRIES', 50000))
+    
+    # Local SRTM elevation tiles (e.g. N25W081.hgt); Earth Engine is only
+    # queried for points outside them
+    SRTM_TILE_FOLDER = os.getenv('SRTM_TILE_FOLDER', os.path.join(DATA_FOLDER, 'srtm'))
+    
+    # Daily precipitation cache; windows end PRECIP_LAG_DAYS ago and days
+    # older than PRECIP_FINALIZE_DAYS with no image are stored as dry
+    PRECIP_LAG_DAYS = int(os.getenv('PRECIP_LAG_DAYS', 2))
+    PRECIP_FINALIZE_DAYS = int(os.getenv('PRECIP_FINALIZE_DAYS', 7))
+    PRECIP_CACHE_PRECISION = 2  # decimal places, about 1 km
+    PRECIP_CACHE_MAX_LOCATIONS = int(os.getenv('PRECIP_CACHE_MAX_LOCATIONS', 10000))
+    # Recent days not published yet are asked for again after this long
+    PRECIP_NEGATIVE_TTL_SECONDS = int(os.getenv('PRECIP_NEGATIVE_TTL_SECONDS', 3600))
+    
+    # Routing backend: 'google' (Maps APIs, local road graph as fallback)
+    # or 'local' (offline road graph only, deterministic)
+    ROUTING_BACKEND = os.getenv('ROUTING_BACKEND', 'google')
+    ROAD_NETWORK_PATH = os.getenv('ROAD_NETWORK_PATH', os.path.join(DATA_FOLDER, 'road_network.json'))
+    ROAD_NETWORK_DEFAULT_SPEED_KMH = 60.0  # for edges without a duration and off-network legs
+    
+    # Google Distance Matrix API allows at most 25 origins per request
+    DISTANCE_MATRIX_MAX_ORIGINS = 25
+    
+    # Persistent caches
+    CACHE_FOLDER = os.getenv('CACHE_FOLDER', 'cache')
+    ROUTE_MATRIX_PATH = os.path.join(CACHE_FOLDER, 'route_matrix.npz')
+    # Routes found by lookups are saved this long after the first change
+    ROUTE_MATRIX_SAVE_DELAY_SECONDS = float(os.getenv('ROUTE_MATRIX_SAVE_DELAY_SECONDS', 30))
+    
+    # Route cache (SQLite) keyed by rounded coordinates and travel mode
+    ROUTE_CACHE_ENABLED = os.getenv('ROUTE_CACHE_ENABLED', 'True') == 'True'
+    ROUTE_CACHE_PATH = os.getenv('ROUTE_CACHE_PATH', os.path.join(CACHE_FOLDER, 'routes.sqlite3'))
+    ROUTE_CACHE_TTL_SECONDS = int(os.getenv('ROUTE_CACHE_TTL_SECONDS', 30 * 24 * 3600))
+    ROUTE_CACHE_MAX_ENTRIES = int(os.getenv('ROUTE_CACHE_MAX_ENTRIES', 100000))
+    ROUTE_CACHE_PRECISION = 4  # decimal places, about 11 m
+    
     # Model parameters
     DEFAULT_ALPHA = 0.6  # Flood risk weight
     DEFAULT_BETA = 0.4   # Carbon emission weight
     
+    # Route and risk lookups of a recommendation request run concurrently;
+    # anything not back by the deadline is scored with fallback values
+    RECOMMENDATION_FANOUT_ENABLED = os.getenv('RECOMMENDATION_FANOUT_ENABLED', 'True') == 'True'
+    RECOMMENDATION_FANOUT_WORKERS = int(os.getenv('RECOMMENDATION_FANOUT_WORKERS', 8))
+    RECOMMENDATION_DEADLINE_SECONDS = float(os.getenv('RECOMMENDATION_DEADLINE_SECONDS', 10))
+    # Providers looked up per wave; later waves only cover providers whose
+    # score lower bound can still beat the current k-th best
+    RECOMMENDATION_WAVE_SIZE = int(os.getenv('RECOMMENDATION_WAVE_SIZE', 25))
+    
+    # Basket sourcing: score added per extra shipment, and the largest
+    # basket solved exactly (bigger ones are solved greedily)
+    BASKET_SHIPMENT_PENALTY = float(os.getenv('BASKET_SHIPMENT_PENALTY', 0.1))
+    BASKET_EXACT_MAX_DEVICES = int(os.getenv('BASKET_EXACT_MAX_DEVICES', 8))
+    
+    # Cached per hospital risk/carbon frontiers used to re-rank for new α/β
+    FRONTIER_CACHE_TTL_SECONDS = int(os.getenv('FRONTIER_CACHE_TTL_SECONDS', 900))
+    FRONTIER_CACHE_MAX_ENTRIES = int(os.getenv('FRONTIER_CACHE_MAX_ENTRIES', 1024))
+    
+    # How long a provider's combined flood risk is reused by the scoring engine
+    RISK_CACHE_TTL_SECONDS = int(os.getenv('RISK_CACHE_TTL_SECONDS', 3600))
+    
+    # Background risk precomputation for all known hospitals and providers
+    RISK_SCHEDULER_ENABLED = os.getenv('RISK_SCHEDULER_ENABLED', 'True') == 'True'
+    # Start the scheduler when the app module is imported. Every process
+    # that imports the app runs its own scheduler, so only set this for a
+    # single-process server; python app.py starts it regardless
+    RISK_SCHEDULER_AUTOSTART = os.getenv('RISK_SCHEDULER_AUTOSTART', 'False') == 'True'
+    RISK_REFRESH_INTERVAL_SECONDS = int(os.getenv('RISK_REFRESH_INTERVAL_SECONDS', 3600))
+    RISK_SCHEDULER_WORKERS = int(os.getenv('RISK_SCHEDULER_WORKERS', 4))
+    RISK_SCHEDULER_BATCH_SIZE = int(os.getenv('RISK_SCHEDULER_BATCH_SIZE', 50))
+    RISK_SCHEDULER_RATE_LIMIT = float(os.getenv('RISK_SCHEDULER_RATE_LIMIT', 20))  # locations/s
+    
     # Emission factors (kg CO2 per km)
     EMISSION_FACTORS = {
         'truck': 0.21,      # Heavy-duty truck
@@ -45,4 +144,5 @@ class Config:
         """Initialize application with config"""
         os.makedirs(Config.UPLOAD_FOLDER, exist_ok=True)
         os.makedirs(Config.DATA_FOLDER, exist_ok=True)
+        os.makedirs(Config.CACHE_FOLDER, exist_ok=True)
 
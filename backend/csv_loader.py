@@ -0,0 +1,239 @@
+"""Columnar CSV loading for hospitals, providers and orders"""
+import json
+import pandas as pd
+from typing import Callable, Iterator, List, Tuple
+from models import Hospital, Provider
+from order_store import OrderStore, parse_dates
+
+
+# Expected columns in dataclass field order
+HOSPITAL_COLUMNS = ['hospital_id', 'name', 'address', 'city', 'state', 'zip',
+                    'latitude', 'longitude']
+PROVIDER_COLUMNS = ['provider_id', 'name', 'type', 'address', 'city', 'state', 'zip',
+                    'latitude', 'longitude', 'transport_mode', 'devices_supplied']
+ORDER_COLUMNS = ['order_id', 'hospital_id', 'provider_id', 'device_name', 'quantity',
+                 'order_date', 'delivery_date']
+# Numeric columns; everything else is read as text
+FLOAT_COLUMNS = {'latitude', 'longitude'}
+INT_COLUMNS = {'quantity'}
+# Date columns may be empty, but a value that is not a date is an error
+DATE_COLUMNS = {'order_date', 'delivery_date'}
+OPTIONAL_COLUMNS = {'devices_supplied'}
+
+# Upsert files mark rows to delete with a truthy value in this column;
+# only the ID of such a row is read
+DELETED_COLUMN = 'deleted'
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 't'}
+
+
+def read_csv(source, columns: List[str], **kwargs) -> pd.DataFrame:
+    """
+    Read a CSV with explicit dtypes: numeric columns are parsed in bulk
+    after reading, every other column is kept as text
+    With a chunksize this returns an iterator of frames
+    """
+    numeric = FLOAT_COLUMNS | INT_COLUMNS
+    dtype = {c: str for c in columns if c not in numeric}
+    dtype[DELETED_COLUMN] = str
+    df = pd.read_csv(source, dtype=dtype,
+                     skipinitialspace=True, **kwargs)
+    if isinstance(df, pd.DataFrame):
+        df.columns = [str(c).strip() for c in df.columns]
+    return df
+
+
+def to_columns(df: pd.DataFrame, columns: List[str], key: str) -> Tuple[dict, List[str]]:
+    """
+    Convert a frame to whole columns, dropping rows that cannot be
+    converted. Returns ({column: Series of kept rows}, per-row error
+    messages); row numbers in messages are 1-based data rows.
+    """
+    missing = [c for c in columns if c not in df.columns and c not in OPTIONAL_COLUMNS]
+    if missing:
+        raise ValueError(f"Missing required columns: {', '.join(missing)}")
+
+    bad = pd.Series(False, index=df.index)
+    errors = []
+    values = {}
+    for column in columns:
+        if column not in df.columns:
+            values[column] = pd.Series(None, index=df.index, dtype=object)
+            continue
+        series = df[column]
+        if column in FLOAT_COLUMNS or column in INT_COLUMNS:
+            parsed = pd.to_numeric(series, errors='coerce')
+            invalid = parsed.isna()
+            if column in INT_COLUMNS:
+                invalid |= parsed.notna() & (parsed % 1 != 0)
+            _report(errors, df, invalid & ~bad, key, f"invalid {column}")
+            bad |= invalid
+            values[column] = parsed
+        elif column in DATE_COLUMNS:
+            parsed = pd.Series(parse_dates(series), index=df.index)
+            text = series.str.strip()
+            invalid = parsed.isna() & text.notna() & (text != '')
+            _report(errors, df, invalid & ~bad, key, f"invalid {column}")
+            bad |= invalid
+            values[column] = parsed
+        else:
+            values[column] = series.str.strip().where(series.notna(), None)
+
+    empty_key = values[key].isna() | (values[key] == '')
+    _report(errors, df, empty_key & ~bad, key, f"missing {key}")
+    bad |= empty_key
+
+    keep = ~bad.to_numpy()
+    columns = {}
+    for column, series in values.items():
+        series = series[keep]
+        if column in INT_COLUMNS:
+            series = series.astype('int64')
+        columns[column] = series
+    return columns, errors
+
+
+def _report(errors: List[str], df: pd.DataFrame, mask: pd.Series, key: str, message: str):
+    # The index counts rows from the start of the file, also within chunks
+    for position in mask.to_numpy().nonzero()[0]:
+        label = df[key].iloc[position] if key in df.columns else None
+        row = f"row {df.index[position] + 1}" + \
+            (f" ({label})" if isinstance(label, str) else "")
+        errors.append(f"{row}: {message}")
+
+
+def parse_device_lists(values: List, labels: List = None) -> Tuple[List[list], List[str]]:
+    """
+    Parse a column of JSON device lists in one json.loads call over the
+    whole column, falling back to row by row parsing only to locate bad
+    rows. Missing or invalid entries become empty lists.
+    """
+    texts = [v.strip() if isinstance(v, str) and v.strip() else 'null' for v in values]
+    try:
+        parsed = json.loads('[' + ','.join(texts) + ']')
+        if len(parsed) != len(texts):
+            raise ValueError("row count mismatch")
+    except ValueError:
+        parsed = []
+        for text in texts:
+            try:
+                parsed.append(json.loads(text))
+            except ValueError:
+                parsed.append(ValueError)
+
+    devices, errors = [], []
+    for i, value in enumerate(parsed):
+        if value is None:
+            devices.append([])
+        elif isinstance(value, list):
+            devices.append([str(d) for d in value])
+        else:
+            label = labels[i] if labels else i + 1
+            errors.append(f"Could not parse devices for provider {label}")
+            devices.append([])
+    return devices, errors
+
+
+def drop_tombstones(df: pd.DataFrame, key: str, deleted: List[str]) -> pd.DataFrame:
+    """Remove rows marked deleted from a frame, collecting their IDs"""
+    if DELETED_COLUMN not in df.columns:
+        return df
+    flags = df[DELETED_COLUMN].astype(str).str.strip().str.lower().isin(TRUE_VALUES)
+    if key in df.columns:
+        ids = df.loc[flags, key].dropna().str.strip()
+        deleted.extend(ids[ids != ''].tolist())
+    return df[~flags]
+
+
+def iter_chunks(source, columns: List[str], key: str, chunk_rows: int = None,
+                deleted: List[str] = None) -> Iterator[Tuple[dict, List[str], int]]:
+    """
+    Parse a CSV chunk_rows rows at a time (all at once without a chunk
+    size), yielding (kept columns as Series, row errors, rows read) so
+    memory stays proportional to the chunk rather than the file
+    If a deleted list is given, tombstone rows are left out and their
+    IDs appended to it
+    """
+    frames = [read_csv(source, columns)] if not chunk_rows else \
+        read_csv(source, columns, chunksize=chunk_rows)
+    for df in frames:
+        df.columns = [str(c).strip() for c in df.columns]
+        rows = len(df)
+        if deleted is not None:
+            df = drop_tombstones(df, key, deleted)
+        yield (*to_columns(df, columns, key), rows)
+
+
+def _load(source, columns: List[str], key: str, add: Callable[[dict], List[str]],
+          chunk_rows: int = None, progress: Callable[[int], None] = None,
+          deleted: List[str] = None, warnings: List[str] = None) -> List[str]:
+    """
+    Feed each parsed chunk to add(); returns the errors of skipped rows
+    Problems add() reports for rows it kept are appended to warnings
+    """
+    errors, rows = [], 0
+    for chunk, chunk_errors, chunk_size in iter_chunks(source, columns, key,
+                                                       chunk_rows, deleted):
+        errors += chunk_errors
+        chunk_warnings = add(chunk) or []
+        if warnings is not None:
+            warnings.extend(chunk_warnings)
+        rows += chunk_size
+        if progress:
+            progress(rows)
+    return errors
+
+
+def load_hospitals(source, chunk_rows: int = None,
+                   progress: Callable[[int], None] = None,
+                   deleted: List[str] = None,
+                   warnings: List[str] = None) -> Tuple[List[Hospital], List[str]]:
+    """Hospitals from a CSV plus per-row errors for skipped rows"""
+    hospitals = []
+
+    def add(chunk):
+        hospitals.extend(Hospital(*row) for row in zip(
+            *(chunk[c].tolist() for c in HOSPITAL_COLUMNS)))
+
+    errors = _load(source, HOSPITAL_COLUMNS, 'hospital_id', add,
+                   chunk_rows, progress, deleted, warnings)
+    return hospitals, errors
+
+
+def load_providers(source, chunk_rows: int = None,
+                   progress: Callable[[int], None] = None,
+                   deleted: List[str] = None,
+                   warnings: List[str] = None) -> Tuple[List[Provider], List[str]]:
+    """
+    Providers from a CSV plus per-row errors for skipped rows
+    Rows with a bad device list are kept with no devices and reported in
+    warnings
+    """
+    providers = []
+
+    def add(chunk):
+        records = {c: chunk[c].tolist() for c in PROVIDER_COLUMNS}
+        records['devices_supplied'], device_errors = parse_device_lists(
+            records['devices_supplied'], records['provider_id']
+        )
+        providers.extend(Provider(*row) for row in zip(
+            *(records[c] for c in PROVIDER_COLUMNS)))
+        return device_errors
+
+    errors = _load(source, PROVIDER_COLUMNS, 'provider_id', add,
+                   chunk_rows, progress, deleted, warnings)
+    return providers, errors
+
+
+def load_order_store(source, chunk_rows: int = None,
+                     progress: Callable[[int], None] = None,
+                     deleted: List[str] = None,
+                     warnings: List[str] = None) -> Tuple[OrderStore, List[str]]:
+    """Orders from a CSV straight into a columnar store, plus per-row errors"""
+    store = OrderStore()
+
+    def add(chunk):
+        store.extend(chunk)
+
+    errors = _load(source, ORDER_COLUMNS, 'order_id', add,
+                   chunk_rows, progress, deleted, warnings)
+    return store, errors
@@ -1,9 +1,11 @@
 """Service for loading and managing data"""
-import pandas as pd
-import json
-from typing import List, Optional
+import csv_loader
+from typing import Dict, List, Optional
 from models import Hospital, Provider, Order
 from config import Config
+from device_index import DeviceIndex
+from order_store import OrderStore, as_store
+from product_substitutes import normalize_product_name
 
 
 class DataService:
@@ -12,71 +14,34 @@ class DataService:
     def __init__(self):
         self.hospitals: List[Hospital] = []
         self.providers: List[Provider] = []
-        self.orders: List[Order] = []
+        # Orders live in a columnar store that hands out Order objects on access
+        self.orders = OrderStore()
+        self.device_index = DeviceIndex([])
+        # Primary key indices (first row wins for duplicate IDs)
+        self.hospitals_by_id: Dict[str, Hospital] = {}
+        self.providers_by_id: Dict[str, Provider] = {}
+        # Row errors from the last load or upload (those rows were skipped)
+        self.load_errors: List[str] = []
+        # Problems with rows that were kept, e.g. unreadable device lists
+        self.load_warnings: List[str] = []
+        # IDs added/updated/deleted by the last upload
+        self.last_changes: Optional[dict] = None
+        # Why the last upload failed, if it did
+        self.last_error: Optional[str] = None
         self.load_data()
     
     def load_data(self):
         """Load data from CSV files"""
         try:
-            # Load hospitals
-            df_hospitals = pd.read_csv(Config.HOSPITALS_CSV)
-            self.hospitals = [
-                Hospital(
-                    hospital_id=row['hospital_id'],
-                    name=row['name'],
-                    address=row['address'],
-                    city=row['city'],
-                    state=row['state'],
-                    zip=row['zip'],
-                    latitude=float(row['latitude']),
-                    longitude=float(row['longitude'])
-                )
-                for _, row in df_hospitals.iterrows()
-            ]
-            
-            # Load providers
-            df_providers = pd.read_csv(Config.PROVIDERS_CSV)
-            self.providers = []
-            for _, row in df_providers.iterrows():
-                # Parse devices_supplied JSON field
-                devices_supplied = []
-                if 'devices_supplied' in row and pd.notna(row['devices_supplied']):
-                    try:
-                        devices_str = str(row['devices_supplied']).strip()
-                        devices_supplied = json.loads(devices_str)
-                    except json.JSONDecodeError:
-                        print(f"Warning: Could not parse devices for provider {row['provider_id']}")
-                        devices_supplied = []
-                
-                provider = Provider(
-                    provider_id=row['provider_id'],
-                    name=row['name'],
-                    type=row['type'],
-                    address=row['address'],
-                    city=row['city'],
-                    state=row['state'],
-                    zip=row['zip'],
-                    latitude=float(row['latitude']),
-                    longitude=float(row['longitude']),
-                    transport_mode=row['transport_mode'],
-                    devices_supplied=devices_supplied
-                )
-                self.providers.append(provider)
-            
-            # Load orders
-            df_orders = pd.read_csv(Config.ORDERS_CSV)
-            self.orders = [
-                Order(
-                    order_id=row['order_id'],
-                    hospital_id=row['hospital_id'],
-                    provider_id=row['provider_id'],
-                    device_name=row['device_name'],
-                    quantity=int(row['quantity']),
-                    order_date=row['order_date'],
-                    delivery_date=row['delivery_date']
-                )
-                for _, row in df_orders.iterrows()
-            ]
+            warnings = []
+            hospitals, hospital_errors = csv_loader.load_hospitals(Config.HOSPITALS_CSV)
+            providers, provider_errors = csv_loader.load_providers(Config.PROVIDERS_CSV,
+                                                                   warnings=warnings)
+            orders, order_errors = csv_loader.load_order_store(Config.ORDERS_CSV)
+            self._set_hospitals(hospitals)
+            self._set_providers(providers)
+            self._set_orders(orders)
+            self._report_errors(hospital_errors + provider_errors + order_errors, warnings)
             
             print(f"Loaded {len(self.hospitals)} hospitals, {len(self.providers)} providers, {len(self.orders)} orders")
             
@@ -90,10 +55,7 @@ class DataService:
     
     def get_hospital_by_id(self, hospital_id: str) -> Optional[Hospital]:
         """Get hospital by ID"""
-        for hospital in self.hospitals:
-            if hospital.hospital_id == hospital_id:
-                return hospital
-        return None
+        return self.hospitals_by_id.get(hospital_id)
     
     def get_all_providers(self) -> List[Provider]:
         """Get all providers"""
@@ -101,97 +63,174 @@ class DataService:
     
     def get_provider_by_id(self, provider_id: str) -> Optional[Provider]:
         """Get provider by ID"""
-        for provider in self.providers:
-            if provider.provider_id == provider_id:
-                return provider
-        return None
+        return self.providers_by_id.get(provider_id)
     
-    def get_all_orders(self) -> List[Order]:
-        """Get all orders"""
+    def get_all_orders(self) -> OrderStore:
+        """Get all orders (a read-only sequence of Order objects)"""
         return self.orders
     
     def get_orders_by_hospital(self, hospital_id: str) -> List[Order]:
         """Get orders for a specific hospital"""
-        return [order for order in self.orders if order.hospital_id == hospital_id]
+        orders = self.orders
+        return orders.take(orders.positions('hospital_id', [hospital_id]))
+    
+    def get_orders_by_provider(self, provider_id: str) -> List[Order]:
+        """Get orders placed with a specific provider"""
+        orders = self.orders
+        return orders.take(orders.positions('provider_id', [provider_id]))
     
     def get_orders_by_device(self, device_name: str) -> List[Order]:
-        """Get orders for a specific device"""
-        return [order for order in self.orders if device_name.lower() in order.device_name.lower()]
+        """
+        Get orders for a specific device
+        Matches any device name containing the search term (ignoring case
+        and spacing); only the distinct device names are scanned
+        """
+        orders = self.orders
+        term = normalize_product_name(device_name)
+        devices = orders.matching_values(
+            'device_name', lambda device: term in normalize_product_name(device)
+        )
+        return orders.take(orders.positions('device_name', devices))
     
     def add_hospital(self, hospital: Hospital):
         """Add a new hospital"""
         self.hospitals.append(hospital)
+        self.hospitals_by_id.setdefault(hospital.hospital_id, hospital)
     
     def add_provider(self, provider: Provider):
         """Add a new provider"""
         self.providers.append(provider)
+        self.providers_by_id.setdefault(provider.provider_id, provider)
+        self.device_index.add(provider)
     
     def add_order(self, order: Order):
         """Add a new order"""
         self.orders.append(order)
     
-    def update_from_csv(self, csv_type: str, file_path: str):
-        """Update data from uploaded CSV file"""
+    @staticmethod
+    def _index_by_id(items: List, key: str) -> dict:
+        """Map of ID to item, keeping the first item for duplicate IDs"""
+        index = {}
+        for item in items:
+            index.setdefault(getattr(item, key), item)
+        return index
+    
+    def _set_hospitals(self, hospitals: List[Hospital]):
+        """Replace the hospital list together with its index"""
+        self.hospitals, self.hospitals_by_id = (
+            hospitals, self._index_by_id(hospitals, 'hospital_id')
+        )
+    
+    def _set_providers(self, providers: List[Provider]):
+        """Replace the provider list together with its indices"""
+        self.providers, self.providers_by_id, self.device_index = (
+            providers, self._index_by_id(providers, 'provider_id'), DeviceIndex(providers)
+        )
+    
+    def _set_orders(self, orders):
+        """Replace the orders (a store or a list of Order objects)"""
+        self.orders = as_store(orders)
+    
+    def update_from_csv(self, csv_type: str, file_path, chunk_rows: int = None,
+                        progress=None, mode: str = 'replace'):
+        """
+        Update data from uploaded CSV file (a path or binary file object)
+        The file is parsed chunk_rows rows at a time and the new data only
+        replaces the current data once the whole file is read; progress,
+        if given, is called with the number of rows read after each chunk.
+        In 'upsert' mode rows are merged into the current data by ID and
+        rows with a truthy 'deleted' column are removed. The IDs added,
+        updated and deleted are kept in last_changes (None after a full
+        replacement of the orders). On failure the reason is kept in
+        last_error.
+        """
+        self.load_errors = []
+        self.load_warnings = []
+        self.last_changes = None
+        self.last_error = None
         try:
-            if csv_type == 'hospitals':
-                df = pd.read_csv(file_path)
-                self.hospitals = [
-                    Hospital(
-                        hospital_id=row['hospital_id'],
-                        name=row['name'],
-                        address=row['address'],
-                        city=row['city'],
-                        state=row['state'],
-                        zip=row['zip'],
-                        latitude=float(row['latitude']),
-                        longitude=float(row['longitude'])
-                    )
-                    for _, row in df.iterrows()
-                ]
-            elif csv_type == 'providers':
-                df = pd.read_csv(file_path)
-                self.providers = []
-                for _, row in df.iterrows():
-                    # Parse devices_supplied JSON field
-                    devices_supplied = []
-                    if 'devices_supplied' in row and pd.notna(row['devices_supplied']):
-                        try:
-                            devices_str = str(row['devices_supplied']).strip()
-                            devices_supplied = json.loads(devices_str)
-                        except json.JSONDecodeError:
-                            print(f"Warning: Could not parse devices for provider {row['provider_id']}")
-                            devices_supplied = []
-                    
-                    provider = Provider(
-                        provider_id=row['provider_id'],
-                        name=row['name'],
-                        type=row['type'],
-                        address=row['address'],
-                        city=row['city'],
-                        state=row['state'],
-                        zip=row['zip'],
-                        latitude=float(row['latitude']),
-                        longitude=float(row['longitude']),
-                        transport_mode=row['transport_mode'],
-                        devices_supplied=devices_supplied
-                    )
-                    self.providers.append(provider)
-            elif csv_type == 'orders':
-                df = pd.read_csv(file_path)
-                self.orders = [
-                    Order(
-                        order_id=row['order_id'],
-                        hospital_id=row['hospital_id'],
-                        provider_id=row['provider_id'],
-                        device_name=row['device_name'],
-                        quantity=int(row['quantity']),
-                        order_date=row['order_date'],
-                        delivery_date=row['delivery_date']
-                    )
-                    for _, row in df.iterrows()
-                ]
+            loaders = {
+                'hospitals': (csv_loader.load_hospitals, self._set_hospitals),
+                'providers': (csv_loader.load_providers, self._set_providers),
+                'orders': (csv_loader.load_order_store, self._set_orders)
+            }
+            if csv_type not in loaders:
+                return True
+            if mode not in ('replace', 'upsert'):
+                raise ValueError(f"Unknown upload mode: {mode}")
+            load, replace = loaders[csv_type]
+            deleted = [] if mode == 'upsert' else None
+            warnings = []
+            items, errors = load(file_path, chunk_rows, progress, deleted, warnings)
+            self._report_errors(errors, warnings)
+            # Do not wipe the current data with a file where nothing parsed
+            if errors and not items and not deleted:
+                raise ValueError(f"No valid rows in {csv_type} file")
+            
+            if csv_type == 'orders':
+                if mode == 'upsert':
+                    items, self.last_changes = self.orders.upsert(items, deleted)
+            else:
+                key = 'hospital_id' if csv_type == 'hospitals' else 'provider_id'
+                current = self.hospitals if csv_type == 'hospitals' else self.providers
+                if mode == 'upsert':
+                    items, self.last_changes = self._upsert(current, items, deleted, key)
+                else:
+                    self.last_changes = self._diff(current, items, key)
+            replace(items)
             return True
         except Exception as e:
             print(f"Error updating from CSV: {e}")
+            self.last_error = str(e)
             return False
-
+    
+    @classmethod
+    def _diff(cls, old: List, new: List, key: str) -> dict:
+        """IDs added, updated and deleted between two versions of a list"""
+        old_by_id, new_by_id = cls._index_by_id(old, key), cls._index_by_id(new, key)
+        return {
+            'added': [i for i in new_by_id if i not in old_by_id],
+            'updated': [i for i, item in new_by_id.items()
+                        if i in old_by_id and old_by_id[i] != item],
+            'deleted': [i for i in old_by_id if i not in new_by_id]
+        }
+    
+    @staticmethod
+    def _upsert(current: List, incoming: List, deleted: List[str], key: str) -> tuple:
+        """
+        Merge rows by ID, keeping current order and appending new IDs
+        The last incoming row for an ID wins and deletes win over rows.
+        Returns (merged list, changes)
+        """
+        incoming_by_id = {getattr(item, key): item for item in incoming}
+        deleted = set(deleted)
+        changes = {'added': [], 'updated': [], 'deleted': []}
+        merged = []
+        for item in current:
+            item_id = getattr(item, key)
+            new = incoming_by_id.pop(item_id, None)
+            if item_id in deleted:
+                changes['deleted'].append(item_id)
+                continue
+            if new is not None and new != item:
+                changes['updated'].append(item_id)
+                item = new
+            merged.append(item)
+        for item_id, item in incoming_by_id.items():
+            if item_id not in deleted:
+                changes['added'].append(item_id)
+                merged.append(item)
+        return merged, changes
+    
+    def _report_errors(self, errors: List[str], warnings: List[str] = ()):
+        """Keep and print the row errors and warnings of the last load"""
+        self.load_errors = errors
+        self.load_warnings = list(warnings)
+        for error in errors[:20]:
+            print(f"Warning: {error}")
+        if len(errors) > 20:
+            print(f"Warning: {len(errors) - 20} more rows had errors")
+        for warning in self.load_warnings[:20]:
+            print(f"Warning: {warning}")
+        if len(self.load_warnings) > 20:
+            print(f"Warning: {len(self.load_warnings) - 20} more rows had warnings")
@@ -0,0 +1,55 @@
+"""Inverted index from device name to the providers that supply it"""
+from typing import Dict, List, Tuple
+from models import Provider
+from product_substitutes import SUBSTITUTE_CLOSURE, normalize_product_name
+
+
+class DeviceIndex:
+    """
+    Maps normalized device names to the providers supplying them, so a
+    device filter (including transitive substitutes) touches only the
+    matching providers instead of every provider's device list
+    """
+
+    def __init__(self, providers: List[Provider], closure: dict = None):
+        self.providers = providers
+        self.provider_count = 0
+        self.closure = SUBSTITUTE_CLOSURE if closure is None else closure
+        self._positions: Dict[str, int] = {}
+        # normalized device -> {provider_id: device name as the provider lists it}
+        self._suppliers: Dict[str, Dict[str, str]] = {}
+        for position, provider in enumerate(providers):
+            self._index(provider, position)
+
+    def _index(self, provider: Provider, position: int):
+        self._positions[provider.provider_id] = position
+        self.provider_count = max(self.provider_count, position + 1)
+        for supplied in provider.devices_supplied or []:
+            self._suppliers.setdefault(normalize_product_name(supplied), {}) \
+                .setdefault(provider.provider_id, supplied)
+
+    def add(self, provider: Provider):
+        """Index a provider just appended to the catalog list"""
+        self._index(provider, len(self.providers) - 1)
+
+    def __len__(self):
+        return len(self._suppliers)
+
+    def acceptable_products(self, device: str) -> List[str]:
+        """Normalized device name followed by its substitutes"""
+        key = normalize_product_name(device)
+        return [key] + [sub for sub in self.closure.get(key, {}) if sub != key]
+
+    def lookup(self, device: str) -> Tuple[List[Provider], Dict[str, str]]:
+        """
+        Providers supplying the device or any of its substitutes, in
+        catalog order, plus a map of provider_id to the product each one
+        offers (the requested device itself when a provider has both)
+        """
+        provider_product_map: Dict[str, str] = {}
+        for product in self.acceptable_products(device):
+            for provider_id, supplied in self._suppliers.get(product, {}).items():
+                provider_product_map.setdefault(provider_id, supplied)
+
+        positions = sorted(self._positions[pid] for pid in provider_product_map)
+        return [self.providers[i] for i in positions], provider_product_map
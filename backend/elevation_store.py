@@ -0,0 +1,184 @@
+"""Local SRTM elevation tiles sampled without loading them whole"""
+import glob
+import os
+import re
+import threading
+import numpy as np
+from typing import Dict, Optional, Tuple
+
+
+# SRTM void marker
+VOID = -32768
+
+_TILE_NAME = re.compile(r'^([NS])(\d{2})([EW])(\d{3})$', re.IGNORECASE)
+
+
+def parse_tile_name(filename: str) -> Optional[Tuple[int, int]]:
+    """South-west corner (lat, lon) of an SRTM tile from e.g. 'N25W081.hgt'"""
+    match = _TILE_NAME.match(os.path.splitext(os.path.basename(filename))[0])
+    if not match:
+        return None
+    ns, lat, ew, lon = match.groups()
+    lat = int(lat) * (1 if ns.upper() == 'N' else -1)
+    lon = int(lon) * (1 if ew.upper() == 'E' else -1)
+    return lat, lon
+
+
+class _HgtTile:
+    """
+    SRTM HGT tile: a square grid of big-endian int16, north row first,
+    whose outer pixels lie on the tile edges. The file is memory-mapped,
+    so only the pages that are sampled are read from disk.
+    """
+
+    def __init__(self, path: str, corner: Tuple[int, int]):
+        size = int(round(np.sqrt(os.path.getsize(path) // 2)))
+        self._data = np.memmap(path, dtype='>i2', mode='r', shape=(size, size))
+        self.shape = self._data.shape
+        self.nodata = VOID
+        self._corner = corner
+
+    def pixel(self, lats: np.ndarray, lons: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Fractional (row, col) of coordinates; row 0 is the north edge"""
+        return ((self._corner[0] + 1 - lats) * (self.shape[0] - 1),
+                (lons - self._corner[1]) * (self.shape[1] - 1))
+
+    def read(self, rows: slice, cols: slice) -> np.ndarray:
+        return self._data[rows, cols]
+
+
+class _GeoTiffTile:
+    """
+    GeoTIFF tile read through rasterio. Pixel positions come from the
+    file's geotransform and only the window around the sampled pixels is
+    read, never the whole band.
+    """
+
+    def __init__(self, path: str):
+        import rasterio
+        # Datasets are not thread-safe, so reads are serialized per tile
+        self._src = rasterio.open(path)
+        self._lock = threading.Lock()
+        self.shape = (self._src.height, self._src.width)
+        self.nodata = self._src.nodata
+        t = self._src.transform
+        self._transform = (t.a, t.b, t.c, t.d, t.e, t.f)
+
+    def pixel(self, lats: np.ndarray, lons: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Fractional (row, col) of coordinates relative to pixel centres"""
+        a, b, c, d, e, f = self._transform
+        x, y = lons - c, lats - f
+        det = a * e - b * d
+        cols = (e * x - b * y) / det
+        rows = (a * y - d * x) / det
+        # The geotransform addresses pixel corners; sample between centres
+        return rows - 0.5, cols - 0.5
+
+    def read(self, rows: slice, cols: slice) -> np.ndarray:
+        with self._lock:
+            return self._src.read(1, window=((rows.start, rows.stop),
+                                             (cols.start, cols.stop)))
+
+
+class ElevationStore:
+    """
+    One-degree SRTM tiles (HGT, or GeoTIFF when rasterio is installed)
+    from a local folder. HGT tiles are memory-mapped and GeoTIFF tiles
+    are read in windows, so only the pixels around sampled points are
+    loaded. Queries are vectorized with bilinear interpolation and return
+    NaN where no tile covers a point or a pixel is nodata.
+    """
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self._paths: Dict[Tuple[int, int], str] = {}
+        self._tiles: Dict[Tuple[int, int], object] = {}
+        self._lock = threading.Lock()
+
+        geotiffs = []
+        if folder and os.path.isdir(folder):
+            for path in glob.glob(os.path.join(folder, '*')):
+                corner = parse_tile_name(path)
+                if corner and path.lower().endswith('.hgt'):
+                    self._paths[corner] = path
+                elif corner and path.lower().endswith(('.tif', '.tiff')):
+                    geotiffs.append((corner, path))
+        if geotiffs:
+            try:
+                import rasterio  # noqa: F401
+                for corner, path in geotiffs:
+                    self._paths.setdefault(corner, path)
+            except ImportError:
+                print(f"Skipping {len(geotiffs)} GeoTIFF SRTM tiles in {folder}: "
+                      f"rasterio is not installed")
+        if self._paths:
+            print(f"Found {len(self._paths)} SRTM tiles in {folder}")
+
+    def __len__(self):
+        return len(self._paths)
+
+    def has_tile(self, latitude: float, longitude: float) -> bool:
+        return (int(np.floor(latitude)), int(np.floor(longitude))) in self._paths
+
+    def _tile(self, corner: Tuple[int, int]):
+        tile = self._tiles.get(corner)
+        if tile is not None:
+            return tile
+
+        with self._lock:
+            if corner not in self._tiles:
+                path = self._paths[corner]
+                if path.lower().endswith('.hgt'):
+                    self._tiles[corner] = _HgtTile(path, corner)
+                else:
+                    self._tiles[corner] = _GeoTiffTile(path)
+            return self._tiles[corner]
+
+    def sample(self, latitudes, longitudes) -> np.ndarray:
+        """Bilinear elevation (m) at arrays of coordinates, NaN if unknown"""
+        lats = np.atleast_1d(np.asarray(latitudes, dtype=float))
+        lons = np.atleast_1d(np.asarray(longitudes, dtype=float))
+        result = np.full(lats.shape, np.nan)
+
+        tile_lats = np.floor(lats).astype(int)
+        tile_lons = np.floor(lons).astype(int)
+        for corner in set(zip(tile_lats.tolist(), tile_lons.tolist())):
+            if corner not in self._paths:
+                continue
+            mask = (tile_lats == corner[0]) & (tile_lons == corner[1])
+            result[mask] = self._sample_tile(corner, lats[mask], lons[mask])
+
+        return result
+
+    def _sample_tile(self, corner, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+        tile = self._tile(corner)
+        height, width = tile.shape
+
+        rows, cols = tile.pixel(lats, lons)
+        r0 = np.clip(np.floor(rows).astype(int), 0, height - 2)
+        c0 = np.clip(np.floor(cols).astype(int), 0, width - 2)
+        dr = np.clip(rows - r0, 0.0, 1.0)
+        dc = np.clip(cols - c0, 0.0, 1.0)
+
+        # Only the window spanning the sampled pixels is read
+        top, left = int(r0.min()), int(c0.min())
+        window = np.asarray(tile.read(slice(top, int(r0.max()) + 2),
+                                      slice(left, int(c0.max()) + 2)))
+        r0 -= top
+        c0 -= left
+
+        corners = np.stack([
+            window[r0, c0], window[r0, c0 + 1], window[r0 + 1, c0], window[r0 + 1, c0 + 1]
+        ]).astype(float)
+        if tile.nodata is not None:
+            corners[corners == tile.nodata] = np.nan
+
+        weights = np.stack([
+            (1 - dr) * (1 - dc), (1 - dr) * dc, dr * (1 - dc), dr * dc
+        ])
+        return (corners * weights).sum(axis=0)
+
+    def get_elevation(self, latitude: float, longitude: float) -> Optional[float]:
+        """Elevation (m) at a point, or None if no local tile covers it"""
+        value = self.sample([latitude], [longitude])[0]
+        return None if np.isnan(value) else float(value)
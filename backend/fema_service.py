@@ -1,16 +1,28 @@
 """FEMA API service for flood zone data"""
-import requests
 import pandas as pd
 import os
-from typing import Optional, Dict
+from typing import Optional, Dict, List, Tuple
 from config import Config
+from flood_zone_index import FloodZoneIndex
+from flood_data_client import FloodDataClient, get_flood_data_client
+from ttl_cache import TTLCache
+import geohash
 
 
 class FEMAService:
     """Service for interacting with FEMA API"""
     
-    def __init__(self):
+    def __init__(self, client: Optional[FloodDataClient] = None):
         self.api_key = Config.FEMA_API_KEY
+        # Shared keep-alive client for the remote flood data API
+        self.client = client or get_flood_data_client()
+        
+        # Flood zones are static, so lookups are cached per geohash tile
+        self.cache = TTLCache(
+            max_entries=Config.FEMA_CACHE_MAX_ENTRIES,
+            ttl_seconds=Config.FEMA_CACHE_TTL_SECONDS,
+            negative_ttl_seconds=Config.FEMA_CACHE_NEGATIVE_TTL_SECONDS
+        )
         self.base_url = "https://www.fema.gov/api/open/v2"
         
         # Load flood zone risk scores from CSV
@@ -22,55 +34,124 @@ class FEMAService:
         
         # Create a dictionary for quick lookup
         self.zone_risk_map = dict(zip(self.zone_risk_df['zone'], self.zone_risk_df['risk_score']))
+        
+        # Local NFHL polygon index; the remote API is only a fallback
+        self.flood_zone_index: Optional[FloodZoneIndex] = None
+        if Config.FEMA_FLOOD_ZONES_PATH and os.path.exists(Config.FEMA_FLOOD_ZONES_PATH):
+            try:
+                self.flood_zone_index = FloodZoneIndex.load(Config.FEMA_FLOOD_ZONES_PATH)
+            except Exception as e:
+                print(f"Error loading flood zone polygons: {e}")
+    
+    def classify_zone(self, flood_zone: str) -> Dict:
+        """
+        Build flood zone information for a FEMA zone code
+        Returns flood zone classification and risk level from CSV lookup
+        """
+        # Look up risk score from CSV
+        risk_score = self.zone_risk_map.get(flood_zone.strip(), 0.5)  # Default to 0.5 if zone not found
+        
+        # Determine risk level based on score
+        if risk_score >= 0.8:
+            risk_level = 'high'
+            description = f'High-risk flood zone ({flood_zone})'
+        elif risk_score >= 0.6:
+            risk_level = 'moderate-high'
+            description = f'Moderate to high flood risk ({flood_zone})'
+        elif risk_score >= 0.3:
+            risk_level = 'moderate'
+            description = f'Moderate flood risk ({flood_zone})'
+        else:
+            risk_level = 'minimal'
+            description = f'Low flood risk ({flood_zone})'
+        
+        return {
+            'zone': flood_zone,
+            'risk_level': risk_level,
+            'risk_score': risk_score,
+            'description': description
+        }
     
     def get_flood_zone(self, latitude: float, longitude: float) -> Dict:
         """
         Get FEMA flood zone information for a location
-        Returns flood zone classification and risk level from CSV lookup
+        Uses the geohash-tiled cache, then the local polygon index, then
+        the remote API, then a heuristic estimate
         """
-        try:
-            # Call FEMA/National Flood Data API
-            headers = {'x-api-key': 'd4NyIxwf632nCvJcHUqU62KSTnwghIfO8xWIsWdC'}
-            payload = {
-                'lat': latitude,
-                'lng': longitude,
-                'searchtype': 'coord',
-                'loma': False
-            }
-            r = requests.get('https://api.nationalflooddata.com/v3/data', headers=headers, params=payload)
-            
-            # Extract flood zone from API response
-            flood_zone = r.json()['result']['flood.s_fld_haz_ar'][0]['fld_zone']
-            
-            # Look up risk score from CSV
-            risk_score = self.zone_risk_map.get(flood_zone.strip(), 0.5)  # Default to 0.5 if zone not found
-            
-            # Determine risk level based on score
-            if risk_score >= 0.8:
-                risk_level = 'high'
-                description = f'High-risk flood zone ({flood_zone})'
-            elif risk_score >= 0.6:
-                risk_level = 'moderate-high'
-                description = f'Moderate to high flood risk ({flood_zone})'
-            elif risk_score >= 0.3:
-                risk_level = 'moderate'
-                description = f'Moderate flood risk ({flood_zone})'
+        return self.get_flood_zones([(latitude, longitude)])[0]
+    
+    def get_flood_zones(self, coordinates: List[Tuple[float, float]]) -> List[Dict]:
+        """
+        Get FEMA flood zone information for many locations
+        Cached tiles are answered directly, points covered by the local
+        polygon index are resolved in one vectorized query, and only the
+        rest go to the remote API (concurrently, one lookup per tile)
+        """
+        precision = Config.FEMA_CACHE_GEOHASH_PRECISION
+        keys = [geohash.encode(lat, lon, precision) for lat, lon in coordinates]
+        results: List[Optional[Dict]] = [None] * len(coordinates)
+        
+        # Points of the same tile share one lookup
+        missing: Dict[str, List[int]] = {}
+        for i, key in enumerate(keys):
+            if key in missing:
+                missing[key].append(i)
+                continue
+            hit, cached = self.cache.get(key)
+            if not hit:
+                missing[key] = [i]
+            elif cached is None:
+                # Recent upstream failure for this tile
+                results[i] = self._estimate_flood_zone(*coordinates[i])
             else:
-                risk_level = 'minimal'
-                description = f'Low flood risk ({flood_zone})'
-            
-            return {
-                'zone': flood_zone,
-                'risk_level': risk_level,
-                'risk_score': risk_score,
-                'description': description
-            }
-
-        except Exception as e:
-            print(f"Error getting FEMA flood zone from API: {e}")
-            
-            # Fallback to heuristic estimation
-            return self._estimate_flood_zone(latitude, longitude)
+                results[i] = dict(cached)
+        
+        if missing:
+            tiles = list(missing)
+            points = [coordinates[missing[key][0]] for key in tiles]
+            for key, result in zip(tiles, self._lookup_flood_zones(points)):
+                if result is None:
+                    self.cache.set_negative(key)
+                else:
+                    self.cache.set(key, result)
+                for i in missing[key]:
+                    results[i] = dict(result) if result is not None \
+                        else self._estimate_flood_zone(*coordinates[i])
+        
+        return results
+    
+    def _lookup_flood_zones(self, coordinates: List[Tuple[float, float]]) -> List[Optional[Dict]]:
+        """
+        Resolve flood zones without the cache
+        Entries are None where the remote API failed
+        """
+        results: List[Optional[Dict]] = [None] * len(coordinates)
+        if self.flood_zone_index and coordinates:
+            zones = self.flood_zone_index.query_many(
+                [lat for lat, _ in coordinates], [lon for _, lon in coordinates]
+            )
+            for i, flood_zone in enumerate(zones):
+                if flood_zone:
+                    results[i] = self.classify_zone(flood_zone)
+        
+        pending = [i for i, result in enumerate(results) if result is None]
+        if not Config.FEMA_REMOTE_FALLBACK:
+            for i in pending:
+                results[i] = self._estimate_flood_zone(*coordinates[i])
+            return results
+        
+        # Remaining points are resolved concurrently by the pooled client
+        # (bounded by timeouts and retried with backoff)
+        zones = self.client.get_zones([coordinates[i] for i in pending])
+        for i, flood_zone in zip(pending, zones):
+            if flood_zone:
+                results[i] = self.classify_zone(flood_zone)
+        
+        return results
+    
+    def cache_stats(self) -> Dict:
+        """Flood zone cache statistics"""
+        return self.cache.stats()
 
     
     def _estimate_flood_zone(self, latitude: float, longitude: float) -> Dict:
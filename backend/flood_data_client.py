@@ -0,0 +1,102 @@
+"""Pooled HTTP client for the National Flood Data API"""
+import random
+import threading
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from typing import List, Optional, Tuple
+from config import Config
+
+
+# Responses worth retrying: rate limiting and transient server errors
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class FloodDataClient:
+    """
+    Keep-alive HTTP client for flood zone lookups with connect/read
+    timeouts, jittered exponential backoff and a bounded thread pool for
+    resolving many coordinates concurrently
+    """
+
+    def __init__(self, base_url: str = None, api_key: str = None,
+                 timeout: Tuple[float, float] = None,
+                 max_retries: int = None,
+                 backoff_seconds: float = None,
+                 max_workers: int = None):
+        self.base_url = base_url or Config.FLOOD_DATA_API_URL
+        self.api_key = api_key or Config.FLOOD_DATA_API_KEY
+        self.timeout = timeout or (Config.FEMA_CONNECT_TIMEOUT, Config.FEMA_READ_TIMEOUT)
+        self.max_retries = Config.FEMA_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_seconds = Config.FEMA_BACKOFF_SECONDS if backoff_seconds is None \
+            else backoff_seconds
+        self.max_workers = max_workers or Config.FEMA_MAX_WORKERS
+
+        # One pooled connection per worker so bulk lookups reuse sockets
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({'x-api-key': self.api_key})
+
+    def _sleep_before_retry(self, attempt: int):
+        """Exponential backoff with full jitter"""
+        delay = self.backoff_seconds * (2 ** attempt)
+        time.sleep(random.uniform(0, delay))
+
+    def get_zone(self, latitude: float, longitude: float) -> str:
+        """
+        Flood zone code for a coordinate
+        Raises the last error once all retries are exhausted
+        """
+        payload = {
+            'lat': latitude,
+            'lng': longitude,
+            'searchtype': 'coord',
+            'loma': False
+        }
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                r = self.session.get(self.base_url, params=payload, timeout=self.timeout)
+                if r.status_code in RETRYABLE_STATUS and attempt < self.max_retries:
+                    self._sleep_before_retry(attempt)
+                    continue
+                r.raise_for_status()
+                return r.json()['result']['flood.s_fld_haz_ar'][0]['fld_zone']
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.max_retries:
+                    raise
+                self._sleep_before_retry(attempt)
+
+    def get_zones(self, coordinates: List[Tuple[float, float]]) -> List[Optional[str]]:
+        """
+        Flood zone codes for many coordinates, resolved concurrently
+        Entries are None where the lookup failed
+        """
+        def lookup(point):
+            try:
+                return self.get_zone(*point)
+            except Exception as e:
+                print(f"Error getting FEMA flood zone from API: {e}")
+                return None
+
+        if len(coordinates) <= 1:
+            return [lookup(point) for point in coordinates]
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(coordinates))) as pool:
+            return list(pool.map(lookup, coordinates))
+
+
+_shared_client: Optional[FloodDataClient] = None
+_shared_lock = threading.Lock()
+
+
+def get_flood_data_client() -> FloodDataClient:
+    """Process-wide client so every FEMAService shares one connection pool"""
+    global _shared_client
+    with _shared_lock:
+        if _shared_client is None:
+            _shared_client = FloodDataClient()
+        return _shared_client
@@ -0,0 +1,201 @@
+"""Local spatial index over FEMA NFHL flood hazard polygons"""
+import heapq
+import json
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+
+# Grid cells polygons are bucketed into are sized after the median
+# polygon, within these bounds (degrees)
+MIN_CELL_DEGREES = 0.001
+MAX_CELL_DEGREES = 1.0
+
+# Polygons spanning more cells than this (e.g. county-wide zone X areas)
+# are not bucketed but checked by bounding box for every queried cell
+MAX_CELLS_PER_POLYGON = 64
+
+# Attribute holding the flood zone code in NFHL S_FLD_HAZ_AR layers
+DEFAULT_ZONE_FIELD = 'FLD_ZONE'
+
+
+def _points_in_ring(lons: np.ndarray, lats: np.ndarray, ring: np.ndarray) -> np.ndarray:
+    """Even-odd ray casting of many points against one closed ring"""
+    x1, y1 = ring[:-1, 0], ring[:-1, 1]
+    x2, y2 = ring[1:, 0], ring[1:, 1]
+    px, py = lons[:, None], lats[:, None]
+
+    crosses = (y1 > py) != (y2 > py)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_at_y = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+    return np.count_nonzero(crosses & (px < x_at_y), axis=1) % 2 == 1
+
+
+class FloodZoneIndex:
+    """
+    Grid-bucketed index of flood hazard polygons answering point-in-polygon
+    flood zone queries locally, one point or whole coordinate arrays at a time
+    Cells are sized after the typical polygon; the few much larger ones
+    are kept aside and matched by bounding box instead of filling cells
+    """
+
+    def __init__(self, polygons: List[Tuple[str, List[np.ndarray]]]):
+        # Each polygon is (zone, [exterior ring, hole rings...]) with rings
+        # as closed (n, 2) arrays of lon/lat
+        self.zones = [zone for zone, _ in polygons]
+        self.rings = [rings for _, rings in polygons]
+        self.bounds = np.array([
+            [r[0][:, 0].min(), r[0][:, 1].min(), r[0][:, 0].max(), r[0][:, 1].max()]
+            for r in self.rings
+        ], dtype=float).reshape(-1, 4)
+
+        sizes = np.maximum(self.bounds[:, 2] - self.bounds[:, 0],
+                           self.bounds[:, 3] - self.bounds[:, 1])
+        self.cell_degrees = float(np.clip(np.median(sizes), MIN_CELL_DEGREES,
+                                          MAX_CELL_DEGREES)) if len(sizes) else MAX_CELL_DEGREES
+
+        self._grid: Dict[Tuple[int, int], List[int]] = {}
+        large = []
+        cells = np.floor(self.bounds / self.cell_degrees).astype(int)
+        for i, (min_c, min_r, max_c, max_r) in enumerate(cells):
+            if (max_r - min_r + 1) * (max_c - min_c + 1) > MAX_CELLS_PER_POLYGON:
+                large.append(i)
+                continue
+            for r in range(min_r, max_r + 1):
+                for c in range(min_c, max_c + 1):
+                    self._grid.setdefault((r, c), []).append(i)
+        self._large = np.array(large, dtype=np.intp)
+
+    def __len__(self):
+        return len(self.zones)
+
+    @staticmethod
+    def _closed(ring) -> np.ndarray:
+        ring = np.asarray(ring, dtype=float)[:, :2]
+        if len(ring) and not np.array_equal(ring[0], ring[-1]):
+            ring = np.vstack([ring, ring[:1]])
+        return ring
+
+    @staticmethod
+    def _group_rings(rings: List[np.ndarray]) -> List[List[np.ndarray]]:
+        """
+        Split shapefile rings into [exterior, holes...] polygons
+        Shapefiles list every exterior (clockwise) ring followed by its
+        holes (counter-clockwise), so each clockwise ring starts a new part
+        """
+        parts = []
+        for ring in rings:
+            x, y = ring[:, 0], ring[:, 1]
+            # Shoelace signed area is negative for clockwise rings
+            clockwise = np.dot(x[:-1], y[1:]) - np.dot(x[1:], y[:-1]) < 0
+            if clockwise or not parts:
+                parts.append([ring])
+            else:
+                parts[-1].append(ring)
+        return parts
+
+    @classmethod
+    def from_geojson(cls, path: str, zone_field: str = DEFAULT_ZONE_FIELD) -> 'FloodZoneIndex':
+        """Build the index from a GeoJSON FeatureCollection of NFHL polygons"""
+        with open(path) as f:
+            data = json.load(f)
+
+        polygons = []
+        for feature in data.get('features', []):
+            geometry = feature.get('geometry') or {}
+            zone = (feature.get('properties') or {}).get(zone_field)
+            if not zone:
+                continue
+            if geometry.get('type') == 'Polygon':
+                parts = [geometry['coordinates']]
+            elif geometry.get('type') == 'MultiPolygon':
+                parts = geometry['coordinates']
+            else:
+                continue
+            for part in parts:
+                polygons.append((str(zone).strip(), [cls._closed(ring) for ring in part]))
+
+        print(f"Loaded {len(polygons)} flood zone polygons from {path}")
+        return cls(polygons)
+
+    @classmethod
+    def from_shapefile(cls, path: str, zone_field: str = DEFAULT_ZONE_FIELD) -> 'FloodZoneIndex':
+        """Build the index from an NFHL shapefile (requires pyshp)"""
+        import shapefile
+
+        polygons = []
+        with shapefile.Reader(path) as reader:
+            fields = [field[0] for field in reader.fields[1:]]
+            zone_pos = fields.index(zone_field)
+            for shape_record in reader.iterShapeRecords():
+                zone = shape_record.record[zone_pos]
+                shape = shape_record.shape
+                if not zone or not shape.points:
+                    continue
+                bounds = list(shape.parts) + [len(shape.points)]
+                rings = [cls._closed(shape.points[a:b]) for a, b in zip(bounds, bounds[1:])]
+                for part in cls._group_rings(rings):
+                    polygons.append((str(zone).strip(), part))
+
+        print(f"Loaded {len(polygons)} flood zone polygons from {path}")
+        return cls(polygons)
+
+    @classmethod
+    def load(cls, path: str, zone_field: str = DEFAULT_ZONE_FIELD) -> 'FloodZoneIndex':
+        """Build the index from a GeoJSON or shapefile based on its extension"""
+        if path.lower().endswith('.shp'):
+            return cls.from_shapefile(path, zone_field)
+        return cls.from_geojson(path, zone_field)
+
+    def _contains(self, polygon: int, lons: np.ndarray, lats: np.ndarray) -> np.ndarray:
+        exterior, *holes = self.rings[polygon]
+        inside = _points_in_ring(lons, lats, exterior)
+        for hole in holes:
+            if not inside.any():
+                break
+            inside &= ~_points_in_ring(lons, lats, hole)
+        return inside
+
+    def query(self, latitude: float, longitude: float) -> Optional[str]:
+        """Flood zone containing a point, or None if no polygon covers it"""
+        return self.query_many([latitude], [longitude])[0]
+
+    def query_many(self, latitudes, longitudes) -> List[Optional[str]]:
+        """Flood zones for arrays of coordinates (None where uncovered)"""
+        lats = np.asarray(latitudes, dtype=float)
+        lons = np.asarray(longitudes, dtype=float)
+        result: List[Optional[str]] = [None] * len(lats)
+
+        size = self.cell_degrees
+        rows = np.floor(lats / size).astype(int)
+        cols = np.floor(lons / size).astype(int)
+        large_bounds = self.bounds[self._large]
+
+        # Group points by grid cell, then test each candidate polygon
+        # against all still-unresolved points of that cell at once
+        cell_points: Dict[Tuple[int, int], List[int]] = {}
+        for i, cell in enumerate(zip(rows.tolist(), cols.tolist())):
+            cell_points.setdefault(cell, []).append(i)
+
+        for cell, points in cell_points.items():
+            pending = np.array(points, dtype=np.intp)
+            # Large polygons overlapping the cell, tested in index order
+            # with the cell's own polygons
+            r, c = cell
+            overlaps = ((large_bounds[:, 0] <= (c + 1) * size) & (large_bounds[:, 2] >= c * size)
+                        & (large_bounds[:, 1] <= (r + 1) * size) & (large_bounds[:, 3] >= r * size))
+            polygons = heapq.merge(self._grid.get(cell, ()), self._large[overlaps].tolist())
+            for polygon in polygons:
+                min_x, min_y, max_x, max_y = self.bounds[polygon]
+                in_box = ((lons[pending] >= min_x) & (lons[pending] <= max_x)
+                          & (lats[pending] >= min_y) & (lats[pending] <= max_y))
+                candidates = pending[in_box]
+                if not len(candidates):
+                    continue
+                hits = candidates[self._contains(polygon, lons[candidates], lats[candidates])]
+                for i in hits:
+                    result[i] = self.zones[polygon]
+                pending = np.setdiff1d(pending, hits, assume_unique=True)
+                if not len(pending):
+                    break
+
+        return result
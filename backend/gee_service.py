@@ -1,35 +1,135 @@
 """Google Earth Engine service for flood risk assessment"""
 import ee
-from typing import Tuple, Optional
-from config import Config
+import threading
 import time
+import numpy as np
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Tuple, Optional
+from config import Config
+from elevation_store import ElevationStore
+from precipitation_store import PrecipitationStore, date_range
+
+
+# Score returned when terrain/precipitation data is unavailable
+FALLBACK_SUSCEPTIBILITY = 0.3
+
+
+def flood_susceptibility_score(elevation_m: float,
+                               precipitation_mm: Optional[float]) -> float:
+    """
+    Flood susceptibility between 0-1 from elevation and precipitation
+    Lower elevation and higher precipitation mean higher risk
+    Unknown precipitation contributes the fallback (moderate) risk
+    """
+    elev_risk = max(0, 1 - (elevation_m / 100))  # Normalize by 100m
+    if precipitation_mm is None:
+        precip_risk = FALLBACK_SUSCEPTIBILITY
+    else:
+        precip_risk = min(1, precipitation_mm / 500)  # Normalize by 500mm
+    
+    # Combine factors (60% elevation, 40% precipitation)
+    flood_risk = (0.6 * elev_risk) + (0.4 * precip_risk)
+    
+    return min(1.0, max(0.0, flood_risk))
 
 
 class GEEService:
     """Service for interacting with Google Earth Engine"""
     
-    def __init__(self):
-        self.initialized = False
+    def __init__(self, elevation_store: Optional[ElevationStore] = None,
+                 precipitation_store: Optional[PrecipitationStore] = None,
+                 interactive_auth: bool = None):
+        # Earth Engine is initialized lazily on a background thread; until
+        # it is ready every method serves local data or the fallback score
+        self._state = 'idle'  # idle, pending, ready or failed
+        self._failed_at = 0.0
+        self._ready = threading.Event()
+        self._init_lock = threading.Lock()
+        self.interactive_auth = Config.GEE_INTERACTIVE_AUTH if interactive_auth is None \
+            else interactive_auth
+        # Local SRTM tiles; Earth Engine is only asked about other areas
+        self.elevation_store = elevation_store or ElevationStore(Config.SRTM_TILE_FOLDER)
+        # Daily precipitation already fetched, so only new days are requested
+        self.precipitation_store = precipitation_store or PrecipitationStore(
+            Config.PRECIP_CACHE_PRECISION, Config.PRECIP_CACHE_MAX_LOCATIONS,
+            Config.PRECIP_NEGATIVE_TTL_SECONDS
+        )
+    
+    @property
+    def initialized(self) -> bool:
+        """Whether Earth Engine is ready; starts initialization on first use"""
+        if self._state == 'ready':
+            return True
         self.initialize()
+        return self._state == 'ready'
+    
+    @property
+    def status(self) -> str:
+        return self._state
     
     def initialize(self):
-        """Initialize Google Earth Engine"""
+        """
+        Start initializing Google Earth Engine in the background
+        Returns immediately; a failed attempt is retried after
+        Config.GEE_INIT_RETRY_SECONDS
+        """
+        with self._init_lock:
+            if self._state in ('pending', 'ready'):
+                return
+            if self._state == 'failed' and \
+                    time.time() - self._failed_at < Config.GEE_INIT_RETRY_SECONDS:
+                return
+            self._state = 'pending'
+        
+        threading.Thread(target=self._initialize_worker, name='gee-init',
+                         daemon=True).start()
+        
+        # Give up on this attempt if Earth Engine does not answer in time
+        timer = threading.Timer(Config.GEE_INIT_TIMEOUT_SECONDS, self._initialize_timeout)
+        timer.daemon = True
+        timer.start()
+    
+    def _initialize_worker(self):
         try:
-            # Try to initialize with project ID
-            ee.Initialize(project=Config.GEE_PROJECT_ID)
-            self.initialized = True
-            print("Google Earth Engine initialized successfully")
-        except Exception as e:
-            print(f"Error initializing GEE: {e}")
-            print("Attempting authentication...")
             try:
+                # Try to initialize with project ID
+                ee.Initialize(project=Config.GEE_PROJECT_ID)
+            except Exception as e:
+                if not self.interactive_auth:
+                    raise
+                # Interactive authentication only when running by hand
+                print(f"Error initializing GEE: {e}")
+                print("Attempting authentication...")
                 ee.Authenticate()
                 ee.Initialize(project=Config.GEE_PROJECT_ID)
-                self.initialized = True
-                print("Google Earth Engine authenticated and initialized")
-            except Exception as auth_error:
-                print(f"Failed to authenticate GEE: {auth_error}")
-                self.initialized = False
+            # Bound every later Earth Engine request
+            ee.data.setDeadline(int(Config.GEE_REQUEST_TIMEOUT_SECONDS * 1000))
+            
+            # Ready even if the attempt was already given up on as timed out
+            with self._init_lock:
+                if self._state != 'ready':
+                    self._state = 'ready'
+                    self._ready.set()
+                    print("Google Earth Engine initialized successfully")
+        except Exception as e:
+            print(f"Error initializing GEE: {e}")
+            self._initialize_failed()
+    
+    def _initialize_timeout(self):
+        if self._state == 'pending':
+            print(f"GEE initialization timed out after {Config.GEE_INIT_TIMEOUT_SECONDS}s")
+            self._initialize_failed()
+    
+    def _initialize_failed(self):
+        with self._init_lock:
+            if self._state == 'pending':
+                self._state = 'failed'
+                self._failed_at = time.time()
+    
+    def wait_until_ready(self, timeout: float = None) -> bool:
+        """Block until Earth Engine is ready (for scripts and tests)"""
+        self.initialize()
+        return self._ready.wait(timeout)
     
     def get_precipitation_data(self, latitude: float, longitude: float, 
                                days_back: int = 30) -> float:
@@ -37,68 +137,167 @@ class GEEService:
         Get precipitation data for a location over the past N days
         Returns total precipitation in mm
         """
-        if not self.initialized:
-            return 0.0
+        start, end = self._precipitation_window(days_back)
+        self._sample_points([(latitude, longitude)], start, end, [False])
+        total = self._window_precipitation(latitude, longitude, start, end)
+        return 0.0 if total is None else total
+    
+    def _window_precipitation(self, latitude: float, longitude: float,
+                              start: date, end: date) -> Optional[float]:
+        """
+        Precipitation total over [start, end) from the daily store, None if
+        no day is known. Windows with unpublished days are scaled up from
+        the days that are known rather than counting the gaps as dry
+        """
+        total, missing = self.precipitation_store.window_total(latitude, longitude,
+                                                               start, end)
+        if total is None or not missing:
+            return total
+        days = (end - start).days
+        return total * days / (days - missing)
+    
+    def _precipitation_window(self, days_back: int = 30) -> Tuple[date, date]:
+        """
+        Dates [start, end) of the last N days with published data
+        NOAA CPC daily grids appear with a short lag, so the window ends
+        Config.PRECIP_LAG_DAYS before today
+        """
+        end = date.today() - timedelta(days=Config.PRECIP_LAG_DAYS)
+        return end - timedelta(days=days_back), end
+    
+    def _daily_precipitation_image(self, start: date, end: date):
+        """One band per day of precipitation over [start, end)"""
+        # NOAA CPC unified gauge precipitation (daily, global); bands are
+        # named '<YYYYMMDD>_precipitation' after stacking
+        return ee.ImageCollection('NOAA/CPC/Precipitation') \
+            .filterDate(start.isoformat(), end.isoformat()) \
+            .select('precipitation') \
+            .toBands()
+    
+    @staticmethod
+    def _parse_daily_bands(properties: Dict, start: date, end: date) -> Dict[date, float]:
+        """Daily precipitation values from sampled per-day band properties"""
+        values = {}
+        for name, value in properties.items():
+            if not name.endswith('_precipitation') or value is None:
+                continue
+            try:
+                day = datetime.strptime(name[:8], '%Y%m%d').date()
+            except ValueError:
+                continue
+            if start <= day < end:
+                values[day] = float(value)
+        
+        # A day without an image is dry once it is old enough that the
+        # dataset will not backfill it; recent gaps are fetched again later
+        finalized = date.today() - timedelta(days=Config.PRECIP_FINALIZE_DAYS)
+        for day in date_range(start, end):
+            if day not in values and day < finalized:
+                values[day] = 0.0
+        return values
+    
+    def _sample_points(self, points: List[Tuple[float, float]], start: date, end: date,
+                       need_elevation: List[bool]) -> Dict[int, float]:
+        """
+        Fill missing daily precipitation over [start, end) for all points,
+        and fetch SRTM elevation where need_elevation is set, with a single
+        reduceRegions call. Returns fetched elevations by point index.
+        """
+        missing = {}
+        for i, (lat, lon) in enumerate(points):
+            days = self.precipitation_store.missing_days(lat, lon, start, end)
+            if days:
+                missing[i] = days[0]
+        wanted = sorted(set(missing) | {i for i, need in enumerate(need_elevation) if need})
+        
+        if not self.initialized or not wanted:
+            return {}
         
         try:
-            # Define point of interest
-            point = ee.Geometry.Point([longitude, latitude])
-            
-            # Get current date and date N days ago
-            start_date = ee.Date(time.strftime('%Y-%m-%d')).advance(-7, 'day')
-            end_date = start_date.advance(5, 'day')
-            
-            # Use CHIRPS precipitation dataset (daily, global)
-            chirps = ee.ImageCollection('NOAA/CPC/Precipitation') \
-                .filterDate(start_date, end_date) \
-                .select('precipitation')
+            fetch_start = min(missing.values()) if missing else None
+            stacked = None
+            if missing:
+                stacked = self._daily_precipitation_image(fetch_start, end)
+            if any(need_elevation):
+                srtm = ee.Image('USGS/SRTMGL1_003').select('elevation')
+                stacked = srtm if stacked is None else stacked.addBands(srtm)
             
-            # Calculate total precipitation
-            total_precip = chirps.sum()
-            
-            # Get value at point
-            precip_value = total_precip.reduceRegion(
+            features = ee.FeatureCollection([
+                ee.Feature(ee.Geometry.Point([points[i][1], points[i][0]]), {'index': i})
+                for i in wanted
+            ])
+            reduced = stacked.reduceRegions(
+                collection=features,
                 reducer=ee.Reducer.mean(),
-                geometry=point,
-                scale=5000
+                scale=30
             ).getInfo()
             
-            return float(precip_value.get('precipitation', 0.0))
+            elevations = {}
+            for feature in reduced['features']:
+                properties = feature['properties']
+                index = int(properties['index'])
+                if index in missing:
+                    self.precipitation_store.add(
+                        *points[index],
+                        self._parse_daily_bands(properties, fetch_start, end),
+                        date_range(missing[index], end)
+                    )
+                if properties.get('elevation') is not None:
+                    elevations[index] = float(properties['elevation'])
+            return elevations
             
         except Exception as e:
-            print(f"Error getting precipitation data: {e}")
-            return 0.0
+            print(f"Error sampling Earth Engine precipitation/elevation: {e}")
+            return {}
     
     def get_flood_susceptibility(self, latitude: float, longitude: float) -> float:
         """
         Calculate flood susceptibility based on terrain and precipitation
         Returns a score between 0-1 (higher = more risk)
         """
-        if not self.initialized:
-            # Return moderate risk if GEE not available
-            return 0.3
+        return self.get_flood_susceptibility_bulk([(latitude, longitude)])[0]
+    
+    def get_flood_susceptibility_bulk(self, points: List[Tuple[float, float]],
+                                      days_back: int = 30) -> List[float]:
+        """
+        Flood susceptibility for many (lat, lon) points
+        Elevation comes from local SRTM tiles and precipitation from the
+        daily store; whatever is missing is fetched in one Earth Engine
+        round trip for all points at once
+        """
+        if not points:
+            return []
         
         try:
-            elev = self.get_elevation(latitude, longitude)
-            
-            # Get precipitation (30-day)
-            precip = self.get_precipitation_data(latitude, longitude, 30)
-            
-            # Calculate flood risk score
-            # Lower elevation = higher risk
-            # Higher precipitation = higher risk
-            elev_risk = max(0, 1 - (elev / 100))  # Normalize by 100m
-            precip_risk = min(1, precip / 500)  # Normalize by 500mm
+            try:
+                local_elevation = self.elevation_store.sample(
+                    [lat for lat, _ in points], [lon for _, lon in points]
+                )
+            except Exception as e:
+                # Unreadable local tiles are treated as missing
+                print(f"Error reading local elevation: {e}")
+                local_elevation = np.full(len(points), np.nan)
+            elevations = [None if np.isnan(e) else float(e) for e in local_elevation]
             
-            # Combine factors (60% elevation, 40% precipitation)
-            flood_risk = (0.6 * elev_risk) + (0.4 * precip_risk)
+            start, end = self._precipitation_window(days_back)
+            fetched = self._sample_points(points, start, end,
+                                          [elev is None for elev in elevations])
             
-            return min(1.0, max(0.0, flood_risk))
+            scores = []
+            for i, (lat, lon) in enumerate(points):
+                elevation = elevations[i] if elevations[i] is not None else fetched.get(i)
+                if elevation is None:
+                    # Return moderate risk without terrain data
+                    scores.append(FALLBACK_SUSCEPTIBILITY)
+                    continue
+                precip = self._window_precipitation(lat, lon, start, end)
+                scores.append(flood_susceptibility_score(elevation, precip))
+            return scores
             
         except Exception as e:
             print(f"Error calculating flood susceptibility: {e}")
             # Return moderate risk on error
-            return 0.3
+            return [FALLBACK_SUSCEPTIBILITY] * len(points)
     
     def get_flood_risk_for_route(self, start_lat: float, start_lon: float,
                                   end_lat: float, end_lon: float) -> float:
@@ -112,7 +311,17 @@ class GEEService:
         return (start_risk + end_risk) / 2.0
     
     def get_elevation(self, latitude: float, longitude: float) -> Optional[float]:
-        """Get elevation at a specific location"""
+        """
+        Get elevation at a specific location
+        Local SRTM tiles first, Earth Engine for areas without a tile
+        """
+        try:
+            local = self.elevation_store.get_elevation(latitude, longitude)
+            if local is not None:
+                return local
+        except Exception as e:
+            print(f"Error reading local elevation: {e}")
+        
         if not self.initialized:
             return None
         
@@ -131,3 +340,15 @@ class GEEService:
             print(f"Error getting elevation: {e}")
             return None
 
+
+_shared_service: Optional[GEEService] = None
+_shared_lock = threading.Lock()
+
+
+def get_gee_service() -> GEEService:
+    """Process-wide GEEService so Earth Engine is initialized only once"""
+    global _shared_service
+    with _shared_lock:
+        if _shared_service is None:
+            _shared_service = GEEService()
+        return _shared_service
@@ -0,0 +1,164 @@
+"""Chunked CSV ingest jobs with progress reporting"""
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+from config import Config
+
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class _CountingReader:
+    """Binary file wrapper counting the bytes the CSV parser has read"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        self.bytes_read += len(data)
+        return data
+
+    def __iter__(self):
+        return iter(self.read, b'')
+
+
+class IngestJob:
+    """Progress and outcome of one uploaded file"""
+
+    def __init__(self, csv_type: str, path: str, mode: str = 'replace'):
+        self.job_id = uuid.uuid4().hex
+        self.csv_type = csv_type
+        self.mode = mode
+        self.path = path
+        self.status = QUEUED
+        self.total_bytes = os.path.getsize(path)
+        self.bytes_read = 0
+        self.rows_read = 0
+        # Rows skipped as unparseable, and problems with rows that were kept
+        self.error_count = 0
+        self.row_errors = []
+        self.warnings = []
+        # IDs added/updated/deleted once applied (None if unknown)
+        self.changes: Optional[dict] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.done = threading.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    def to_dict(self) -> dict:
+        return {
+            'job_id': self.job_id,
+            'type': self.csv_type,
+            'mode': self.mode,
+            'status': self.status,
+            'rows_read': self.rows_read,
+            'error_count': self.error_count,
+            'bytes_read': self.bytes_read,
+            'total_bytes': self.total_bytes,
+            'progress': round(self.bytes_read / self.total_bytes, 3) if self.total_bytes else 1.0,
+            'row_errors': self.row_errors[:100],
+            'warnings': self.warnings[:100],
+            'changes': None if self.changes is None else {
+                kind: {'count': len(ids), 'ids': ids[:100]}
+                for kind, ids in self.changes.items()
+            },
+            'error': self.error,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+
+
+class IngestManager:
+    """
+    Runs uploads through DataService.update_from_csv in chunks, one file
+    at a time in upload order, and keeps their status for polling.
+    on_complete(csv_type, changes) runs after a file has been applied
+    """
+
+    def __init__(self, data_service, on_complete: Callable[[str, dict], None] = None,
+                 chunk_rows: int = None, max_jobs: int = None):
+        self.data_service = data_service
+        self.on_complete = on_complete
+        self.chunk_rows = chunk_rows or Config.INGEST_CHUNK_ROWS
+        self.max_jobs = max_jobs or Config.INGEST_MAX_JOBS
+        self._jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        # A single worker applies uploads in the order they arrived
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ingest')
+
+    def submit(self, csv_type: str, path: str, run_async: bool = True,
+               mode: str = 'replace') -> IngestJob:
+        """
+        Ingest a saved upload ('replace' or 'upsert' mode); the file is
+        removed once it has been read
+        Without run_async this waits for the job before returning, unless
+        other uploads are queued ahead of it; check job.finished
+        """
+        job = IngestJob(csv_type, path, mode)
+        with self._lock:
+            # Waiting behind other files could hold a request for minutes
+            busy = any(not queued.finished for queued in self._jobs.values())
+            self._jobs[job.job_id] = job
+            # Forget the oldest finished jobs beyond the limit
+            for job_id in [j for j, old in self._jobs.items() if old.finished]:
+                if len(self._jobs) <= self.max_jobs:
+                    break
+                del self._jobs[job_id]
+        self._executor.submit(self._run, job)
+        if not run_async and not busy:
+            job.done.wait()
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        return self._jobs.get(job_id)
+
+    def _run(self, job: IngestJob):
+        job.status = RUNNING
+        job.started_at = time.time()
+        try:
+            with open(job.path, 'rb') as raw:
+                reader = _CountingReader(raw)
+
+                def progress(rows):
+                    job.rows_read = rows
+                    job.bytes_read = reader.bytes_read
+
+                success = self.data_service.update_from_csv(
+                    job.csv_type, reader, self.chunk_rows, progress, job.mode
+                )
+            job.bytes_read = job.total_bytes
+            errors = self.data_service.load_errors
+            job.error_count = len(errors)
+            job.row_errors = errors[:1000]
+            job.warnings = self.data_service.load_warnings[:1000]
+            if not success:
+                raise ValueError(self.data_service.last_error or 'Failed to parse CSV file')
+            job.changes = self.data_service.last_changes
+            if self.on_complete:
+                self.on_complete(job.csv_type, job.changes)
+            job.status = DONE
+        except Exception as e:
+            print(f"Error ingesting {job.csv_type} upload: {e}")
+            job.error = str(e)
+            job.status = FAILED
+        finally:
+            job.finished_at = time.time()
+            try:
+                os.remove(job.path)
+            except OSError:
+                pass
+            job.done.set()
@@ -97,6 +97,7 @@ class RouteRecommendation:
     requested_device: Optional[str] = None  # The device user requested
     offered_device: Optional[str] = None  # The device provider offers (may be substitute)
     is_substitute: bool = False  # True if offering a substitute product
+    degraded: bool = False  # True if scored with fallback values after a timeout
     
     def to_dict(self):
         return {
@@ -111,6 +112,7 @@ class RouteRecommendation:
             'estimated_time': self.estimated_time,
             'requested_device': self.requested_device,
             'offered_device': self.offered_device,
-            'is_substitute': self.is_substitute
+            'is_substitute': self.is_substitute,
+            'degraded': self.degraded
         }
 
@@ -0,0 +1,350 @@
+"""Compact columnar storage for order history"""
+import threading
+import numpy as np
+import pandas as pd
+from typing import Callable, Dict, Iterable, List, Optional
+from models import Order
+
+
+# Dictionary-encoded columns: each value is stored as an int32 code into
+# a per-column vocabulary
+CODED_COLUMNS = ('hospital_id', 'provider_id', 'device_name')
+DATE_COLUMNS = ('order_date', 'delivery_date')
+
+
+def parse_dates(values) -> np.ndarray:
+    """
+    Parse date strings to datetime64[D] (NaT where missing or invalid)
+    ISO dates are parsed in bulk; only the rest fall back to per-value
+    format inference, so one column may mix formats
+    """
+    series = pd.Series(values)
+    if not pd.api.types.is_datetime64_any_dtype(series):
+        series = series.astype(object)
+        parsed = pd.to_datetime(series, format='ISO8601', errors='coerce')
+        retry = parsed.isna() & series.notna() & (series.astype(str).str.strip() != '')
+        if retry.any():
+            parsed[retry] = pd.to_datetime(series[retry], format='mixed', errors='coerce')
+        series = parsed
+    return series.to_numpy().astype('datetime64[D]')
+
+
+class OrderStore:
+    """
+    Orders as typed columns instead of one dataclass per row: integer
+    coded hospital/provider/device IDs, int32 quantities and datetime64
+    dates. Behaves like a read-only list of Order objects, which are
+    created on access; filters work on whole columns
+    """
+
+    def __init__(self, capacity: int = 0):
+        self._size = 0
+        self._lock = threading.Lock()
+        # Fixed-width unicode rather than one Python string per order
+        self.order_ids = np.empty(capacity, dtype='U1')
+        self.codes: Dict[str, np.ndarray] = {
+            column: np.empty(capacity, dtype=np.int32) for column in CODED_COLUMNS
+        }
+        self.vocabularies: Dict[str, List[str]] = {column: [] for column in CODED_COLUMNS}
+        self._code_of: Dict[str, Dict[str, int]] = {column: {} for column in CODED_COLUMNS}
+        self.quantities = np.empty(capacity, dtype=np.int32)
+        self.dates: Dict[str, np.ndarray] = {
+            column: np.empty(capacity, dtype='datetime64[D]') for column in DATE_COLUMNS
+        }
+        # column -> (row positions sorted by code, start offset per code)
+        self._groups: Dict[str, tuple] = {}
+
+    @classmethod
+    def from_columns(cls, columns: dict) -> 'OrderStore':
+        """Build a store from whole columns (lists, arrays or Series)"""
+        return cls().extend(columns)
+
+    def extend(self, columns: dict) -> 'OrderStore':
+        """
+        Append a chunk of rows given as whole columns; values are coded
+        against the existing vocabularies so chunks can be added one at
+        a time
+        """
+        order_ids = np.asarray(pd.Series(columns['order_id'], dtype=object).astype(str),
+                               dtype=str)
+        with self._lock:
+            size = self._size + len(order_ids)
+            if size > len(self.order_ids):
+                self._grow(max(size, 2 * self._size))
+            if order_ids.dtype.itemsize > self.order_ids.dtype.itemsize:
+                self.order_ids = self.order_ids.astype(order_ids.dtype)
+            rows = slice(self._size, size)
+            self.order_ids[rows] = order_ids
+            for column in CODED_COLUMNS:
+                chunk_codes, values = pd.factorize(
+                    pd.Series(columns[column], dtype=object), use_na_sentinel=False
+                )
+                codes = np.array([self._code(column, str(v)) for v in values],
+                                 dtype=np.int32)
+                self.codes[column][rows] = codes[chunk_codes]
+            self.quantities[rows] = np.asarray(columns['quantity'], dtype=np.int32)
+            for column in DATE_COLUMNS:
+                self.dates[column][rows] = parse_dates(columns[column])
+            self._size = size
+            self._groups = {}
+        return self
+
+    @classmethod
+    def from_orders(cls, orders: Iterable[Order]) -> 'OrderStore':
+        orders = list(orders)
+        return cls.from_columns({
+            field: [getattr(o, field) for o in orders]
+            for field in ('order_id', 'quantity') + CODED_COLUMNS + DATE_COLUMNS
+        })
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, position) -> Order:
+        if isinstance(position, slice):
+            return self.take(range(*position.indices(self._size)))
+        if position < 0:
+            position += self._size
+        if not 0 <= position < self._size:
+            raise IndexError('order position out of range')
+        return self._view(position)
+
+    def __iter__(self):
+        for position in range(self._size):
+            yield self._view(position)
+
+    def _view(self, position: int) -> Order:
+        def value(column):
+            return self.vocabularies[column][self.codes[column][position]]
+
+        def date(column):
+            day = self.dates[column][position]
+            return None if np.isnat(day) else str(day)
+
+        return Order(
+            order_id=str(self.order_ids[position]),
+            hospital_id=value('hospital_id'),
+            provider_id=value('provider_id'),
+            device_name=value('device_name'),
+            quantity=int(self.quantities[position]),
+            order_date=date('order_date'),
+            delivery_date=date('delivery_date')
+        )
+
+    def take(self, positions) -> List[Order]:
+        """Order views for the given row positions, in that order"""
+        return [self._view(int(p)) for p in positions]
+
+    def nbytes(self) -> int:
+        """Memory held by the columns"""
+        return (self.order_ids.nbytes + self.quantities.nbytes
+                + sum(c.nbytes for c in self.codes.values())
+                + sum(d.nbytes for d in self.dates.values()))
+
+    def append(self, order: Order):
+        """Add one order, growing the columns geometrically"""
+        with self._lock:
+            if self._size == len(self.order_ids):
+                self._grow(max(16, 2 * self._size))
+            position = self._size
+            order_id = str(order.order_id)
+            if len(order_id) > self.order_ids.dtype.itemsize // 4:
+                self.order_ids = self.order_ids.astype(f'U{len(order_id)}')
+            self.order_ids[position] = order_id
+            for column in CODED_COLUMNS:
+                self.codes[column][position] = self._code(column, getattr(order, column))
+            self.quantities[position] = order.quantity
+            for column in DATE_COLUMNS:
+                self.dates[column][position] = parse_dates([getattr(order, column)])[0]
+            self._size += 1
+            self._groups = {}
+
+    def locate(self, order_ids) -> np.ndarray:
+        """Positions of the given order IDs, -1 where an ID is not stored"""
+        def build(ids):
+            order = np.argsort(ids, kind='stable')
+            return order, ids[order]
+        order, sorted_ids = self._cached_grouping('order_id', build)
+
+        query = np.asarray(list(order_ids), dtype=str)
+        if not len(sorted_ids) or not len(query):
+            return np.full(len(query), -1, dtype=np.intp)
+        found = np.minimum(np.searchsorted(sorted_ids, query), len(sorted_ids) - 1)
+        return np.where(sorted_ids[found] == query, order[found], -1)
+
+    def select(self, mask: np.ndarray) -> 'OrderStore':
+        """New store holding copies of the rows where mask is True"""
+        store = OrderStore()
+        store.order_ids = self.order_ids[:self._size][mask]
+        store.codes = {c: a[:self._size][mask] for c, a in self.codes.items()}
+        store.vocabularies = {c: list(v) for c, v in self.vocabularies.items()}
+        store._code_of = {c: dict(m) for c, m in self._code_of.items()}
+        store.quantities = self.quantities[:self._size][mask]
+        store.dates = {c: a[:self._size][mask] for c, a in self.dates.items()}
+        store._size = int(np.count_nonzero(mask))
+        return store
+
+    def _recode(self, source: 'OrderStore', column: str, rows: np.ndarray) -> np.ndarray:
+        """Codes in this store's vocabulary for rows of another store"""
+        mapping = np.array([self._code(column, v) for v in source.vocabularies[column]],
+                           dtype=np.int32)
+        return mapping[source.codes[column][rows]] if len(mapping) else \
+            np.zeros(len(rows), dtype=np.int32)
+
+    def _write(self, positions: np.ndarray, source: 'OrderStore', rows: np.ndarray):
+        """Copy rows of another store over the given positions"""
+        order_ids = source.order_ids[rows]
+        if order_ids.dtype.itemsize > self.order_ids.dtype.itemsize:
+            self.order_ids = self.order_ids.astype(order_ids.dtype)
+        self.order_ids[positions] = order_ids
+        for column in CODED_COLUMNS:
+            self.codes[column][positions] = self._recode(source, column, rows)
+        self.quantities[positions] = source.quantities[rows]
+        for column in DATE_COLUMNS:
+            self.dates[column][positions] = source.dates[column][rows]
+
+    def upsert(self, delta: 'OrderStore', deleted_ids: Iterable[str] = ()) -> tuple:
+        """
+        Merge a delta by order ID: new IDs are appended, changed rows
+        replaced and deleted IDs dropped. Within the delta the last row
+        for an ID wins and a tombstone wins over a row.
+        Returns (store, changes). Pure additions are appended to this
+        store in place; updates and deletes are applied to a copy so
+        readers of this store never see a half-applied merge.
+        """
+        deleted_ids = list(dict.fromkeys(deleted_ids))
+        delta_ids = delta.order_ids[:len(delta)]
+        rows = np.flatnonzero(~pd.Index(delta_ids).duplicated(keep='last')
+                              & ~np.isin(delta_ids, np.asarray(deleted_ids, dtype=str)))
+        positions = self.locate(delta_ids[rows])
+        existing = positions >= 0
+        new_rows, old_rows, old_positions = rows[~existing], rows[existing], positions[existing]
+
+        # Only rows that differ from what is stored count as updates
+        changed = delta.quantities[old_rows] != self.quantities[old_positions]
+        for column in CODED_COLUMNS:
+            changed |= self._recode(delta, column, old_rows) != \
+                self.codes[column][old_positions]
+        for column in DATE_COLUMNS:
+            new, old = delta.dates[column][old_rows], self.dates[column][old_positions]
+            changed |= (new != old) & ~(np.isnat(new) & np.isnat(old))
+        old_rows, old_positions = old_rows[changed], old_positions[changed]
+
+        removed = self.locate(deleted_ids)
+        target = self
+        if len(old_rows) or (removed >= 0).any():
+            keep = np.ones(self._size, dtype=bool)
+            keep[removed[removed >= 0]] = False
+            target = self.select(keep)
+            # Positions shift down past each removed row
+            target._write((np.cumsum(keep) - 1)[old_positions], delta, old_rows)
+
+        with target._lock:
+            size = target._size + len(new_rows)
+            if size > len(target.order_ids):
+                target._grow(max(size, 2 * target._size))
+            target._write(np.arange(target._size, size), delta, new_rows)
+            target._size = size
+            target._groups = {}
+
+        changes = {
+            'added': [str(i) for i in delta.order_ids[new_rows]],
+            'updated': [str(i) for i in delta.order_ids[old_rows]],
+            'deleted': [i for i, p in zip(deleted_ids, removed) if p >= 0]
+        }
+        return target, changes
+
+    def _grow(self, capacity: int):
+        def resized(array):
+            grown = np.empty(capacity, dtype=array.dtype)
+            grown[:self._size] = array[:self._size]
+            return grown
+
+        self.order_ids = resized(self.order_ids)
+        self.codes = {c: resized(a) for c, a in self.codes.items()}
+        self.quantities = resized(self.quantities)
+        self.dates = {c: resized(a) for c, a in self.dates.items()}
+
+    def _code(self, column: str, value: str) -> int:
+        codes = self._code_of[column]
+        if value not in codes:
+            codes[value] = len(self.vocabularies[column])
+            self.vocabularies[column].append(value)
+        return codes[value]
+
+    def column(self, column: str) -> np.ndarray:
+        """Codes of a dictionary-encoded column for the stored rows"""
+        return self.codes[column][:self._size]
+
+    def _cached_grouping(self, column: str, build: Callable[[np.ndarray], tuple]) -> tuple:
+        """
+        build(stored values of column), cached until rows are added
+        Built under the write lock and tagged with the row count it was
+        built for, so a reader racing a writer never keeps a stale one
+        """
+        with self._lock:
+            cached = self._groups.get(column)
+            if cached is None or cached[0] != self._size:
+                values = self.order_ids if column == 'order_id' else self.codes[column]
+                cached = (self._size, build(values[:self._size]))
+                self._groups[column] = cached
+            return cached[1]
+
+    def _grouping(self, column: str) -> tuple:
+        def build(codes):
+            order = np.argsort(codes, kind='stable')
+            starts = np.searchsorted(codes[order],
+                                     np.arange(len(self.vocabularies[column]) + 1))
+            return order, starts
+        return self._cached_grouping(column, build)
+
+    def positions(self, column: str, values: Iterable[str]) -> np.ndarray:
+        """
+        Ascending row positions whose column equals any of the values,
+        read from a per-column grouping rather than scanning every row
+        """
+        order, starts = self._grouping(column)
+        # Codes added after the grouping was built have no rows in it
+        codes = [c for c in (self._code_of[column].get(v) for v in values)
+                 if c is not None and c + 1 < len(starts)]
+        if not codes:
+            return np.zeros(0, dtype=np.intp)
+        positions = np.concatenate([order[starts[c]:starts[c + 1]] for c in codes])
+        return positions if len(codes) == 1 else np.sort(positions)
+
+    def matching_values(self, column: str, predicate: Callable[[str], bool]) -> List[str]:
+        """Distinct values of a coded column accepted by the predicate"""
+        return [v for v in self.vocabularies[column] if predicate(v)]
+
+    def mask(self, hospital_id: str = None, provider_id: str = None,
+             device_names: Iterable[str] = None,
+             start_date: str = None, end_date: str = None) -> np.ndarray:
+        """
+        Boolean row mask for the given filters, combined with AND
+        Dates filter order_date within [start_date, end_date]
+        """
+        mask = np.ones(self._size, dtype=bool)
+        for column, value in (('hospital_id', hospital_id), ('provider_id', provider_id)):
+            if value is not None:
+                mask &= self.column(column) == self._code_of[column].get(value, -1)
+        if device_names is not None:
+            codes = [self._code_of['device_name'][v] for v in device_names
+                     if v in self._code_of['device_name']]
+            mask &= np.isin(self.column('device_name'), codes)
+        order_dates = self.dates['order_date'][:self._size]
+        if start_date is not None:
+            mask &= order_dates >= np.datetime64(start_date, 'D')
+        if end_date is not None:
+            mask &= order_dates <= np.datetime64(end_date, 'D')
+        return mask
+
+    def filter(self, **filters) -> List[Order]:
+        """Order views for the rows matching mask(**filters)"""
+        return self.take(np.flatnonzero(self.mask(**filters)))
+
+
+def as_store(orders) -> Optional[OrderStore]:
+    """Wrap a list of orders in a store (stores pass through)"""
+    if orders is None or isinstance(orders, OrderStore):
+        return orders
+    return OrderStore.from_orders(orders)
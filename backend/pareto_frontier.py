@@ -0,0 +1,159 @@
+"""Cached risk/carbon trade-off per hospital for instant α/β re-ranking"""
+import threading
+import time
+import numpy as np
+from collections import OrderedDict
+from dataclasses import replace
+from typing import Dict, List, Optional
+from models import RouteRecommendation
+from scoring_engine import ScoringEngine, top_k_indices
+from config import Config
+
+
+def pareto_frontier(flood_risk: np.ndarray, normalized_carbon: np.ndarray) -> np.ndarray:
+    """
+    Indices of the points no other point beats on both risk and carbon,
+    ordered by increasing flood risk (and so decreasing carbon)
+    """
+    flood_risk = np.asarray(flood_risk, dtype=float)
+    normalized_carbon = np.asarray(normalized_carbon, dtype=float)
+    if not len(flood_risk):
+        return np.zeros(0, dtype=np.intp)
+
+    order = np.lexsort((normalized_carbon, flood_risk))
+    carbon = normalized_carbon[order]
+    # A point is on the frontier if it has less carbon than every point
+    # with lower (or equal) risk before it
+    best_before = np.minimum.accumulate(np.concatenate(([np.inf], carbon[:-1])))
+    return order[carbon < best_before]
+
+
+class Frontier:
+    """
+    Every provider's recommendation for one hospital and device, with the
+    (flood_risk, normalized_carbon) vectors needed to re-rank them for
+    any α/β without lookups
+    """
+
+    def __init__(self, recommendations: List[RouteRecommendation], engine=None):
+        self.recommendations = recommendations
+        self.engine = engine
+        self.created_at = time.time()
+        hospital = recommendations[0].hospital if recommendations else None
+        self.latitude = hospital.latitude if hospital else None
+        self.longitude = hospital.longitude if hospital else None
+        self.degraded = any(r.degraded for r in recommendations)
+        # Providers whose polyline was already asked for, found or not
+        self.polylines_requested = set()
+
+        # (providers, 2) matrix so a score is one dot product per provider
+        self.vectors = np.column_stack((
+            np.array([r.flood_risk for r in recommendations], dtype=float),
+            ScoringEngine.normalize_carbon([r.carbon_emission_kg for r in recommendations])
+        )) if recommendations else np.zeros((0, 2))
+        self.frontier = pareto_frontier(self.vectors[:, 0], self.vectors[:, 1])
+
+    def __len__(self):
+        return len(self.recommendations)
+
+    def add_polylines(self, polylines: Dict[str, str], requested=()):
+        """
+        Keep route polylines fetched later, by provider ID, and remember
+        the requested providers so they are not asked for again
+        """
+        self.polylines_requested.update(requested)
+        # Swap in a new list so concurrent readers see one or the other
+        self.recommendations = [
+            replace(r, route_polyline=polylines[r.provider.provider_id])
+            if r.route_polyline is None and r.provider.provider_id in polylines else r
+            for r in self.recommendations
+        ]
+
+    def scores(self, alpha: float = None, beta: float = None) -> np.ndarray:
+        """Weighted score of every provider for the given α/β"""
+        if alpha is None:
+            alpha = Config.DEFAULT_ALPHA
+        if beta is None:
+            beta = Config.DEFAULT_BETA
+        return self.vectors @ np.array([alpha, beta], dtype=float)
+
+    def rank(self, alpha: float = None, beta: float = None,
+             limit: int = None) -> List[RouteRecommendation]:
+        """Recommendations ranked for the given α/β, best first"""
+        scores = self.scores(alpha, beta)
+        return [
+            replace(self.recommendations[i], weighted_score=float(scores[i]))
+            for i in top_k_indices(scores, limit)
+        ]
+
+    def frontier_recommendations(self, alpha: float = None,
+                                 beta: float = None) -> List[RouteRecommendation]:
+        """Recommendations on the Pareto frontier, lowest flood risk first"""
+        scores = self.scores(alpha, beta)
+        return [
+            replace(self.recommendations[i], weighted_score=float(scores[i]))
+            for i in self.frontier
+        ]
+
+
+class FrontierCache:
+    """
+    LRU cache of frontiers keyed by (hospital ID, device)
+    Entries expire after a TTL, when the hospital moves or when the
+    provider catalog they were built from is replaced
+    """
+
+    def __init__(self, max_entries: int = None, ttl_seconds: float = None):
+        self.max_entries = max_entries or Config.FRONTIER_CACHE_MAX_ENTRIES
+        self.ttl_seconds = Config.FRONTIER_CACHE_TTL_SECONDS if ttl_seconds is None \
+            else ttl_seconds
+        self._entries: "OrderedDict[tuple, Frontier]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: tuple, hospital, engine=None) -> Optional[Frontier]:
+        with self._lock:
+            frontier = self._entries.get(key)
+            if frontier is not None and (
+                    time.time() - frontier.created_at > self.ttl_seconds
+                    or (engine is not None and frontier.engine is not engine)
+                    or (frontier.latitude is not None and (
+                        frontier.latitude != hospital.latitude
+                        or frontier.longitude != hospital.longitude))):
+                del self._entries[key]
+                frontier = None
+            if frontier is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return frontier
+
+    def put(self, key: tuple, frontier: Frontier):
+        with self._lock:
+            self._entries[key] = frontier
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, hospital_ids) -> None:
+        """Drop the frontiers of the given hospitals"""
+        hospital_ids = set(hospital_ids)
+        with self._lock:
+            for key in [k for k in self._entries if k[0] in hospital_ids]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses
+        }
@@ -0,0 +1,95 @@
+"""Per-location daily precipitation store"""
+import threading
+import time
+import numpy as np
+from collections import OrderedDict
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+
+def date_range(start: date, end: date) -> List[date]:
+    """Days from start (inclusive) to end (exclusive)"""
+    return [start + timedelta(days=i) for i in range((end - start).days)]
+
+
+class PrecipitationStore:
+    """
+    Daily precipitation totals per location, keyed by coordinates rounded
+    to a fixed precision. Past rainfall does not change, so stored days
+    are kept and only days not seen yet need to be fetched; any N-day
+    window is answered by summing stored dailies.
+    Days that were fetched but had no data yet (the dataset lags) are not
+    asked for again until negative_ttl_seconds have passed.
+    """
+
+    def __init__(self, precision: int = 2, max_locations: int = 10000,
+                 negative_ttl_seconds: float = 3600):
+        self.precision = precision
+        self.max_locations = max_locations
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self._series: 'OrderedDict[Tuple[float, float], Dict[date, float]]' = OrderedDict()
+        # Per location: day -> time after which a day without data is retried
+        self._retry_after: Dict[Tuple[float, float], Dict[date, float]] = {}
+        self._lock = threading.Lock()
+
+    def key(self, latitude: float, longitude: float) -> Tuple[float, float]:
+        return round(latitude, self.precision), round(longitude, self.precision)
+
+    def __len__(self):
+        return len(self._series)
+
+    def missing_days(self, latitude: float, longitude: float,
+                     start: date, end: date) -> List[date]:
+        """Days in [start, end) with no stored value that are due a fetch"""
+        key = self.key(latitude, longitude)
+        now = time.time()
+        with self._lock:
+            series = self._series.get(key, {})
+            retry_after = self._retry_after.get(key, {})
+            return [day for day in date_range(start, end)
+                    if day not in series and retry_after.get(day, 0.0) <= now]
+
+    def add(self, latitude: float, longitude: float, values: Dict[date, float],
+            fetched_days: List[date] = ()):
+        """
+        Store daily values (mm) for a location; fetched_days without a
+        value are remembered as not published yet
+        """
+        key = self.key(latitude, longitude)
+        retry_at = time.time() + self.negative_ttl_seconds
+        with self._lock:
+            series = self._series.setdefault(key, {})
+            series.update(values)
+            retry_after = self._retry_after.setdefault(key, {})
+            for day in values:
+                retry_after.pop(day, None)
+            for day in fetched_days:
+                if day not in series:
+                    retry_after[day] = retry_at
+            if not retry_after:
+                del self._retry_after[key]
+            self._series.move_to_end(key)
+            while len(self._series) > self.max_locations:
+                evicted, _ = self._series.popitem(last=False)
+                self._retry_after.pop(evicted, None)
+
+    def daily_values(self, latitude: float, longitude: float,
+                     start: date, end: date) -> np.ndarray:
+        """Daily values for [start, end) as an array, NaN where missing"""
+        with self._lock:
+            series = self._series.get(self.key(latitude, longitude), {})
+            return np.array([series.get(day, np.nan) for day in date_range(start, end)],
+                            dtype=float)
+
+    def window_total(self, latitude: float, longitude: float,
+                     start: date, end: date) -> Tuple[Optional[float], int]:
+        """
+        (total precipitation over the stored days of [start, end), number
+        of days in the window with no stored value); the total is None if
+        none of them are stored
+        """
+        values = self.daily_values(latitude, longitude, start, end)
+        missing = int(np.isnan(values).sum())
+        if missing == len(values):
+            return None, missing
+        return float(np.nansum(values)), missing
@@ -19,9 +19,53 @@ PRODUCT_SUBSTITUTES = {
 }
 
 
+def normalize_product_name(product: str) -> str:
+    """Canonical form of a product name: case-folded, single-spaced"""
+    return ' '.join(str(product).split()).casefold()
+
+
+def build_substitute_closure(substitutes: dict = None) -> dict:
+    """
+    Transitive substitute closure keyed by normalized product name
+    A substitute of a substitute is also accepted. Each entry maps the
+    normalized name of every product reachable from it (itself excluded)
+    to its display name.
+    """
+    if substitutes is None:
+        substitutes = PRODUCT_SUBSTITUTES
+    
+    display = {}
+    edges = {}
+    for product, subs in substitutes.items():
+        key = normalize_product_name(product)
+        display.setdefault(key, product)
+        for sub in subs:
+            display.setdefault(normalize_product_name(sub), sub)
+        edges.setdefault(key, []).extend(normalize_product_name(sub) for sub in subs)
+    
+    closure = {}
+    for start in edges:
+        seen = {start}
+        stack = [start]
+        while stack:
+            for nxt in edges.get(stack.pop(), ()):
+                if nxt not in seen:
+                    seen.add(nxt)
+                    stack.append(nxt)
+        seen.discard(start)
+        closure[start] = {key: display[key] for key in sorted(seen)}
+    return closure
+
+
+# Precomputed once at import; normalized product -> all acceptable substitutes
+SUBSTITUTE_CLOSURE = build_substitute_closure()
+
+
 def get_product_with_substitutes(product: str) -> list:
     """
     Get a list containing the original product and its substitutes
+    Substitutes are followed transitively and names matched ignoring
+    case and extra whitespace
     
     Args:
         product: The product name
@@ -35,8 +79,7 @@ def get_product_with_substitutes(product: str) -> list:
     products = [product]
     
     # Add substitutes if they exist
-    if product in PRODUCT_SUBSTITUTES:
-        products.extend(PRODUCT_SUBSTITUTES[product])
+    products.extend(SUBSTITUTE_CLOSURE.get(normalize_product_name(product), {}).values())
     
     return products
 
@@ -52,11 +95,9 @@ def is_substitute(original_product: str, offered_product: str) -> bool:
     Returns:
         True if offered_product is a substitute for original_product
     """
-    if original_product == offered_product:
+    original = normalize_product_name(original_product)
+    offered = normalize_product_name(offered_product)
+    if original == offered:
         return False  # Not a substitute, it's the same product
     
-    if original_product in PRODUCT_SUBSTITUTES:
-        return offered_product in PRODUCT_SUBSTITUTES[original_product]
-    
-    return False
-
+    return offered in SUBSTITUTE_CLOSURE.get(original, {})
@@ -1,55 +1,120 @@
 """Recommendation service for optimal supplier selection"""
+import time
+import numpy as np
+from dataclasses import replace
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError, \
+    as_completed
+from functools import partial
 from typing import List, Optional
 from models import Hospital, Provider, RouteRecommendation
-from gee_service import GEEService
+from gee_service import GEEService, FALLBACK_SUSCEPTIBILITY, get_gee_service
 from fema_service import FEMAService
 from route_service import RouteService
+from route_matrix import RouteMatrix
+from risk_scheduler import RiskTable, HOSPITAL, PROVIDER
+from scoring_engine import ScoringEngine, top_k_indices
 from config import Config
-from product_substitutes import get_product_with_substitutes, is_substitute
+from device_index import DeviceIndex
+from basket_optimizer import solve_basket, assign_devices
+from pareto_frontier import Frontier, FrontierCache
+from product_substitutes import is_substitute, normalize_product_name
 
 
 class RecommendationService:
     """Service for generating supplier recommendations based on risk and emissions"""
     
-    def __init__(self):
-        self.gee_service = GEEService()
-        self.fema_service = FEMAService()
-        self.route_service = RouteService()
+    def __init__(self, gee_service: GEEService = None,
+                 fema_service: FEMAService = None,
+                 route_service: RouteService = None,
+                 route_matrix: RouteMatrix = None,
+                 risk_table: RiskTable = None,
+                 device_index: DeviceIndex = None):
+        self.gee_service = gee_service or get_gee_service()
+        self.fema_service = fema_service or FEMAService()
+        self.route_service = route_service or RouteService()
+        self.route_matrix = route_matrix or RouteMatrix(
+            self.route_service, Config.ROUTE_MATRIX_PATH,
+            Config.ROUTE_MATRIX_SAVE_DELAY_SECONDS
+        )
+        # Precomputed risk for known hospitals and providers; without it
+        # risk is computed on demand
+        self.risk_table = risk_table
+        
+        # Device -> provider index for the current catalog
+        self.device_index = device_index
+        
+        # Per hospital and device trade-off vectors for α/β re-ranking
+        self.frontier_cache = FrontierCache()
+        
+        # Scoring engine for the provider catalog it was built from
+        self.scoring_engine: Optional[ScoringEngine] = None
+        self._engine_providers: Optional[List[Provider]] = None
+    
+    def get_entity_risk_details(self, kind: str, entities: List) -> List[dict]:
+        """
+        FEMA zone, GEE susceptibility and combined risk for known hospitals
+        or providers (kind 'hospital' or 'provider')
+        With a risk table, published entries are used and entities not
+        scored yet get a provisional FEMA-only estimate instead of waiting
+        on Earth Engine; without one, risk is computed on demand
+        """
+        if not entities:
+            return []
+        
+        if self.risk_table is None:
+            coordinates = [(e.latitude, e.longitude) for e in entities]
+            zones = self.fema_service.get_flood_zones(coordinates)
+            susceptibility = self.gee_service.get_flood_susceptibility_bulk(coordinates)
+            return [{
+                'fema': zone,
+                'gee_susceptibility': gee,
+                'risk_score': self.fema_service.combine_risk_score(zone['risk_score'], gee),
+                'pending': False
+            } for zone, gee in zip(zones, susceptibility)]
+        
+        details = [
+            None if entry is None else {**entry, 'pending': False}
+            for entry in self.risk_table.get_entries(kind, entities)
+        ]
+        pending = [i for i, entry in enumerate(details) if entry is None]
+        if pending:
+            zones = self.fema_service.get_flood_zones(
+                [(entities[i].latitude, entities[i].longitude) for i in pending]
+            )
+            for i, zone in zip(pending, zones):
+                details[i] = {
+                    'fema': zone,
+                    'gee_susceptibility': FALLBACK_SUSCEPTIBILITY,
+                    'risk_score': self.fema_service.combine_risk_score(
+                        zone['risk_score'], FALLBACK_SUSCEPTIBILITY
+                    ),
+                    'pending': True
+                }
+        return details
+    
+    def get_entity_risks(self, kind: str, entities: List) -> np.ndarray:
+        """Combined flood risk for known hospitals or providers"""
+        return self._entity_risks(kind, entities)[0]
+    
+    def _entity_risks(self, kind: str, entities: List) -> tuple:
+        """Combined flood risk for known entities and which are provisional"""
+        details = self.get_entity_risk_details(kind, entities)
+        return (np.array([d['risk_score'] for d in details], dtype=float),
+                np.array([d['pending'] for d in details], dtype=bool))
     
     def calculate_flood_risk(self, provider: Provider, hospital: Hospital) -> float:
         """
         Calculate combined flood risk for a route
         Combines FEMA static data and GEE dynamic data
         """
-        # Get FEMA risk for both locations
-        provider_fema = self.fema_service.get_flood_zone(
-            provider.latitude, provider.longitude
-        )
-        hospital_fema = self.fema_service.get_flood_zone(
-            hospital.latitude, hospital.longitude
-        )
-        
-        # Get GEE risk for both locations
-        provider_gee = self.gee_service.get_flood_susceptibility(
-            provider.latitude, provider.longitude
-        )
-        hospital_gee = self.gee_service.get_flood_susceptibility(
-            hospital.latitude, hospital.longitude
-        )
-        
-        # Combine FEMA and GEE scores for each location
-        provider_risk = self.fema_service.combine_risk_score(
-            provider_fema['risk_score'], provider_gee
-        )
-        hospital_risk = self.fema_service.combine_risk_score(
-            hospital_fema['risk_score'], hospital_gee
-        )
+        provider_risk = self.get_entity_risks(PROVIDER, [provider])[0]
+        hospital_risk = self.get_entity_risks(HOSPITAL, [hospital])[0]
         
         # Route risk is the maximum of the two endpoints
         # (weakest link in the chain)
         route_risk = max(provider_risk, hospital_risk)
         
-        return route_risk
+        return float(route_risk)
     
     def calculate_weighted_score(self, flood_risk: float, 
                                  carbon_emission: float,
@@ -83,87 +148,683 @@ class RecommendationService:
         Generate ranked recommendations for suppliers to a hospital
         Optionally filter by device if specified (includes substitutes)
         """
-        recommendations = []
+        return self.generate_batch_recommendations([{
+            'hospital': hospital,
+            'alpha': alpha,
+            'beta': beta,
+            'limit': limit,
+            'device': device
+        }], providers)[0]
+    
+    def generate_batch_recommendations(self, hospital_requests: List[dict],
+                                       providers: List[Provider],
+                                       deadline_seconds: float = None
+                                       ) -> List[List[RouteRecommendation]]:
+        """
+        Generate ranked recommendations for many hospitals in one pass
+        Each request is a dict with 'hospital' and optional 'device',
+        'alpha', 'beta' and 'limit'. Device filtering, provider risk and
+        route lookups are shared across hospitals; results are returned
+        in request order.
+        Risk and route lookups run concurrently; whatever is not back
+        within deadline_seconds is scored with fallback values and the
+        affected recommendations are flagged as degraded.
+        """
+        if not hospital_requests:
+            return []
+        
+        if deadline_seconds is None:
+            deadline_seconds = Config.RECOMMENDATION_DEADLINE_SECONDS
+        deadline = time.monotonic() + deadline_seconds
+        plan = self._plan(hospital_requests, providers)
+        state = self._evaluate(plan, deadline)
+        scored = self._score(plan, state)
+        self._log_rankings(plan, scored)
+        polylines = self._fetch_polylines(plan, scored['rankings'], deadline)
+        return self._build(plan, state, scored, polylines)
+    
+    def generate_basket(self, hospital: Hospital,
+                        providers: List[Provider],
+                        devices: List[str],
+                        alpha: float = None,
+                        beta: float = None,
+                        deadline_seconds: float = None) -> dict:
+        """
+        Source a basket of devices (substitutes allowed) for one hospital
+        Chooses the set of providers covering every device with the lowest
+        total weighted score plus a penalty per shipment, then assigns each
+        device to the best chosen provider supplying it.
+        Returns a dict with one recommendation (or None) per device, the
+        chosen provider IDs, the total score and the unavailable devices.
+        """
+        if deadline_seconds is None:
+            deadline_seconds = Config.RECOMMENDATION_DEADLINE_SECONDS
+        deadline = time.monotonic() + deadline_seconds
+        plan = self._plan([{
+            'hospital': hospital,
+            'alpha': alpha,
+            'beta': beta,
+            'limit': None,
+            'device': device
+        } for device in devices], providers)
+        state = self._evaluate(plan, deadline)
+        scored = self._score(plan, state)
+        
+        # One cost per provider column, and which devices each column covers
+        matrix = scored['matrix']
+        costs = plan['engine'].weighted_scores(
+            matrix['flood_risk'][0], matrix['carbon_emission_kg'][0], alpha, beta
+        )
+        coverage = np.zeros((len(plan['columns']), len(devices)), dtype=bool)
+        for d, (_, _, cols, _, _) in enumerate(scored['rankings']):
+            coverage[cols, d] = True
+        
+        available = np.flatnonzero(coverage.any(axis=0))
+        chosen = solve_basket(costs, coverage[:, available],
+                              Config.BASKET_SHIPMENT_PENALTY,
+                              Config.BASKET_EXACT_MAX_DEVICES)
+        assigned = dict(zip(available.tolist(),
+                            assign_devices(chosen, costs, coverage[:, available])))
+        
+        # Each device's ranking keeps only its assigned provider
+        rankings = []
+        for d, (h, rows, cols, scores, _) in enumerate(scored['rankings']):
+            winners = np.flatnonzero(cols == assigned[d]) if d in assigned else \
+                np.zeros(0, dtype=np.intp)
+            rankings.append((h, rows, cols, scores, winners))
+        scored = {**scored, 'rankings': rankings}
+        
+        polylines = self._fetch_polylines(plan, rankings, deadline)
+        results = self._build(plan, state, scored, polylines)
+        columns = plan['columns']
+        return {
+            'recommendations': [recs[0] if recs else None for recs in results],
+            'providers': [plan['engine'].providers[columns[c]].provider_id for c in chosen],
+            'total_score': float(costs[chosen].sum()),
+            'unavailable': [device for d, device in enumerate(devices) if d not in assigned]
+        }
+    
+    def get_frontier(self, hospital: Hospital,
+                     providers: List[Provider],
+                     device: str = None,
+                     deadline_seconds: float = None) -> Frontier:
+        """
+        Risk/carbon trade-off of every provider for a hospital and device
+        Built once with all route and risk lookups, then served from the
+        frontier cache so re-ranking for new α/β needs no lookups.
+        Frontiers with degraded entries are not cached.
+        """
+        engine = self.get_scoring_engine(providers)
+        key = (hospital.hospital_id, normalize_product_name(device or ''))
+        frontier = self.frontier_cache.get(key, hospital, engine)
+        if frontier is not None:
+            return frontier
+        
+        if deadline_seconds is None:
+            deadline_seconds = Config.RECOMMENDATION_DEADLINE_SECONDS
+        deadline = time.monotonic() + deadline_seconds
+        plan = self._plan([{'hospital': hospital, 'limit': None, 'device': device}],
+                          providers)
+        state = self._evaluate(plan, deadline)
+        scored = self._score(plan, state)
+        # Polylines come from what is stored; only the top few get drawn
+        polylines = self._stored_polylines(plan, scored['rankings'])
+        frontier = Frontier(self._build(plan, state, scored, polylines)[0], engine)
+        if not frontier.degraded:
+            self.frontier_cache.put(key, frontier)
+        return frontier
+    
+    def rank_frontier(self, frontier: Frontier,
+                      alpha: float = None,
+                      beta: float = None,
+                      limit: int = None,
+                      deadline_seconds: float = None) -> List[RouteRecommendation]:
+        """
+        Recommendations for new α/β from a frontier, as generate_recommendations
+        would return them. With a limit, polylines the frontier does not
+        hold yet are fetched for the returned routes, at most once per
+        provider (misses are not retried), and kept on the frontier;
+        without one, only stored polylines are used
+        """
+        ranked = frontier.rank(alpha, beta, limit)
+        missing = [r for r in ranked if r.route_polyline is None] if limit else []
+        if not missing:
+            return ranked
+        
+        # Routes asked for before only get what has been stored since
+        stored = [r for r in missing if r.provider.provider_id in frontier.polylines_requested]
+        missing = [r for r in missing if r.provider.provider_id not in frontier.polylines_requested]
+        polylines = {
+            r.provider.provider_id: self.route_matrix.polylines(
+                r.hospital, [r.provider], fetch=False)[0]
+            for r in stored
+        }
+        
+        if missing:
+            if deadline_seconds is None:
+                deadline_seconds = Config.RECOMMENDATION_DEADLINE_SECONDS
+            fetched = self._gather([
+                partial(self.route_matrix.polylines, r.hospital, [r.provider])
+                for r in missing
+            ], time.monotonic() + deadline_seconds)
+            polylines.update({
+                r.provider.provider_id: result[0]
+                for r, (done, result) in zip(missing, fetched) if done
+            })
+        polylines = {provider_id: p for provider_id, p in polylines.items() if p}
+        frontier.add_polylines(polylines, [r.provider.provider_id for r in missing])
+        if not polylines:
+            return ranked
+        return [
+            replace(r, route_polyline=polylines.get(r.provider.provider_id, r.route_polyline))
+            for r in ranked
+        ]
+    
+    def _evaluate(self, plan: dict, deadline: float) -> dict:
+        """
+        Look up risk and routes for a plan until every request is settled
+        or the deadline passes; returns the lookup state
+        """
+        engine, columns, hospitals = plan['engine'], plan['columns'], plan['hospitals']
+        state = self._empty_state(plan)
         
-        # Filter providers by device if specified (including substitutes)
-        if device and device.strip():
-            # Get the device and its acceptable substitutes
-            acceptable_products = get_product_with_substitutes(device)
-            print(f"Looking for providers that supply: {acceptable_products}")
+        # Providers are evaluated in waves, best lower bound first; a wave
+        # gathers provider risk, hospital risk (first wave only) and one
+        # route lookup per hospital concurrently, and providers whose bound
+        # cannot beat the current k-th best score are never looked up
+        requested = np.zeros(state['distances'].shape, dtype=bool)
+        pending = self._next_candidates(plan, state, requested)
+        first_wave = True
+        while any(len(cols) for cols in pending) and (
+                first_wave or time.monotonic() < deadline):
+            wave_columns = np.unique(np.concatenate(pending))
+            lookups = [h for h, cols in enumerate(pending) if len(cols)]
+            calls = [partial(self._refresh_provider_risk, engine, columns[wave_columns])]
+            if first_wave:
+                calls.append(partial(self._entity_risks, HOSPITAL, hospitals))
+            calls += [
+                partial(self.route_matrix.lookup, hospitals[h],
+                        [engine.providers[row] for row in columns[pending[h]]])
+                for h in lookups
+            ]
+            gathered = self._gather(calls, deadline)
             
-            # Filter providers and track which product they offer
-            provider_product_map = {}
-            for provider in providers:
-                if provider.devices_supplied:
-                    # Check if provider supplies any of the acceptable products
-                    for supplied in provider.devices_supplied:
-                        if supplied in acceptable_products:
-                            provider_product_map[provider.provider_id] = supplied
-                            print(f"✓ {provider.provider_id} matches: {supplied}")
-                            break
+            if first_wave:
+                done, hospital_risks = gathered[1]
+                if done:
+                    state['hospital_risks'][:], state['hospital_provisional'][:] = \
+                        hospital_risks
+            route_results = gathered[2 if first_wave else 1:]
+            for h, (done, routes) in zip(lookups, route_results):
+                requested[h, pending[h]] = True
+                if done:
+                    self._apply_routes(state, h, pending[h], routes)
             
-            filtered_providers = [p for p in providers if p.provider_id in provider_product_map]
-            print(f"Filtered to {len(filtered_providers)} providers (including substitutes)")
-            print(f"Filtered providers: {[p.provider_id for p in filtered_providers]}")
-        else:
-            filtered_providers = providers
-            provider_product_map = {}
-        
-        for provider in filtered_providers:
-            # Get route details
-            route_details = self.route_service.get_route_details(
-                provider.latitude,
-                provider.longitude,
-                hospital.latitude,
-                hospital.longitude,
-                provider.transport_mode
+            first_wave = False
+            pending = self._next_candidates(plan, state, requested)
+        
+        return state
+    
+    def stream_recommendations(self, hospital: Hospital,
+                               providers: List[Provider],
+                               alpha: float = None,
+                               beta: float = None,
+                               limit: int = None,
+                               device: str = None,
+                               deadline_seconds: float = None):
+        """
+        Generate recommendations for one hospital progressively
+        Yields ('provisional', recommendations) straight away from
+        straight-line distances and cached or fallback risk, then
+        ('refined', recommendations) each time a risk lookup or a chunk of
+        route lookups completes, and finally ('final', recommendations)
+        with polylines, as generate_recommendations would return
+        """
+        if deadline_seconds is None:
+            deadline_seconds = Config.RECOMMENDATION_DEADLINE_SECONDS
+        deadline = time.monotonic() + deadline_seconds
+        plan = self._plan([{
+            'hospital': hospital,
+            'alpha': alpha,
+            'beta': beta,
+            'limit': limit,
+            'device': device
+        }], providers)
+        engine, columns = plan['engine'], plan['columns']
+        cols = plan['hospital_columns'][0]
+        state = self._empty_state(plan)
+        
+        def snapshot():
+            scored = self._score(plan, state)
+            polylines = self._stored_polylines(plan, scored['rankings'])
+            return self._build(plan, state, scored, polylines)[0]
+        
+        yield 'provisional', snapshot()
+        
+        # Route lookups go out in distance matrix sized chunks so results
+        # arrive progressively instead of with the slowest provider
+        size = Config.DISTANCE_MATRIX_MAX_ORIGINS
+        tasks = [
+            ('provider_risk', None, partial(self._refresh_provider_risk, engine, columns)),
+            ('hospital_risk', None, partial(self._entity_risks, HOSPITAL, [hospital]))
+        ]
+        for start in range(0, len(cols), size):
+            chunk = cols[start:start + size]
+            tasks.append(('routes', chunk, partial(
+                self.route_matrix.lookup, hospital,
+                [engine.providers[row] for row in columns[chunk]]
+            )))
+        
+        for kind, chunk, result in self._as_completed(tasks, deadline):
+            if kind == 'hospital_risk':
+                state['hospital_risks'][:], state['hospital_provisional'][:] = result
+            elif kind == 'routes':
+                self._apply_routes(state, 0, chunk, result)
+            yield 'refined', snapshot()
+        
+        scored = self._score(plan, state)
+        self._log_rankings(plan, scored)
+        polylines = self._fetch_polylines(plan, scored['rankings'], deadline)
+        yield 'final', self._build(plan, state, scored, polylines)[0]
+    
+    def _plan(self, hospital_requests: List[dict], providers: List[Provider]) -> dict:
+        """
+        Work shared by the requests of a batch: providers per device, the
+        union of provider columns and the distinct hospital rows of the
+        cost matrix, and the columns each hospital needs
+        """
+        engine = self.get_scoring_engine(providers)
+        
+        # Device filtering is done once per distinct device
+        device_filters = {}
+        for req in hospital_requests:
+            key = (req.get('device') or '').strip()
+            if key not in device_filters:
+                filtered_providers, provider_product_map = self._filter_providers(
+                    providers, req.get('device')
+                )
+                device_filters[key] = (
+                    engine.rows_for(filtered_providers), provider_product_map
+                )
+        
+        # Columns of the cost matrix: every provider any request can use
+        columns = np.unique(np.concatenate(
+            [rows for rows, _ in device_filters.values()]
+        ))
+        
+        # Rows of the cost matrix: every distinct hospital
+        hospitals = []
+        hospital_rows = {}
+        for req in hospital_requests:
+            hospital = req['hospital']
+            if hospital.hospital_id not in hospital_rows:
+                hospital_rows[hospital.hospital_id] = len(hospitals)
+                hospitals.append(hospital)
+        
+        # Routes are only looked up for the pairs some request needs
+        hospital_columns = [set() for _ in hospitals]
+        for req in hospital_requests:
+            rows, _ = device_filters[(req.get('device') or '').strip()]
+            hospital_columns[hospital_rows[req['hospital'].hospital_id]].update(
+                np.searchsorted(columns, rows).tolist()
             )
+        
+        return {
+            'requests': hospital_requests,
+            'engine': engine,
+            'device_filters': device_filters,
+            'columns': columns,
+            'hospitals': hospitals,
+            'hospital_rows': hospital_rows,
+            'hospital_columns': [np.array(sorted(c), dtype=np.intp) for c in hospital_columns]
+        }
+    
+    @staticmethod
+    def _empty_state(plan: dict) -> dict:
+        """Lookup results for a plan before anything has arrived"""
+        shape = (len(plan['hospitals']), len(plan['columns']))
+        return {
+            'hospital_risks': np.full(shape[0], np.nan),
+            # Hospital risks that are provisional FEMA-only estimates
+            'hospital_provisional': np.zeros(shape[0], dtype=bool),
+            # Road distances (NaN where unknown, engine falls back to haversine)
+            'distances': np.full(shape, np.nan),
+            'durations': np.full(shape, None, dtype=object),
+            'routes_known': np.zeros(shape, dtype=bool)
+        }
+    
+    @staticmethod
+    def _apply_routes(state: dict, h: int, cols: np.ndarray, routes: dict):
+        """Record a route matrix lookup for one hospital's columns"""
+        state['distances'][h, cols] = routes['distance_km']
+        state['durations'][h, cols] = routes['duration_text']
+        state['routes_known'][h, cols] = True
+    
+    def _next_candidates(self, plan: dict, state: dict,
+                         requested: np.ndarray) -> List[np.ndarray]:
+        """
+        Columns to look up next for each hospital
+        For every request with a limit, providers not looked up yet are
+        ordered by their score lower bound; those whose bound exceeds the
+        k-th best score found so far are pruned (recorded in the state so
+        ranking skips them) and the best remaining ones form the next wave
+        """
+        engine, columns = plan['engine'], plan['columns']
+        hospital_risks = np.nan_to_num(state['hospital_risks'], nan=0.0)
+        scored = self._score(plan, state) if requested.any() else None
+        
+        pending = [set() for _ in plan['hospitals']]
+        state['pruned'] = []
+        for r, req in enumerate(plan['requests']):
+            h = plan['hospital_rows'][req['hospital'].hospital_id]
+            rows, _ = plan['device_filters'][(req.get('device') or '').strip()]
+            cols = np.searchsorted(columns, rows)
+            unknown = ~requested[h, cols]
+            limit = req.get('limit')
+            alpha, beta = req.get('alpha'), req.get('beta')
             
-            # Calculate flood risk
-            flood_risk = self.calculate_flood_risk(provider, hospital)
+            # Bounds only hold for non-negative weights; a full ranking
+            # needs every provider anyway
+            if not limit or (alpha is not None and alpha < 0) or \
+                    (beta is not None and beta < 0):
+                state['pruned'].append(np.zeros(len(rows), dtype=bool))
+                pending[h].update(cols[unknown].tolist())
+                continue
             
-            # Calculate weighted score
-            weighted_score = self.calculate_weighted_score(
-                flood_risk,
-                route_details['carbon_emission_kg'],
-                alpha,
-                beta
-            )
+            threshold = np.inf
+            known_scores = scored['rankings'][r][3][~unknown] if scored else []
+            if len(known_scores) >= limit:
+                threshold = np.partition(known_scores, limit - 1)[limit - 1]
             
-            # Determine if provider is offering substitute product
-            offered_device = None
-            is_substitute_product = False
-            if device and provider.provider_id in provider_product_map:
-                offered_device = provider_product_map[provider.provider_id]
-                is_substitute_product = is_substitute(device, offered_device)
+            bounds = engine.score_lower_bounds(
+                req['hospital'].latitude, req['hospital'].longitude, rows,
+                hospital_risks[h], alpha, beta
+            )
+            candidates = unknown & (bounds <= threshold)
+            state['pruned'].append(unknown & ~candidates)
             
-            # Create recommendation
-            recommendation = RouteRecommendation(
-                provider=provider,
-                hospital=hospital,
-                distance_km=route_details['distance_km'],
-                transport_mode=route_details['transport_mode'],
-                carbon_emission_kg=route_details['carbon_emission_kg'],
-                flood_risk=flood_risk,
-                weighted_score=weighted_score,
-                route_polyline=route_details['polyline'],
-                estimated_time=route_details['estimated_time'],
-                requested_device=device,
-                offered_device=offered_device,
-                is_substitute=is_substitute_product
+            best = np.flatnonzero(candidates)
+            wave = max(limit, Config.RECOMMENDATION_WAVE_SIZE)
+            best = best[np.argsort(bounds[best], kind='stable')[:wave]]
+            pending[h].update(cols[best].tolist())
+        
+        return [np.array(sorted(cols), dtype=np.intp) for cols in pending]
+    
+    def _score(self, plan: dict, state: dict) -> dict:
+        """
+        Cost matrix and per-request rankings from the lookups so far
+        Unknown risks use the fallback score and unknown distances the
+        great circle distance; the affected cells, and those scored with
+        provisional risk estimates, are flagged as degraded
+        """
+        engine, columns, hospitals = plan['engine'], plan['columns'], plan['hospitals']
+        
+        provider_risks = engine.risk_scores[columns].copy()
+        hospital_risks = state['hospital_risks'].copy()
+        degraded = (np.isnan(hospital_risks)[:, None] | np.isnan(provider_risks)[None, :]
+                    | state['hospital_provisional'][:, None]
+                    | engine.risk_provisional[columns][None, :]
+                    | ~state['routes_known'])
+        provider_risks[np.isnan(provider_risks)] = FALLBACK_SUSCEPTIBILITY
+        hospital_risks[np.isnan(hospital_risks)] = FALLBACK_SUSCEPTIBILITY
+        
+        matrix = engine.score_matrix(
+            np.array([h.latitude for h in hospitals]),
+            np.array([h.longitude for h in hospitals]),
+            columns, hospital_risks, state['distances'], provider_risks
+        )
+        
+        rankings = []
+        pruned = state.get('pruned')
+        for r, req in enumerate(plan['requests']):
+            h = plan['hospital_rows'][req['hospital'].hospital_id]
+            rows, _ = plan['device_filters'][(req.get('device') or '').strip()]
+            cols = np.searchsorted(columns, rows)
+            scores = engine.weighted_scores(
+                matrix['flood_risk'][h, cols], matrix['carbon_emission_kg'][h, cols],
+                req.get('alpha'), req.get('beta')
             )
+            # Pruned providers were never looked up and cannot make the cut
+            ranked = scores
+            if pruned and pruned[r].any():
+                ranked = np.where(pruned[r], np.inf, scores)
+            rankings.append((h, rows, cols, scores, top_k_indices(ranked, req.get('limit'))))
+        
+        return {'matrix': matrix, 'degraded': degraded, 'rankings': rankings}
+    
+    def _winner_keys(self, plan: dict, rankings: List[tuple]) -> List[tuple]:
+        """(request, row) of every winning provider with its hospital and provider"""
+        engine = plan['engine']
+        return [
+            ((r, i), plan['requests'][r]['hospital'], engine.providers[rows[i]])
+            for r, (_, rows, _, _, winners) in enumerate(rankings)
+            for i in winners
+        ]
+    
+    def _fetch_polylines(self, plan: dict, rankings: List[tuple], deadline: float) -> dict:
+        """
+        Polylines for the winning routes, one directions request per
+        winner, all in flight together; winners not back by the deadline
+        keep whatever is already stored
+        """
+        winners = self._winner_keys(plan, rankings)
+        fetched = self._gather([
+            partial(self.route_matrix.polylines, hospital, [provider])
+            for _, hospital, provider in winners
+        ], deadline)
+        
+        polylines = {}
+        for (key, hospital, provider), (done, result) in zip(winners, fetched):
+            if not done:
+                result = self.route_matrix.polylines(hospital, [provider], fetch=False)
+            polylines[key] = result[0]
+        return polylines
+    
+    def _stored_polylines(self, plan: dict, rankings: List[tuple]) -> dict:
+        """Polylines of the winning routes that are already stored"""
+        return {
+            key: self.route_matrix.polylines(hospital, [provider], fetch=False)[0]
+            for key, hospital, provider in self._winner_keys(plan, rankings)
+        }
+    
+    def _build(self, plan: dict, state: dict, scored: dict,
+               polylines: dict) -> List[List[RouteRecommendation]]:
+        """Recommendation objects for the winning rows of every request"""
+        engine = plan['engine']
+        matrix, degraded = scored['matrix'], scored['degraded']
+        
+        results = []
+        for r, (req, (h, rows, cols, scores, winners)) in enumerate(
+                zip(plan['requests'], scored['rankings'])):
+            hospital = req['hospital']
+            device = req.get('device')
+            _, provider_product_map = plan['device_filters'][(device or '').strip()]
             
-            recommendations.append(recommendation)
+            # Only the winning rows become recommendation objects
+            recommendations = []
+            for i in winners:
+                provider = engine.providers[rows[i]]
+                c = cols[i]
+                
+                # Determine if provider is offering substitute product
+                offered_device = None
+                is_substitute_product = False
+                if device and provider.provider_id in provider_product_map:
+                    offered_device = provider_product_map[provider.provider_id]
+                    is_substitute_product = is_substitute(device, offered_device)
+                
+                recommendations.append(RouteRecommendation(
+                    provider=provider,
+                    hospital=hospital,
+                    distance_km=float(matrix['distance_km'][h, c]),
+                    transport_mode=provider.transport_mode,
+                    carbon_emission_kg=float(matrix['carbon_emission_kg'][h, c]),
+                    flood_risk=float(matrix['flood_risk'][h, c]),
+                    weighted_score=float(scores[i]),
+                    route_polyline=polylines[(r, i)],
+                    estimated_time=state['durations'][h, c] or 'Estimated',
+                    requested_device=device,
+                    offered_device=offered_device,
+                    is_substitute=is_substitute_product,
+                    degraded=bool(degraded[h, c])
+                ))
+            
+            results.append(recommendations)
+        
+        return results
+    
+    @staticmethod
+    def _log_rankings(plan: dict, scored: dict):
+        """Print the candidate count and limit of every request"""
+        for req, (_, rows, _, _, _) in zip(plan['requests'], scored['rankings']):
+            print(f"Generated {len(rows)} total recommendations for {req['hospital'].hospital_id}")
+            if req.get('limit'):
+                print(f"Limiting to top {req.get('limit')} recommendations")
+    
+    @staticmethod
+    def _lookup_pool(calls: int) -> ThreadPoolExecutor:
+        """
+        Worker pool for the concurrent lookups of one request. Each request
+        gets its own, so lookups left running past a deadline never hold
+        the workers another request is waiting for
+        """
+        return ThreadPoolExecutor(
+            max_workers=max(1, min(Config.RECOMMENDATION_FANOUT_WORKERS, calls)),
+            thread_name_prefix='recommendation'
+        )
+    
+    def _as_completed(self, tasks: List[tuple], deadline: float):
+        """
+        Run (kind, chunk, call) tasks, concurrently when fan-out is enabled,
+        yielding (kind, chunk, result) as each succeeds until the deadline
+        """
+        if not Config.RECOMMENDATION_FANOUT_ENABLED:
+            for kind, chunk, call in tasks:
+                if time.monotonic() >= deadline:
+                    return
+                try:
+                    result = call()
+                except Exception as e:
+                    print(f"Error during recommendation lookup: {e}")
+                    continue
+                yield kind, chunk, result
+            return
+        
+        executor = self._lookup_pool(len(tasks))
+        try:
+            pending = {executor.submit(call): (kind, chunk) for kind, chunk, call in tasks}
+            for future in as_completed(pending, timeout=max(0.0, deadline - time.monotonic())):
+                kind, chunk = pending[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"Error during recommendation lookup: {e}")
+                    continue
+                yield kind, chunk, result
+        except FuturesTimeoutError:
+            pass
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    def _gather(self, calls: List, deadline: float) -> List[tuple]:
+        """
+        Run independent lookups, concurrently when fan-out is enabled
+        Returns (done, result) per call; done is False for calls that
+        failed or were not finished by the deadline. Calls still running
+        then finish in the background and fill the caches for later
+        requests; calls not started yet are cancelled. Without fan-out the
+        calls run one by one and those not started by the deadline are
+        skipped
+        """
+        if not Config.RECOMMENDATION_FANOUT_ENABLED:
+            results = []
+            for call in calls:
+                if time.monotonic() >= deadline:
+                    results.append((False, None))
+                    continue
+                try:
+                    results.append((True, call()))
+                except Exception as e:
+                    print(f"Error during recommendation lookup: {e}")
+                    results.append((False, None))
+            return results
         
-        # Sort by weighted score (lower is better)
-        recommendations.sort(key=lambda x: x.weighted_score)
+        executor = self._lookup_pool(len(calls))
+        try:
+            futures = [executor.submit(call) for call in calls]
+            results = []
+            for future in futures:
+                try:
+                    results.append((True, future.result(
+                        timeout=max(0.0, deadline - time.monotonic())
+                    )))
+                except FuturesTimeoutError:
+                    results.append((False, None))
+                except Exception as e:
+                    print(f"Error during recommendation lookup: {e}")
+                    results.append((False, None))
+            return results
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    def _filter_providers(self, providers: List[Provider], device: str = None):
+        """
+        Filter providers by device if specified (including substitutes)
+        Returns the filtered providers and a map of provider_id to the
+        product each one offers
+        """
+        if not (device and device.strip()):
+            return providers, {}
         
-        print(f"Generated {len(recommendations)} total recommendations")
-        if limit:
-            print(f"Limiting to top {limit} recommendations")
-            return recommendations[:limit]
+        filtered_providers, provider_product_map = \
+            self.get_device_index(providers).lookup(device)
+        print(f"Filtered to {len(filtered_providers)} providers for {device} "
+              f"(including substitutes)")
+        return filtered_providers, provider_product_map
+    
+    def get_device_index(self, providers: List[Provider]) -> DeviceIndex:
+        """
+        Get the device index for a provider catalog
+        Uses the index built by DataService when it covers this catalog,
+        otherwise builds one whenever the catalog list is replaced or grows
+        """
+        index = self.device_index
+        if index is None or index.providers is not providers \
+                or index.provider_count != len(providers):
+            index = DeviceIndex(providers)
+            self.device_index = index
+        return index
+    
+    def get_scoring_engine(self, providers: List[Provider]) -> ScoringEngine:
+        """
+        Get the scoring engine for a provider catalog
+        Rebuilt whenever the catalog list is replaced or grows
+        """
+        engine = self.scoring_engine
+        if (engine is None or self._engine_providers is not providers
+                or len(engine) != len(providers)):
+            engine = ScoringEngine(providers, self.route_service.emission_factors)
+            self.scoring_engine = engine
+            self._engine_providers = providers
+        return engine
+    
+    def _refresh_provider_risk(self, engine: ScoringEngine, rows: np.ndarray):
+        """Load combined flood risk for providers missing from the cache"""
+        if self.risk_table is not None:
+            # The table is read on every request so newly published
+            # scores replace provisional ones straight away
+            engine.set_risk_scores(rows, *self._entity_risks(
+                PROVIDER, [engine.providers[row] for row in rows]
+            ))
+            return
+        
+        stale = engine.stale_risk_rows(rows)
+        if len(stale) == 0:
+            return
         
-        return recommendations
+        engine.set_risk_scores(stale, *self._entity_risks(
+            PROVIDER, [engine.providers[row] for row in stale]
+        ))
     
     def get_best_provider(self, hospital: Hospital, 
                          providers: List[Provider],
@@ -194,15 +855,12 @@ class RecommendationService:
             provider.transport_mode
         )
         
-        flood_risk = self.calculate_flood_risk(provider, hospital)
-        
-        # Get FEMA zones for context
-        provider_fema = self.fema_service.get_flood_zone(
-            provider.latitude, provider.longitude
-        )
-        hospital_fema = self.fema_service.get_flood_zone(
-            hospital.latitude, hospital.longitude
-        )
+        # Route risk is the maximum of the two endpoints; FEMA zones for context
+        provider_risk = self.get_entity_risk_details(PROVIDER, [provider])[0]
+        hospital_risk = self.get_entity_risk_details(HOSPITAL, [hospital])[0]
+        flood_risk = max(provider_risk['risk_score'], hospital_risk['risk_score'])
+        provider_fema = provider_risk['fema']
+        hospital_fema = hospital_risk['fema']
         
         return {
             'distance_km': route_details['distance_km'],
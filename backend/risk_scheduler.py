@@ -0,0 +1,289 @@
+"""Background precomputation of flood risk for known hospitals and providers"""
+import threading
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from config import Config
+
+
+# Coordinate change (degrees) after which a published risk no longer applies
+COORD_TOLERANCE = 1e-6
+
+HOSPITAL = 'hospital'
+PROVIDER = 'provider'
+
+
+def _entity_id(kind: str, entity) -> str:
+    return entity.hospital_id if kind == HOSPITAL else entity.provider_id
+
+
+class RiskTable:
+    """
+    Published combined flood risk per hospital and provider ID
+    Each publish swaps in a new dict and bumps the version, so readers
+    always see a consistent snapshot without waiting on writers
+    """
+
+    def __init__(self):
+        self.version = 0
+        self.updated_at: Optional[float] = None
+        self._entries: Dict[str, Dict[str, dict]] = {HOSPITAL: {}, PROVIDER: {}}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        entries = self._entries
+        return len(entries[HOSPITAL]) + len(entries[PROVIDER])
+
+    def publish(self, kind: str, entries: Dict[str, dict]) -> int:
+        """Add or replace entries of one kind; returns the new version"""
+        with self._lock:
+            table = dict(self._entries)
+            table[kind] = {**table[kind], **entries}
+            self._entries = table
+            self.version += 1
+            self.updated_at = time.time()
+            return self.version
+
+    def prune(self, kind: str, keep_ids) -> None:
+        """Drop entries for IDs that no longer exist"""
+        keep_ids = set(keep_ids)
+        with self._lock:
+            if not set(self._entries[kind]) - keep_ids:
+                return
+            table = dict(self._entries)
+            table[kind] = {k: v for k, v in table[kind].items() if k in keep_ids}
+            self._entries = table
+            self.version += 1
+
+    def remove(self, kind: str, ids) -> None:
+        """Drop entries for the given IDs"""
+        ids = set(ids)
+        with self._lock:
+            if not ids & set(self._entries[kind]):
+                return
+            table = dict(self._entries)
+            table[kind] = {k: v for k, v in table[kind].items() if k not in ids}
+            self._entries = table
+            self.version += 1
+
+    def get_entries(self, kind: str, entities: List) -> List[Optional[dict]]:
+        """
+        Published entries for hospitals or providers, None where an entity
+        has no entry yet or has moved since it was computed
+        """
+        table = self._entries[kind]
+        results = []
+        for entity in entities:
+            entry = table.get(_entity_id(kind, entity))
+            if entry is not None and (
+                    abs(entry['latitude'] - entity.latitude) > COORD_TOLERANCE
+                    or abs(entry['longitude'] - entity.longitude) > COORD_TOLERANCE):
+                entry = None
+            results.append(entry)
+        return results
+
+    def get_scores(self, kind: str, entities: List) -> np.ndarray:
+        """Combined risk scores for entities (NaN where not published)"""
+        return np.array([
+            np.nan if entry is None else entry['risk_score']
+            for entry in self.get_entries(kind, entities)
+        ], dtype=float)
+
+    def stats(self) -> dict:
+        entries = self._entries
+        return {
+            'version': self.version,
+            'hospitals': len(entries[HOSPITAL]),
+            'providers': len(entries[PROVIDER]),
+            'updated_at': self.updated_at
+        }
+
+
+class RateLimiter:
+    """Token bucket limiting how many locations are looked up per second"""
+
+    def __init__(self, rate_per_second: float):
+        self.rate = rate_per_second
+        self._tokens = rate_per_second
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int = 1):
+        """Block until the given number of tokens is available"""
+        if not self.rate or self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                # Allow a full batch through even if it exceeds one second
+                capacity = max(self.rate, tokens)
+                self._tokens = min(capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class RiskScheduler:
+    """
+    Periodically recomputes combined FEMA + GEE flood risk for every
+    hospital and provider in the DataService and publishes it to a
+    RiskTable, so request handlers never wait on Earth Engine
+    """
+
+    def __init__(self, data_service, fema_service, gee_service,
+                 risk_table: RiskTable = None,
+                 interval_seconds: float = None,
+                 max_workers: int = None,
+                 rate_limit_per_second: float = None,
+                 batch_size: int = None):
+        self.data_service = data_service
+        self.fema_service = fema_service
+        self.gee_service = gee_service
+        self.risk_table = risk_table or RiskTable()
+        self.interval_seconds = interval_seconds or Config.RISK_REFRESH_INTERVAL_SECONDS
+        self.max_workers = max_workers or Config.RISK_SCHEDULER_WORKERS
+        self.batch_size = batch_size or Config.RISK_SCHEDULER_BATCH_SIZE
+        self.rate_limiter = RateLimiter(
+            Config.RISK_SCHEDULER_RATE_LIMIT if rate_limit_per_second is None
+            else rate_limit_per_second
+        )
+
+        self._thread: Optional[threading.Thread] = None
+        # (kind, entities) waiting for a targeted refresh
+        self._pending: List[tuple] = []
+        self._pending_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self.last_run_started: Optional[float] = None
+        self.last_run_seconds: Optional[float] = None
+        self.last_run_errors = 0
+        # Batches run on pool threads and count their failures here
+        self._errors_lock = threading.Lock()
+        self.runs = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    def start(self):
+        """Start refreshing in a daemon thread (no-op if already running)"""
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='risk-scheduler',
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = None):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def trigger(self):
+        """Run the next refresh now instead of waiting for the interval"""
+        self._wake.set()
+
+    def refresh(self, kind: str, entities: List):
+        """Recompute risk for just these hospitals or providers, soon"""
+        if not entities:
+            return
+        with self._pending_lock:
+            self._pending.append((kind, list(entities)))
+        self._wake.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                # A wake-up for targeted refreshes skips the full pass
+                if self._pending and self.runs:
+                    self.run_pending()
+                else:
+                    self.run_once()
+            except Exception as e:
+                print(f"Error refreshing flood risk: {e}")
+            self._wake.wait(self.interval_seconds)
+            self._wake.clear()
+
+    def run_once(self) -> int:
+        """
+        Recompute risk for all hospitals and providers, publishing each
+        batch as soon as it is done. Returns the number of locations scored.
+        """
+        self.last_run_started = time.time()
+        self.last_run_errors = 0
+        started = time.monotonic()
+
+        batches = []
+        for kind, entities in ((HOSPITAL, self.data_service.get_all_hospitals()),
+                               (PROVIDER, self.data_service.get_all_providers())):
+            self.risk_table.prune(kind, [_entity_id(kind, e) for e in entities])
+            for i in range(0, len(entities), self.batch_size):
+                batches.append((kind, entities[i:i + self.batch_size]))
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            scored = sum(pool.map(lambda batch: self._run_batch(*batch), batches))
+
+        self.runs += 1
+        self.last_run_seconds = time.monotonic() - started
+        print(f"Refreshed flood risk for {scored} locations "
+              f"in {self.last_run_seconds:.1f}s (version {self.risk_table.version})")
+        return scored
+
+    def run_pending(self) -> int:
+        """Refresh only the entities queued by refresh(); returns the count"""
+        with self._pending_lock:
+            pending, self._pending = self._pending, []
+        batches = [
+            (kind, entities[i:i + self.batch_size])
+            for kind, entities in pending
+            for i in range(0, len(entities), self.batch_size)
+        ]
+        if not batches:
+            return 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            scored = sum(pool.map(lambda batch: self._run_batch(*batch), batches))
+        print(f"Refreshed flood risk for {scored} changed locations "
+              f"(version {self.risk_table.version})")
+        return scored
+
+    def _run_batch(self, kind: str, entities: List) -> int:
+        self.rate_limiter.acquire(len(entities))
+        coordinates = [(e.latitude, e.longitude) for e in entities]
+        try:
+            zones = self.fema_service.get_flood_zones(coordinates)
+            susceptibility = self.gee_service.get_flood_susceptibility_bulk(coordinates)
+        except Exception as e:
+            print(f"Error computing flood risk batch: {e}")
+            with self._errors_lock:
+                self.last_run_errors += 1
+            return 0
+
+        now = time.time()
+        self.risk_table.publish(kind, {
+            _entity_id(kind, entity): {
+                'latitude': entity.latitude,
+                'longitude': entity.longitude,
+                'fema': zone,
+                'gee_susceptibility': gee,
+                'risk_score': self.fema_service.combine_risk_score(zone['risk_score'], gee),
+                'updated_at': now
+            }
+            for entity, zone, gee in zip(entities, zones, susceptibility)
+        })
+        return len(entities)
+
+    def status(self) -> dict:
+        return {
+            'running': self.running,
+            'runs': self.runs,
+            'last_run_started': self.last_run_started,
+            'last_run_seconds': self.last_run_seconds,
+            'last_run_errors': self.last_run_errors,
+            'interval_seconds': self.interval_seconds,
+            'table': self.risk_table.stats()
+        }
@@ -0,0 +1,299 @@
+"""Offline road-network routing engine"""
+import heapq
+import json
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from scoring_engine import EARTH_RADIUS_KM, haversine_km
+
+
+Point = Tuple[float, float]
+
+# Size (degrees) of the grid cells used to snap coordinates to graph nodes
+GRID_CELL_DEGREES = 0.05
+
+
+def _ring_cells(row: int, col: int, radius: int):
+    """Grid cells exactly radius cells (Chebyshev) from (row, col)"""
+    if radius == 0:
+        yield row, col
+        return
+    for c in range(col - radius, col + radius + 1):
+        yield row - radius, c
+        yield row + radius, c
+    for r in range(row - radius + 1, row + radius):
+        yield r, col - radius
+        yield r, col + radius
+
+
+def _ring_min_km(latitude: float, longitude: float, row: int, col: int,
+                 radius: int) -> float:
+    """
+    Lower bound on the distance from a point in cell (row, col) to any
+    point in the ring of cells radius cells away
+    """
+    if radius == 0:
+        return 0.0
+    # A ring point lies above/below or left/right of the inner square
+    lat_gap = min(latitude - (row - radius + 1) * GRID_CELL_DEGREES,
+                  (row + radius) * GRID_CELL_DEGREES - latitude)
+    lon_gap = min(longitude - (col - radius + 1) * GRID_CELL_DEGREES,
+                  (col + radius) * GRID_CELL_DEGREES - longitude)
+    # Degrees of longitude shrink towards the poles, so bound them at the
+    # most poleward latitude the ring reaches
+    max_lat = min(90.0, max(abs((row - radius) * GRID_CELL_DEGREES),
+                            abs((row + radius + 1) * GRID_CELL_DEGREES)))
+    lon_km = 2 * EARTH_RADIUS_KM * np.arcsin(
+        np.cos(np.radians(max_lat)) * np.sin(np.radians(min(lon_gap, 180.0)) / 2)
+    )
+    return float(min(EARTH_RADIUS_KM * np.radians(lat_gap), lon_km))
+
+
+class RoadNetwork:
+    """
+    Road graph loaded from a local file, answering shortest-path distance
+    and duration queries without network access
+
+    File format (JSON), e.g. converted from an OSM extract:
+        {
+          "nodes": {"<node_id>": [lat, lon], ...},
+          "edges": [["<from>", "<to>", distance_m, duration_s, oneway], ...]
+        }
+    duration_s may be null (derived from the default speed) and oneway
+    defaults to false, meaning the edge can be travelled both ways.
+    """
+
+    def __init__(self, node_ids: List[str], coords: np.ndarray,
+                 edges: List[tuple], default_speed_kmh: float = 60.0):
+        self.node_ids = list(node_ids)
+        self.latitudes = np.asarray(coords[:, 0], dtype=float)
+        self.longitudes = np.asarray(coords[:, 1], dtype=float)
+        self.default_speed_kmh = default_speed_kmh
+
+        index = {node_id: i for i, node_id in enumerate(self.node_ids)}
+        sources, targets, lengths, durations = [], [], [], []
+        for edge in edges:
+            source, target, distance_m = index[str(edge[0])], index[str(edge[1])], float(edge[2])
+            duration_s = edge[3] if len(edge) > 3 and edge[3] is not None \
+                else distance_m / 1000.0 / default_speed_kmh * 3600
+            oneway = bool(edge[4]) if len(edge) > 4 else False
+
+            sources.append(source)
+            targets.append(target)
+            lengths.append(distance_m)
+            durations.append(float(duration_s))
+            if not oneway:
+                sources.append(target)
+                targets.append(source)
+                lengths.append(distance_m)
+                durations.append(float(duration_s))
+
+        sources = np.array(sources, dtype=np.intp)
+        targets = np.array(targets, dtype=np.intp)
+        lengths = np.array(lengths, dtype=float)
+        durations = np.array(durations, dtype=float)
+
+        # Compressed adjacency for the graph and its reverse
+        self._forward = self._csr(sources, targets, lengths, durations)
+        self._backward = self._csr(targets, sources, lengths, durations)
+        self._grid = self._build_grid()
+
+    @classmethod
+    def from_file(cls, path: str, default_speed_kmh: float = 60.0) -> 'RoadNetwork':
+        """Load a road graph from a JSON adjacency file"""
+        with open(path) as f:
+            data = json.load(f)
+
+        node_ids = [str(node_id) for node_id in data['nodes']]
+        coords = np.array(list(data['nodes'].values()), dtype=float).reshape(-1, 2)
+        network = cls(node_ids, coords, data['edges'], default_speed_kmh)
+        print(f"Loaded road network with {len(node_ids)} nodes from {path}")
+        return network
+
+    def _csr(self, sources, targets, lengths, durations):
+        order = np.argsort(sources, kind='stable')
+        indptr = np.zeros(len(self.node_ids) + 1, dtype=np.intp)
+        np.cumsum(np.bincount(sources, minlength=len(self.node_ids)), out=indptr[1:])
+        return (indptr.tolist(), targets[order].tolist(),
+                lengths[order].tolist(), durations[order].tolist())
+
+    def _build_grid(self) -> Dict[Tuple[int, int], List[int]]:
+        grid: Dict[Tuple[int, int], List[int]] = {}
+        cells = zip(np.floor(self.latitudes / GRID_CELL_DEGREES).astype(int).tolist(),
+                    np.floor(self.longitudes / GRID_CELL_DEGREES).astype(int).tolist())
+        for node, cell in enumerate(cells):
+            grid.setdefault(cell, []).append(node)
+        return grid
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def nearest_node(self, latitude: float, longitude: float) -> Tuple[int, float]:
+        """Closest graph node to a coordinate and its distance in km"""
+        if not self.node_ids:
+            raise ValueError("Road network has no nodes")
+        row = int(np.floor(latitude / GRID_CELL_DEGREES))
+        col = int(np.floor(longitude / GRID_CELL_DEGREES))
+
+        # Search rings of grid cells outwards until no cell of the next
+        # ring can be closer than the best node found so far
+        best_node, best_km = -1, float('inf')
+        radius = 0
+        while _ring_min_km(latitude, longitude, row, col, radius) <= best_km:
+            # Once a ring has more cells than the grid has occupied ones,
+            # checking every node is cheaper and settles the search
+            scan_all = 8 * radius > len(self._grid)
+            if scan_all:
+                candidates = np.arange(len(self.node_ids))
+            else:
+                candidates = np.array([node for cell in _ring_cells(row, col, radius)
+                                       for node in self._grid.get(cell, ())], dtype=np.intp)
+            if len(candidates):
+                distances = haversine_km(self.latitudes[candidates],
+                                         self.longitudes[candidates], latitude, longitude)
+                i = int(np.argmin(distances))
+                if distances[i] < best_km:
+                    best_node, best_km = int(candidates[i]), float(distances[i])
+            if scan_all:
+                break
+            radius += 1
+        return best_node, best_km
+
+    def _connector(self, snap_km: float) -> Tuple[float, float]:
+        """Distance (m) and duration (s) of the off-network leg to a node"""
+        return snap_km * 1000.0, snap_km / self.default_speed_kmh * 3600
+
+    def shortest_path(self, origin: Point, destination: Point,
+                      weight: str = 'duration') -> Optional[Dict]:
+        """
+        Fastest (or shortest, weight='distance') route between two points
+        using bidirectional Dijkstra. Returns distance_km, duration_seconds
+        and the list of (lat, lon) points along the route, or None if the
+        snapped nodes are not connected.
+        """
+        source, source_snap = self.nearest_node(*origin)
+        target, target_snap = self.nearest_node(*destination)
+        use_duration = weight == 'duration'
+
+        fwd_indptr, fwd_targets, fwd_len, fwd_dur = self._forward
+        bwd_indptr, bwd_targets, bwd_len, bwd_dur = self._backward
+        fwd_weights = fwd_dur if use_duration else fwd_len
+        bwd_weights = bwd_dur if use_duration else bwd_len
+
+        cost = ({source: 0.0}, {target: 0.0})
+        prev = ({source: -1}, {target: -1})
+        heaps = ([(0.0, source)], [(0.0, target)])
+        settled = (set(), set())
+        best, meet = float('inf'), source if source == target else None
+        if meet is not None:
+            best = 0.0
+
+        while heaps[0] and heaps[1] and heaps[0][0][0] + heaps[1][0][0] < best:
+            side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+            indptr, targets, weights = (
+                (fwd_indptr, fwd_targets, fwd_weights) if side == 0
+                else (bwd_indptr, bwd_targets, bwd_weights)
+            )
+            d, u = heapq.heappop(heaps[side])
+            if u in settled[side]:
+                continue
+            settled[side].add(u)
+
+            other = cost[1 - side]
+            for e in range(indptr[u], indptr[u + 1]):
+                v = targets[e]
+                nd = d + weights[e]
+                if nd < cost[side].get(v, float('inf')):
+                    cost[side][v] = nd
+                    prev[side][v] = u
+                    heapq.heappush(heaps[side], (nd, v))
+                    if v in other and nd + other[v] < best:
+                        best, meet = nd + other[v], v
+
+        if meet is None:
+            return None
+
+        # Walk back to the source, then forward to the target
+        path = []
+        node = meet
+        while node != -1:
+            path.append(node)
+            node = prev[0][node]
+        path.reverse()
+        node = prev[1][meet]
+        while node != -1:
+            path.append(node)
+            node = prev[1][node]
+
+        distance_m, duration_s = self._path_totals(path, weight)
+        for snap in (source_snap, target_snap):
+            extra_m, extra_s = self._connector(snap)
+            distance_m += extra_m
+            duration_s += extra_s
+
+        points = [origin] + [(self.latitudes[n], self.longitudes[n]) for n in path] \
+            + [destination]
+        return {
+            'distance_km': distance_m / 1000.0,
+            'duration_seconds': duration_s,
+            'points': [(float(lat), float(lon)) for lat, lon in points]
+        }
+
+    def _path_totals(self, path: List[int],
+                     weight: str = 'duration') -> Tuple[float, float]:
+        """Distance (m) and duration (s) along consecutive path nodes"""
+        indptr, targets, lengths, durations = self._forward
+        weights = durations if weight == 'duration' else lengths
+        distance_m = duration_s = 0.0
+        for u, v in zip(path, path[1:]):
+            # Parallel edge the search took: the cheapest by its weight
+            edges = [e for e in range(indptr[u], indptr[u + 1]) if targets[e] == v]
+            e = min(edges, key=lambda e: weights[e])
+            distance_m += lengths[e]
+            duration_s += durations[e]
+        return distance_m, duration_s
+
+    def one_to_many(self, origins: List[Point], destination: Point,
+                    weight: str = 'duration') -> List[Optional[Dict]]:
+        """
+        Routes from many origins to one destination with a single Dijkstra
+        search over the reversed graph, stopping once every origin's node
+        is settled. Entries are None for unreachable origins.
+        """
+        target, target_snap = self.nearest_node(*destination)
+        snapped = [self.nearest_node(lat, lon) for lat, lon in origins]
+        pending = {node for node, _ in snapped}
+
+        indptr, targets, lengths, durations = self._backward
+        weights = durations if weight == 'duration' else lengths
+
+        # cost, plus distance/duration accumulated along the chosen path
+        best = {target: (0.0, 0.0, 0.0)}
+        heap = [(0.0, target)]
+        settled = set()
+        while heap and pending:
+            d, u = heapq.heappop(heap)
+            if u in settled:
+                continue
+            settled.add(u)
+            pending.discard(u)
+            _, length_u, duration_u = best[u]
+            for e in range(indptr[u], indptr[u + 1]):
+                v = targets[e]
+                nd = d + weights[e]
+                if v not in best or nd < best[v][0]:
+                    best[v] = (nd, length_u + lengths[e], duration_u + durations[e])
+                    heapq.heappush(heap, (nd, v))
+
+        target_m, target_s = self._connector(target_snap)
+        results: List[Optional[Dict]] = []
+        for node, snap in snapped:
+            if node not in settled:
+                results.append(None)
+                continue
+            source_m, source_s = self._connector(snap)
+            _, length, duration = best[node]
+            results.append({
+                'distance_km': (length + source_m + target_m) / 1000.0,
+                'duration_seconds': duration + source_s + target_s
+            })
+        return results
@@ -0,0 +1,142 @@
+"""Persistent SQLite cache for route lookups"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+Point = Tuple[float, float]
+
+
+class RouteCache:
+    """
+    On-disk route cache keyed by quantized origin/destination coordinates
+    and travel mode, with TTL expiry and least-recently-used size bounds
+    """
+
+    def __init__(self, path: str, ttl_seconds: float, max_entries: int,
+                 precision: int = 4):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.precision = precision
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory and path != ':memory:':
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS routes (
+                    key TEXT PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            ''')
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_routes_accessed ON routes (accessed_at)'
+            )
+
+    def make_key(self, origin: Point, destination: Point, mode: str) -> str:
+        """Cache key from coordinates rounded to the configured precision"""
+        p = self.precision
+        return (f"{origin[0]:.{p}f},{origin[1]:.{p}f}|"
+                f"{destination[0]:.{p}f},{destination[1]:.{p}f}|{mode}")
+
+    def get(self, origin: Point, destination: Point, mode: str) -> Optional[Dict]:
+        """Cached route, or None if missing or expired"""
+        return self.get_many([origin], destination, mode)[0]
+
+    def get_many(self, origins: List[Point], destination: Point,
+                 mode: str) -> List[Optional[Dict]]:
+        """Cached routes from many origins to one destination"""
+        keys = [self.make_key(o, destination, mode) for o in origins]
+        now = time.time()
+        found = {}
+
+        with self._lock:
+            # SQLite limits the number of bound parameters per statement
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self._conn.execute(
+                    f'SELECT key, payload, created_at FROM routes '
+                    f'WHERE key IN ({placeholders})', chunk
+                ).fetchall()
+                for key, payload, created_at in rows:
+                    if now - created_at <= self.ttl_seconds:
+                        found[key] = json.loads(payload)
+
+            if found:
+                with self._conn:
+                    self._conn.executemany(
+                        'UPDATE routes SET accessed_at = ? WHERE key = ?',
+                        [(now, key) for key in found]
+                    )
+
+            results = [found.get(key) for key in keys]
+            hits = sum(1 for r in results if r is not None)
+            self.hits += hits
+            self.misses += len(keys) - hits
+
+        return results
+
+    def set(self, origin: Point, destination: Point, mode: str, route: Dict):
+        """Store one route"""
+        self.set_many([(origin, destination, route)], mode)
+
+    def set_many(self, entries: Iterable[Tuple[Point, Point, Dict]], mode: str):
+        """Store many (origin, destination, route) entries"""
+        now = time.time()
+        rows = [
+            (self.make_key(origin, destination, mode), json.dumps(route), now, now)
+            for origin, destination, route in entries
+        ]
+        if not rows:
+            return
+
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO routes (key, payload, created_at, accessed_at) '
+                'VALUES (?, ?, ?, ?)', rows
+            )
+            self._evict()
+
+    def _evict(self):
+        """Drop expired entries, then least recently used ones over the bound"""
+        self._conn.execute(
+            'DELETE FROM routes WHERE created_at < ?',
+            (time.time() - self.ttl_seconds,)
+        )
+        count = self._conn.execute('SELECT COUNT(*) FROM routes').fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                'DELETE FROM routes WHERE key IN ('
+                'SELECT key FROM routes ORDER BY accessed_at ASC LIMIT ?)',
+                (count - self.max_entries,)
+            )
+
+    def clear(self):
+        """Remove every cached route"""
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM routes')
+
+    def stats(self) -> Dict:
+        """Hit/miss counters and current size"""
+        with self._lock:
+            entries = self._conn.execute('SELECT COUNT(*) FROM routes').fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                'entries': entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0
+            }
@@ -0,0 +1,450 @@
+"""Persistent hospital x provider route matrix"""
+import json
+import os
+import threading
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from models import Hospital, Provider
+
+
+# Coordinates closer than this (degrees) are treated as the same location
+COORD_TOLERANCE = 1e-6
+
+
+class RouteMatrix:
+    """
+    Precomputed route table between every hospital (rows) and provider
+    (columns): road distance, duration, polyline and emissions for every
+    transport mode. Missing cells are NaN and filled through RouteService
+    in bulk; polylines are fetched lazily for the routes that are drawn.
+    New routes are written to disk in the background, save_delay seconds
+    after the first change, rather than on every lookup.
+    """
+
+    def __init__(self, route_service, path: Optional[str] = None,
+                 save_delay: float = 30.0):
+        self.route_service = route_service
+        self.path = path
+        self.save_delay = save_delay
+        self.modes = list(route_service.emission_factors)
+        self.mode_factors = np.array(
+            [route_service.emission_factors[m] for m in self.modes], dtype=float
+        )
+        self._lock = threading.RLock()
+        # Serializes writers of the file; lookups only hold _lock while
+        # the arrays are copied
+        self._save_lock = threading.Lock()
+        self._dirty = False
+        self._save_timer: Optional[threading.Timer] = None
+        # Latest (hospitals, providers) waiting for a background refresh
+        self._refresh_args: Optional[tuple] = None
+        self._refresh_thread: Optional[threading.Thread] = None
+        self._reset()
+        self.load()
+
+    def _reset(self):
+        self.hospital_ids: List[str] = []
+        self.provider_ids: List[str] = []
+        self.hospital_index: Dict[str, int] = {}
+        self.provider_index: Dict[str, int] = {}
+        self.hospital_coords = np.empty((0, 2))
+        self.provider_coords = np.empty((0, 2))
+        self.distance_km = np.empty((0, 0))
+        self.duration_seconds = np.empty((0, 0))
+        self.emissions_kg = np.empty((0, 0, len(self.modes)))
+        self.duration_text = np.empty((0, 0), dtype=object)
+        self.polyline = np.empty((0, 0), dtype=object)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.distance_km.shape
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    def load(self) -> bool:
+        """Load the matrix from disk if a saved copy exists"""
+        if not self.path or not os.path.exists(self.path):
+            return False
+
+        try:
+            with np.load(self.path, allow_pickle=False) as saved:
+                if list(saved['modes']) != self.modes:
+                    print("Route matrix emission modes changed, rebuilding")
+                    return False
+                text = json.loads(str(saved['text']))
+                with self._lock:
+                    self.hospital_ids = list(saved['hospital_ids'])
+                    self.provider_ids = list(saved['provider_ids'])
+                    self.hospital_index = {h: i for i, h in enumerate(self.hospital_ids)}
+                    self.provider_index = {p: i for i, p in enumerate(self.provider_ids)}
+                    self.hospital_coords = saved['hospital_coords']
+                    self.provider_coords = saved['provider_coords']
+                    self.distance_km = saved['distance_km']
+                    self.duration_seconds = saved['duration_seconds']
+                    self.emissions_kg = saved['emissions_kg']
+                    self.duration_text = np.array(text['duration_text'], dtype=object) \
+                        .reshape(self.shape)
+                    self.polyline = np.array(text['polyline'], dtype=object) \
+                        .reshape(self.shape)
+            print(f"Loaded route matrix {self.shape[0]}x{self.shape[1]} from {self.path}")
+            return True
+        except Exception as e:
+            print(f"Error loading route matrix: {e}")
+            self._reset()
+            return False
+
+    def save(self) -> bool:
+        """Write the matrix to disk"""
+        if not self.path:
+            return False
+
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with self._save_lock:
+                with self._lock:
+                    arrays = dict(
+                        modes=np.array(self.modes),
+                        hospital_ids=np.array(self.hospital_ids, dtype=str),
+                        provider_ids=np.array(self.provider_ids, dtype=str),
+                        hospital_coords=self.hospital_coords.copy(),
+                        provider_coords=self.provider_coords.copy(),
+                        distance_km=self.distance_km.copy(),
+                        duration_seconds=self.duration_seconds.copy(),
+                        emissions_kg=self.emissions_kg.copy()
+                    )
+                    duration_text = self.duration_text.ravel().tolist()
+                    polyline = self.polyline.ravel().tolist()
+                text = json.dumps({'duration_text': duration_text, 'polyline': polyline})
+                # Write next to the target then rename so readers never see
+                # a partially written file
+                tmp_path = f"{self.path}.tmp.npz"
+                np.savez_compressed(tmp_path, text=np.array(text), **arrays)
+                os.replace(tmp_path, self.path)
+            return True
+        except Exception as e:
+            print(f"Error saving route matrix: {e}")
+            return False
+
+    def mark_dirty(self):
+        """Schedule a background save unless one is already pending"""
+        with self._lock:
+            self._dirty = True
+            if self._save_timer is None and self.path:
+                self._save_timer = threading.Timer(self.save_delay, self.flush)
+                self._save_timer.daemon = True
+                self._save_timer.start()
+
+    def flush(self) -> bool:
+        """Save now if anything changed since the last save"""
+        with self._lock:
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+                self._save_timer = None
+            if not self._dirty:
+                return False
+            self._dirty = False
+        if self.save():
+            return True
+        with self._lock:
+            self._dirty = True
+        return False
+
+    # ------------------------------------------------------------------
+    # Structure maintenance
+    # ------------------------------------------------------------------
+
+    def sync(self, hospitals: List[Hospital], providers: List[Provider]) -> int:
+        """
+        Align rows/columns with the current hospitals and providers
+        Rows and columns for unchanged locations keep their routes; added
+        or moved ones are cleared. Returns the number of cleared cells.
+        """
+        with self._lock:
+            rows, kept_rows = self._align(
+                hospitals, 'hospital_id', self.hospital_index, self.hospital_coords
+            )
+            cols, kept_cols = self._align(
+                providers, 'provider_id', self.provider_index, self.provider_coords
+            )
+
+            shape = (len(hospitals), len(providers))
+            distance_km = np.full(shape, np.nan)
+            duration_seconds = np.full(shape, np.nan)
+            emissions_kg = np.full(shape + (len(self.modes),), np.nan)
+            duration_text = np.full(shape, None, dtype=object)
+            polyline = np.full(shape, None, dtype=object)
+
+            new_r, old_r = kept_rows
+            new_c, old_c = kept_cols
+            if len(new_r) and len(new_c):
+                dst = np.ix_(new_r, new_c)
+                src = np.ix_(old_r, old_c)
+                distance_km[dst] = self.distance_km[src]
+                duration_seconds[dst] = self.duration_seconds[src]
+                emissions_kg[dst] = self.emissions_kg[src]
+                duration_text[dst] = self.duration_text[src]
+                polyline[dst] = self.polyline[src]
+
+            self.hospital_ids = [h.hospital_id for h in hospitals]
+            self.provider_ids = [p.provider_id for p in providers]
+            self.hospital_index = {h: i for i, h in enumerate(self.hospital_ids)}
+            self.provider_index = {p: i for i, p in enumerate(self.provider_ids)}
+            self.hospital_coords = rows
+            self.provider_coords = cols
+            self.distance_km = distance_km
+            self.duration_seconds = duration_seconds
+            self.emissions_kg = emissions_kg
+            self.duration_text = duration_text
+            self.polyline = polyline
+
+            cleared = int(np.isnan(distance_km).sum())
+
+        print(f"Route matrix synced to {shape[0]}x{shape[1]}, {cleared} routes to compute")
+        return cleared
+
+    @staticmethod
+    def _align(items, id_attr, old_index, old_coords):
+        """
+        Coordinates for the new items plus (new, old) positions of the
+        items whose location is unchanged
+        """
+        coords = np.array([[i.latitude, i.longitude] for i in items],
+                          dtype=float).reshape(-1, 2)
+        new_pos, old_pos = [], []
+        for pos, item in enumerate(items):
+            old = old_index.get(getattr(item, id_attr))
+            if old is not None and np.all(
+                    np.abs(old_coords[old] - coords[pos]) <= COORD_TOLERANCE):
+                new_pos.append(pos)
+                old_pos.append(old)
+        return coords, (np.array(new_pos, dtype=np.intp),
+                        np.array(old_pos, dtype=np.intp))
+
+    def _ensure_hospital(self, hospital: Hospital) -> int:
+        """Row for a hospital, adding or clearing it if unknown or moved"""
+        coords = np.array([hospital.latitude, hospital.longitude])
+        row = self.hospital_index.get(hospital.hospital_id)
+        if row is not None:
+            if np.any(np.abs(self.hospital_coords[row] - coords) > COORD_TOLERANCE):
+                self.hospital_coords[row] = coords
+                self._clear(np.s_[row, :])
+            return row
+
+        row = len(self.hospital_ids)
+        self.hospital_ids.append(hospital.hospital_id)
+        self.hospital_index[hospital.hospital_id] = row
+        self.hospital_coords = np.vstack([self.hospital_coords, coords])
+        self._grow(axis=0)
+        return row
+
+    def _ensure_provider(self, provider: Provider) -> int:
+        """Column for a provider, adding or clearing it if unknown or moved"""
+        coords = np.array([provider.latitude, provider.longitude])
+        col = self.provider_index.get(provider.provider_id)
+        if col is not None:
+            if np.any(np.abs(self.provider_coords[col] - coords) > COORD_TOLERANCE):
+                self.provider_coords[col] = coords
+                self._clear(np.s_[:, col])
+            return col
+
+        col = len(self.provider_ids)
+        self.provider_ids.append(provider.provider_id)
+        self.provider_index[provider.provider_id] = col
+        self.provider_coords = np.vstack([self.provider_coords, coords])
+        self._grow(axis=1)
+        return col
+
+    def _grow(self, axis: int):
+        """Append one empty row (axis=0) or column (axis=1)"""
+        def pad(array, fill):
+            shape = list(array.shape)
+            shape[axis] = 1
+            return np.concatenate([array, np.full(shape, fill, dtype=array.dtype)],
+                                  axis=axis)
+
+        self.distance_km = pad(self.distance_km, np.nan)
+        self.duration_seconds = pad(self.duration_seconds, np.nan)
+        self.emissions_kg = pad(self.emissions_kg, np.nan)
+        self.duration_text = pad(self.duration_text, None)
+        self.polyline = pad(self.polyline, None)
+
+    def _clear(self, index):
+        self.distance_km[index] = np.nan
+        self.duration_seconds[index] = np.nan
+        self.emissions_kg[index] = np.nan
+        self.duration_text[index] = None
+        self.polyline[index] = None
+
+    # ------------------------------------------------------------------
+    # Route computation and lookup
+    # ------------------------------------------------------------------
+
+    def _set_route(self, row: int, col: int, route_info: Dict):
+        distance_km = route_info['distance_km']
+        self.distance_km[row, col] = distance_km
+        self.duration_seconds[row, col] = route_info['duration_seconds']
+        self.emissions_kg[row, col] = distance_km * self.mode_factors
+        self.duration_text[row, col] = route_info['duration_text']
+        self.polyline[row, col] = route_info['polyline']
+
+    def _fetch(self, hospital: Hospital, providers: List[Provider]) -> List[Optional[Dict]]:
+        """
+        Bulk distance lookup from providers to one hospital
+        Called without the lock held so lookups for different hospitals
+        can run concurrently
+        """
+        return self.route_service.get_distances_to(
+            [(p.latitude, p.longitude) for p in providers],
+            hospital.latitude, hospital.longitude
+        )
+
+    def _store(self, hospital: Hospital, providers: List[Provider],
+               routes: List[Optional[Dict]]) -> int:
+        """
+        Store fetched routes (lock held); rows and columns are resolved
+        again since sync() may have reshaped the matrix meanwhile.
+        Polylines are left empty until requested through polylines().
+        Returns the number of routes stored
+        """
+        row = self._ensure_hospital(hospital)
+        stored = 0
+        for provider, route_info in zip(providers, routes):
+            if route_info is None:
+                continue
+            self._set_route(row, self._ensure_provider(provider), route_info)
+            stored += 1
+        return stored
+
+    def _missing(self, hospital: Hospital, providers: List[Provider]) -> List[Provider]:
+        """Providers without a stored route to the hospital (lock held)"""
+        row = self._ensure_hospital(hospital)
+        cols = np.fromiter((self._ensure_provider(p) for p in providers),
+                           dtype=np.intp, count=len(providers))
+        return [providers[i] for i in np.flatnonzero(np.isnan(self.distance_km[row, cols]))]
+
+    def refresh(self, hospitals: List[Hospital], providers: List[Provider]) -> int:
+        """Compute every missing route; returns the number of routes stored"""
+        stored = 0
+        for hospital in hospitals:
+            with self._lock:
+                missing = self._missing(hospital, providers)
+            if missing:
+                routes = self._fetch(hospital, missing)
+                with self._lock:
+                    stored += self._store(hospital, missing, routes)
+        if stored:
+            # Bulk refreshes run off the request path, so save right away
+            with self._lock:
+                self._dirty = True
+            self.flush()
+        return stored
+
+    def refresh_in_background(self, hospitals: List[Hospital], providers: List[Provider]):
+        """
+        Run refresh() on a background thread; calls made while one is
+        running are coalesced into one more run with the latest locations
+        """
+        with self._lock:
+            self._refresh_args = (hospitals, providers)
+            if self._refresh_thread is not None:
+                return
+            self._refresh_thread = threading.Thread(target=self._refresh_loop,
+                                                    name='route-refresh', daemon=True)
+            self._refresh_thread.start()
+
+    def _refresh_loop(self):
+        while True:
+            with self._lock:
+                args, self._refresh_args = self._refresh_args, None
+                if args is None:
+                    self._refresh_thread = None
+                    return
+            try:
+                stored = self.refresh(*args)
+                print(f"Route matrix refresh stored {stored} routes")
+            except Exception as e:
+                print(f"Error refreshing route matrix: {e}")
+
+    def lookup(self, hospital: Hospital, providers: List[Provider]) -> Dict:
+        """
+        Distances and durations from every provider to one hospital
+        Cells still unknown after computing them are returned as NaN
+        (distance) / None (duration) so callers can fall back to haversine
+        """
+        with self._lock:
+            missing = self._missing(hospital, providers)
+
+        stored = 0
+        if missing:
+            routes = self._fetch(hospital, missing)
+            with self._lock:
+                stored = self._store(hospital, missing, routes)
+
+        with self._lock:
+            row = self._ensure_hospital(hospital)
+            cols = np.fromiter((self._ensure_provider(p) for p in providers),
+                               dtype=np.intp, count=len(providers))
+            result = {
+                'distance_km': self.distance_km[row, cols].copy(),
+                'duration_text': self.duration_text[row, cols].copy()
+            }
+
+        if stored:
+            self.mark_dirty()
+        return result
+
+    def polylines(self, hospital: Hospital, providers: List[Provider],
+                  fetch: bool = True) -> List[Optional[str]]:
+        """
+        Route polylines from the given providers to one hospital
+        Only called for the routes that are drawn, so missing polylines are
+        fetched here one directions request at a time (unless fetch=False,
+        which returns only what is already stored)
+        """
+        with self._lock:
+            row = self._ensure_hospital(hospital)
+            cols = [self._ensure_provider(p) for p in providers]
+            known = [self.polyline[row, col] for col in cols]
+
+        fetched = {}
+        if fetch:
+            for i, provider in enumerate(providers):
+                if known[i] is not None:
+                    continue
+                polyline = self.route_service.get_route_polyline(
+                    provider.latitude, provider.longitude,
+                    hospital.latitude, hospital.longitude
+                )
+                if polyline:
+                    fetched[i] = polyline
+
+        if fetched:
+            with self._lock:
+                row = self._ensure_hospital(hospital)
+                for i, polyline in fetched.items():
+                    col = self._ensure_provider(providers[i])
+                    self.polyline[row, col] = polyline
+                    known[i] = polyline
+            self.mark_dirty()
+        return known
+
+    def get_route(self, hospital_id: str, provider_id: str) -> Optional[Dict]:
+        """Stored route between a hospital and a provider, if known"""
+        with self._lock:
+            row = self.hospital_index.get(hospital_id)
+            col = self.provider_index.get(provider_id)
+            if row is None or col is None or np.isnan(self.distance_km[row, col]):
+                return None
+
+            return {
+                'distance_km': float(self.distance_km[row, col]),
+                'duration_seconds': float(self.duration_seconds[row, col]),
+                'duration_text': self.duration_text[row, col],
+                'polyline': self.polyline[row, col],
+                'emissions_kg': dict(zip(self.modes,
+                                         self.emissions_kg[row, col].tolist()))
+            }
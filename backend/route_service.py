@@ -1,16 +1,60 @@
 """Route and emission calculation service"""
+import os
 import googlemaps
 from math import radians, cos, sin, asin, sqrt
-from typing import Tuple, Optional, Dict
+from typing import Tuple, Optional, Dict, List
 from config import Config
+from route_cache import RouteCache
+from road_network import RoadNetwork
+
+
+def format_duration(seconds: float) -> str:
+    """Human readable duration in the style of Google Maps ('1 hour 5 mins')"""
+    minutes = max(1, int(round(seconds / 60)))
+    hours, minutes = divmod(minutes, 60)
+    if not hours:
+        return f"{minutes} min" if minutes == 1 else f"{minutes} mins"
+    hour_text = "1 hour" if hours == 1 else f"{hours} hours"
+    if not minutes:
+        return hour_text
+    return f"{hour_text} {minutes} min" if minutes == 1 else f"{hour_text} {minutes} mins"
 
 
 class RouteService:
     """Service for calculating routes and emissions"""
     
-    def __init__(self):
-        self.gmaps = googlemaps.Client(key=Config.GOOGLE_MAPS_API_KEY)
+    def __init__(self, cache: Optional[RouteCache] = None,
+                 road_network: Optional[RoadNetwork] = None,
+                 backend: Optional[str] = None):
+        self.backend = backend or Config.ROUTING_BACKEND
         self.emission_factors = Config.EMISSION_FACTORS
+        
+        # The local backend does not need a Google Maps key
+        if self.backend == 'local' and not Config.GOOGLE_MAPS_API_KEY:
+            self.gmaps = None
+        else:
+            self.gmaps = googlemaps.Client(key=Config.GOOGLE_MAPS_API_KEY)
+        
+        # Offline road graph: the primary backend when ROUTING_BACKEND is
+        # 'local', otherwise the fallback before straight-line distances
+        if road_network is None and Config.ROAD_NETWORK_PATH \
+                and os.path.exists(Config.ROAD_NETWORK_PATH):
+            try:
+                road_network = RoadNetwork.from_file(
+                    Config.ROAD_NETWORK_PATH, Config.ROAD_NETWORK_DEFAULT_SPEED_KMH
+                )
+            except Exception as e:
+                print(f"Error loading road network: {e}")
+        self.road_network = road_network
+        
+        if cache is None and Config.ROUTE_CACHE_ENABLED:
+            cache = RouteCache(
+                Config.ROUTE_CACHE_PATH,
+                ttl_seconds=Config.ROUTE_CACHE_TTL_SECONDS,
+                max_entries=Config.ROUTE_CACHE_MAX_ENTRIES,
+                precision=Config.ROUTE_CACHE_PRECISION
+            )
+        self.cache = cache
     
     def calculate_haversine_distance(self, lat1: float, lon1: float, 
                                      lat2: float, lon2: float) -> float:
@@ -40,17 +84,29 @@ class RouteService:
         Get route information using Google Maps Directions API
         Returns distance, duration, and polyline
         """
+        origin_point = (origin_lat, origin_lon)
+        dest_point = (dest_lat, dest_lon)
+        if self.backend == 'local':
+            # Never fall through to Google in local mode
+            local_route = self._get_local_route(origin_point, dest_point) \
+                if self.road_network else None
+            return local_route or self._straight_line_route(origin_point, dest_point)
+        if self.cache:
+            cached = self.cache.get(origin_point, dest_point, mode)
+            # Distance Matrix entries have no polyline, directions do
+            if cached and cached.get('polyline'):
+                return cached
+        
         try:
             origin = f"{origin_lat},{origin_lon}"
             destination = f"{dest_lat},{dest_lon}"
             
-            # Request directions
+            # Request directions (single best route, no live traffic so
+            # results are stable and cacheable)
             directions_result = self.gmaps.directions(
                 origin,
                 destination,
-                mode=mode,
-                departure_time='now',
-                alternatives=True
+                mode=mode
             )
             
             if not directions_result:
@@ -67,8 +123,7 @@ class RouteService:
             duration_text = leg['duration']['text']
             polyline = route['overview_polyline']['points']
             
-
-            return {
+            route_info = {
                 'distance_km': distance_km,
                 'duration_seconds': duration_seconds,
                 'duration_text': duration_text,
@@ -76,21 +131,167 @@ class RouteService:
                 'start_address': leg['start_address'],
                 'end_address': leg['end_address']
             }
+            if self.cache:
+                self.cache.set(origin_point, dest_point, mode, route_info)
+            
+            return route_info
             
         except Exception as e:
             print(f"Error getting route directions: {e}")
+            if self.road_network and self.backend != 'local':
+                local_route = self._get_local_route(origin_point, dest_point)
+                if local_route:
+                    return local_route
+            
             # Fallback to haversine distance
-            distance_km = self.calculate_haversine_distance(
-                origin_lat, origin_lon, dest_lat, dest_lon
-            )
-            return {
-                'distance_km': distance_km,
-                'duration_seconds': None,
-                'duration_text': 'Estimated',
+            return self._straight_line_route(origin_point, dest_point)
+    
+    def _straight_line_route(self, origin: Tuple[float, float],
+                             destination: Tuple[float, float]) -> Dict:
+        """Haversine estimate used when no road route is available"""
+        return {
+            'distance_km': self.calculate_haversine_distance(*origin, *destination),
+            'duration_seconds': None,
+            'duration_text': 'Estimated',
+            'polyline': None,
+            'start_address': f"{origin[0]},{origin[1]}",
+            'end_address': f"{destination[0]},{destination[1]}"
+        }
+    
+    def get_distances_to(self, origins: List[Tuple[float, float]],
+                         dest_lat: float, dest_lon: float,
+                         mode: str = 'driving') -> List[Optional[Dict]]:
+        """
+        Get road distance and duration from many origins to one destination
+        using the Google Maps Distance Matrix API, in as few requests as the
+        per-request origin limit allows. Polylines are not included; fetch
+        them with get_route_polyline for the routes that are displayed.
+        Entries are None where the API has no route or the request failed.
+        """
+        dest_point = (dest_lat, dest_lon)
+        if self.backend == 'local':
+            if not self.road_network:
+                return [None] * len(origins)
+            return self._get_local_distances(origins, dest_point)
+        
+        if self.cache:
+            results = self.cache.get_many(origins, dest_point, mode)
+        else:
+            results = [None] * len(origins)
+        
+        # Only origins missing from the cache go to the API
+        pending = [i for i, route_info in enumerate(results) if route_info is None]
+        destination = f"{dest_lat},{dest_lon}"
+        chunk_size = Config.DISTANCE_MATRIX_MAX_ORIGINS
+        fetched = []
+        
+        for start in range(0, len(pending), chunk_size):
+            chunk_indices = pending[start:start + chunk_size]
+            chunk = [origins[i] for i in chunk_indices]
+            try:
+                matrix = self.gmaps.distance_matrix(
+                    [f"{lat},{lon}" for lat, lon in chunk],
+                    [destination],
+                    mode=mode
+                )
+            except Exception as e:
+                print(f"Error getting distance matrix: {e}")
+                continue
+            
+            for offset, row in enumerate(matrix.get('rows', [])):
+                element = row['elements'][0]
+                if element.get('status') != 'OK':
+                    continue
+                
+                route_info = {
+                    'distance_km': element['distance']['value'] / 1000.0,
+                    'duration_seconds': element['duration']['value'],
+                    'duration_text': element['duration']['text'],
+                    'polyline': None,
+                    'start_address': matrix['origin_addresses'][offset],
+                    'end_address': matrix['destination_addresses'][0]
+                }
+                results[chunk_indices[offset]] = route_info
+                fetched.append((chunk[offset], dest_point, route_info))
+        
+        if self.cache:
+            self.cache.set_many(fetched, mode)
+        
+        # Origins the API could not route fall back to the road graph
+        if self.road_network:
+            missing = [i for i, route_info in enumerate(results) if route_info is None]
+            if missing:
+                local_routes = self._get_local_distances(
+                    [origins[i] for i in missing], dest_point
+                )
+                for i, route_info in zip(missing, local_routes):
+                    results[i] = route_info
+        
+        return results
+    
+    def _get_local_route(self, origin: Tuple[float, float],
+                         destination: Tuple[float, float]) -> Optional[Dict]:
+        """Route between two points on the offline road network"""
+        try:
+            route = self.road_network.shortest_path(origin, destination)
+        except Exception as e:
+            print(f"Error routing on road network: {e}")
+            return None
+        
+        if not route:
+            return None
+        
+        return {
+            'distance_km': route['distance_km'],
+            'duration_seconds': route['duration_seconds'],
+            'duration_text': format_duration(route['duration_seconds']),
+            'polyline': googlemaps.convert.encode_polyline(route['points']),
+            'start_address': f"{origin[0]},{origin[1]}",
+            'end_address': f"{destination[0]},{destination[1]}"
+        }
+    
+    def _get_local_distances(self, origins: List[Tuple[float, float]],
+                             destination: Tuple[float, float]) -> List[Optional[Dict]]:
+        """Routes from many origins to one destination on the road network"""
+        try:
+            routes = self.road_network.one_to_many(origins, destination)
+        except Exception as e:
+            print(f"Error routing on road network: {e}")
+            return [None] * len(origins)
+        
+        results = []
+        for origin, route in zip(origins, routes):
+            if route is None:
+                results.append(None)
+                continue
+            results.append({
+                'distance_km': route['distance_km'],
+                'duration_seconds': route['duration_seconds'],
+                'duration_text': format_duration(route['duration_seconds']),
                 'polyline': None,
-                'start_address': f"{origin_lat},{origin_lon}",
-                'end_address': f"{dest_lat},{dest_lon}"
-            }
+                'start_address': f"{origin[0]},{origin[1]}",
+                'end_address': f"{destination[0]},{destination[1]}"
+            })
+        return results
+    
+    def prefetch_routes(self, origins: List[Tuple[float, float]],
+                        dest_lat: float, dest_lon: float,
+                        mode: str = 'driving') -> int:
+        """
+        Warm the route cache for many origins to one destination
+        Returns the number of origins that now have a cached route
+        """
+        routes = self.get_distances_to(origins, dest_lat, dest_lon, mode)
+        return sum(1 for route_info in routes if route_info is not None)
+    
+    def get_route_polyline(self, origin_lat: float, origin_lon: float,
+                           dest_lat: float, dest_lon: float,
+                           mode: str = 'driving') -> Optional[str]:
+        """Get the encoded overview polyline for a single route"""
+        route_info = self.get_route_with_directions(
+            origin_lat, origin_lon, dest_lat, dest_lon, mode
+        )
+        return route_info['polyline'] if route_info else None
     
     def calculate_carbon_emission(self, distance_km: float, 
                                   transport_mode: str) -> float:
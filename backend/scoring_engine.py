@@ -0,0 +1,209 @@
+"""Vectorized scoring engine for supplier recommendations"""
+import time
+import numpy as np
+from typing import List, Optional
+from models import Provider
+from config import Config
+
+
+EARTH_RADIUS_KM = 6371.0
+
+# Carbon emission (kg CO2) at which the normalized carbon term saturates
+MAX_REASONABLE_EMISSION_KG = 500.0
+
+
+def haversine_km(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """
+    Great circle distance in kilometers between coordinates in decimal degrees
+    Accepts scalars or NumPy arrays (broadcast against each other)
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=float))
+                              for v in (lat1, lon1, lat2, lon2))
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def top_k_indices(scores: np.ndarray, k: Optional[int] = None) -> np.ndarray:
+    """
+    Indices of the k lowest scores in ascending order
+    Uses argpartition so only the winning rows get fully sorted
+    """
+    n = len(scores)
+    if not k or k >= n:
+        return np.argsort(scores, kind='stable')
+
+    candidates = np.argpartition(scores, k - 1)[:k]
+    # Sort winners by score, breaking ties by original position
+    return candidates[np.lexsort((candidates, scores[candidates]))]
+
+
+class ScoringEngine:
+    """
+    Holds a provider catalog as NumPy arrays so that distance, emission
+    and weighted score can be computed for every provider in one pass
+    """
+
+    def __init__(self, providers: List[Provider], emission_factors: dict = None):
+        if emission_factors is None:
+            emission_factors = Config.EMISSION_FACTORS
+
+        self.providers = list(providers)
+        self.provider_index = {
+            p.provider_id: row for row, p in enumerate(self.providers)
+        }
+
+        self.latitudes = np.array([p.latitude for p in self.providers], dtype=float)
+        self.longitudes = np.array([p.longitude for p in self.providers], dtype=float)
+
+        default_factor = emission_factors['truck']
+        self.emission_factors = np.array([
+            emission_factors.get((p.transport_mode or '').lower(), default_factor)
+            for p in self.providers
+        ], dtype=float)
+
+        # Cached combined flood risk per provider (NaN = not computed yet)
+        self.risk_scores = np.full(len(self.providers), np.nan)
+        self.risk_updated_at = np.zeros(len(self.providers))
+        # Scores that are provisional estimates awaiting the full risk
+        self.risk_provisional = np.zeros(len(self.providers), dtype=bool)
+
+    def __len__(self):
+        return len(self.providers)
+
+    def rows_for(self, providers: List[Provider]) -> np.ndarray:
+        """Map a list of providers from this catalog to engine rows"""
+        return np.fromiter(
+            (self.provider_index[p.provider_id] for p in providers),
+            dtype=np.intp, count=len(providers)
+        )
+
+    def haversine_distances(self, latitude: float, longitude: float,
+                            rows: np.ndarray = None) -> np.ndarray:
+        """Great circle distance from a point to the selected providers"""
+        if rows is None:
+            return haversine_km(self.latitudes, self.longitudes, latitude, longitude)
+        return haversine_km(self.latitudes[rows], self.longitudes[rows],
+                            latitude, longitude)
+
+    def carbon_emissions(self, distance_km: np.ndarray,
+                         rows: np.ndarray = None) -> np.ndarray:
+        """Carbon emission (kg CO2) for each provider's transport mode"""
+        factors = self.emission_factors if rows is None else self.emission_factors[rows]
+        return np.asarray(distance_km, dtype=float) * factors
+
+    @staticmethod
+    def normalize_carbon(carbon_emission_kg: np.ndarray) -> np.ndarray:
+        """Scale carbon emissions to 0-1"""
+        return np.minimum(np.asarray(carbon_emission_kg, dtype=float)
+                          / MAX_REASONABLE_EMISSION_KG, 1.0)
+
+    @classmethod
+    def weighted_scores(cls, flood_risk: np.ndarray,
+                        carbon_emission_kg: np.ndarray,
+                        alpha: float = None,
+                        beta: float = None) -> np.ndarray:
+        """
+        Score = α * flood_risk + β * normalized_carbon_emission
+        Lower score is better
+        """
+        if alpha is None:
+            alpha = Config.DEFAULT_ALPHA
+        if beta is None:
+            beta = Config.DEFAULT_BETA
+
+        return (alpha * np.asarray(flood_risk, dtype=float)
+                + beta * cls.normalize_carbon(carbon_emission_kg))
+
+    def score_lower_bounds(self, latitude: float, longitude: float,
+                           rows: np.ndarray,
+                           hospital_risk: float = 0.0,
+                           alpha: float = None,
+                           beta: float = None) -> np.ndarray:
+        """
+        Lowest weighted score each provider can still reach without any
+        routing or risk lookup: road distance is at least the great circle
+        distance, and route risk is at least the hospital's risk and the
+        provider's cached risk (when still fresh)
+        Only a bound for non-negative α/β
+        """
+        carbon = self.carbon_emissions(self.haversine_distances(latitude, longitude, rows),
+                                       rows)
+        provider_risk = self.risk_scores[rows].copy()
+        age = time.time() - self.risk_updated_at[rows]
+        provider_risk[np.isnan(provider_risk) | (age > Config.RISK_CACHE_TTL_SECONDS)] = 0.0
+        return self.weighted_scores(np.maximum(provider_risk, hospital_risk),
+                                    carbon, alpha, beta)
+
+    def stale_risk_rows(self, rows: np.ndarray, ttl_seconds: float = None) -> np.ndarray:
+        """Rows whose cached risk score is missing or older than the TTL"""
+        if ttl_seconds is None:
+            ttl_seconds = Config.RISK_CACHE_TTL_SECONDS
+
+        age = time.time() - self.risk_updated_at[rows]
+        stale = np.isnan(self.risk_scores[rows]) | (age > ttl_seconds)
+        return rows[stale]
+
+    def set_risk_scores(self, rows: np.ndarray, scores, provisional=False) -> None:
+        """Store freshly computed provider risk scores"""
+        self.risk_scores[rows] = scores
+        self.risk_updated_at[rows] = time.time()
+        self.risk_provisional[rows] = provisional
+
+    def score_matrix(self, latitudes: np.ndarray, longitudes: np.ndarray,
+                     rows: np.ndarray,
+                     hospital_risks: np.ndarray,
+                     distance_km: np.ndarray = None,
+                     provider_risks: np.ndarray = None) -> dict:
+        """
+        Build the destination x provider cost matrix in a single pass
+        Missing (NaN) road distances fall back to the great circle distance
+        Provider risks default to the cached risk scores of the rows
+        Returns (destinations, providers) arrays for distance, carbon and
+        flood risk; weighting is left to the caller so α/β can vary per row
+        """
+        latitudes = np.asarray(latitudes, dtype=float)[:, None]
+        longitudes = np.asarray(longitudes, dtype=float)[:, None]
+
+        straight_line = haversine_km(self.latitudes[rows][None, :],
+                                     self.longitudes[rows][None, :],
+                                     latitudes, longitudes)
+        if distance_km is None:
+            distance_km = straight_line
+        else:
+            distance_km = np.asarray(distance_km, dtype=float)
+            distance_km = np.where(np.isnan(distance_km), straight_line, distance_km)
+
+        carbon = distance_km * self.emission_factors[rows][None, :]
+        if provider_risks is None:
+            provider_risks = self.risk_scores[rows]
+        flood_risk = np.maximum(np.asarray(provider_risks, dtype=float)[None, :],
+                                np.asarray(hospital_risks, dtype=float)[:, None])
+
+        return {
+            'distance_km': distance_km,
+            'carbon_emission_kg': carbon,
+            'flood_risk': flood_risk
+        }
+
+    def score(self, latitude: float, longitude: float,
+              rows: np.ndarray,
+              hospital_risk: float,
+              distance_km: np.ndarray = None,
+              alpha: float = None,
+              beta: float = None) -> dict:
+        """
+        Score the selected providers against one destination in a single pass
+        Returns per-row arrays for distance, carbon, flood risk and score
+        """
+        if distance_km is not None:
+            distance_km = np.asarray(distance_km, dtype=float)[None, :]
+
+        matrix = self.score_matrix([latitude], [longitude], rows,
+                                   [hospital_risk], distance_km)
+        scored = {key: values[0] for key, values in matrix.items()}
+        scored['weighted_score'] = self.weighted_scores(
+            scored['flood_risk'], scored['carbon_emission_kg'], alpha, beta
+        )
+        return scored
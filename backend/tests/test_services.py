@@ -5,6 +5,12 @@ from route_service import RouteService
 from config import Config
 
 
+@pytest.fixture(autouse=True)
+def isolated_route_cache(tmp_path, monkeypatch):
+    """Give every test its own route cache instead of the persistent one"""
+    monkeypatch.setattr(Config, 'ROUTE_CACHE_PATH', str(tmp_path / 'routes.sqlite3'))
+
+
 def test_data_service_load():
     """Test that data service loads correctly"""
     service = DataService()
@@ -87,3 +93,1474 @@ def test_orders_filtering():
         assert len(hospital_orders) > 0
         assert all(o.hospital_id == first_order.hospital_id for o in hospital_orders)
 
+
+
+class FakeFEMAService:
+    """FEMA stand-in that scores locations without network access"""
+    
+    def __init__(self):
+        self.calls = 0
+    
+    def get_flood_zone(self, latitude, longitude):
+        self.calls += 1
+        risk_score = 0.8 if latitude < 26.0 else 0.2
+        return {
+            'zone': 'AE' if risk_score >= 0.8 else 'X',
+            'risk_level': 'high' if risk_score >= 0.8 else 'minimal',
+            'risk_score': risk_score,
+            'description': 'Test zone'
+        }
+    
+    def get_flood_zones(self, coordinates):
+        return [self.get_flood_zone(lat, lon) for lat, lon in coordinates]
+    
+    def combine_risk_score(self, fema_score, gee_score):
+        return min(1.0, max(0.0, (0.4 * fema_score) + (0.6 * gee_score)))
+
+
+class FakeGEEService:
+    """GEE stand-in returning the uninitialized fallback score"""
+    initialized = False
+    
+    def __init__(self):
+        self.bulk_calls = 0
+    
+    def get_flood_susceptibility(self, latitude, longitude):
+        return 0.3
+    
+    def get_flood_susceptibility_bulk(self, points, days_back=30):
+        self.bulk_calls += 1
+        return [0.3] * len(points)
+
+
+class FakeRouteService:
+    """Route stand-in using straight-line distances"""
+    
+    def __init__(self):
+        self.emission_factors = Config.EMISSION_FACTORS
+        self.calls = 0  # routed origin/destination pairs
+        self.requests = 0  # bulk distance requests
+        self.polyline_calls = 0
+    
+    def get_route_with_directions(self, origin_lat, origin_lon, dest_lat, dest_lon,
+                                  mode='driving'):
+        from scoring_engine import haversine_km
+        self.calls += 1
+        distance_km = 1.3 * float(haversine_km(origin_lat, origin_lon, dest_lat, dest_lon))
+        return {
+            'distance_km': distance_km,
+            'duration_seconds': distance_km * 45,
+            'duration_text': f'{int(distance_km * 45 // 60)} mins',
+            'polyline': 'test_polyline'
+        }
+    
+    def get_distances_to(self, origins, dest_lat, dest_lon, mode='driving'):
+        self.requests += 1
+        routes = []
+        for lat, lon in origins:
+            route_info = self.get_route_with_directions(lat, lon, dest_lat, dest_lon)
+            route_info['polyline'] = None
+            routes.append(route_info)
+        return routes
+    
+    def get_route_polyline(self, origin_lat, origin_lon, dest_lat, dest_lon,
+                           mode='driving'):
+        self.polyline_calls += 1
+        return 'test_polyline'
+    
+    def get_route_details(self, origin_lat, origin_lon, dest_lat, dest_lon,
+                          transport_mode):
+        distance_km = self.get_route_with_directions(
+            origin_lat, origin_lon, dest_lat, dest_lon)['distance_km']
+        factor = self.emission_factors.get(transport_mode.lower(),
+                                           self.emission_factors['truck'])
+        return {
+            'distance_km': distance_km,
+            'carbon_emission_kg': distance_km * factor,
+            'transport_mode': transport_mode,
+            'polyline': 'test_polyline',
+            'estimated_time': 'Estimated'
+        }
+
+
+def make_recommendation_service():
+    from recommendation_service import RecommendationService
+    from route_matrix import RouteMatrix
+    route_service = FakeRouteService()
+    return RecommendationService(
+        gee_service=FakeGEEService(),
+        fema_service=FakeFEMAService(),
+        route_service=route_service,
+        route_matrix=RouteMatrix(route_service)
+    )
+
+
+def test_scoring_engine_matches_scalar_score():
+    """Test vectorized scores agree with the scalar weighted score"""
+    import numpy as np
+    from scoring_engine import ScoringEngine
+    
+    service = make_recommendation_service()
+    providers = DataService().get_all_providers()
+    engine = ScoringEngine(providers)
+    rows = np.arange(len(providers))
+    engine.set_risk_scores(rows, np.linspace(0.1, 0.9, len(providers)))
+    
+    scored = engine.score(25.7617, -80.1918, rows, hospital_risk=0.4,
+                          alpha=0.7, beta=0.3)
+    
+    for i, provider in enumerate(providers):
+        flood_risk = max(engine.risk_scores[i], 0.4)
+        carbon = scored['distance_km'][i] * Config.EMISSION_FACTORS[provider.transport_mode]
+        expected = service.calculate_weighted_score(flood_risk, carbon, 0.7, 0.3)
+        assert scored['weighted_score'][i] == pytest.approx(expected)
+
+
+def test_top_k_indices():
+    """Test top-k selection returns the lowest scores in order"""
+    import numpy as np
+    from scoring_engine import top_k_indices
+    
+    scores = np.array([0.5, 0.1, 0.9, 0.3, 0.1])
+    assert list(top_k_indices(scores, 3)) == [1, 4, 3]
+    assert list(top_k_indices(scores)) == [1, 4, 3, 0, 2]
+
+
+def test_generate_recommendations_ranked_and_limited():
+    """Test recommendations are sorted by score and limited"""
+    service = make_recommendation_service()
+    data = DataService()
+    hospital = data.get_all_hospitals()[0]
+    providers = data.get_all_providers()
+    
+    recommendations = service.generate_recommendations(hospital, providers, limit=3)
+    assert len(recommendations) == 3
+    scores = [r.weighted_score for r in recommendations]
+    assert scores == sorted(scores)
+    
+    full = service.generate_recommendations(hospital, providers)
+    assert len(full) == len(providers)
+    assert [r.provider.provider_id for r in full[:3]] == \
+        [r.provider.provider_id for r in recommendations]
+    
+    # Provider risk is cached by the engine between requests
+    fema_calls = service.fema_service.calls
+    service.generate_recommendations(hospital, providers, limit=3)
+    assert service.fema_service.calls == fema_calls + 1
+
+
+def test_batch_recommendations_match_single():
+    """Test batch rankings equal per-hospital rankings and share routing"""
+    service = make_recommendation_service()
+    data = DataService()
+    hospitals = data.get_all_hospitals()[:3]
+    providers = data.get_all_providers()
+    
+    batch = service.generate_batch_recommendations(
+        [{'hospital': h, 'limit': 2} for h in hospitals]
+        + [{'hospital': hospitals[0], 'limit': 2, 'alpha': 0.1, 'beta': 0.9}],
+        providers
+    )
+    # Hospital and provider susceptibility each take one bulk evaluation
+    assert service.gee_service.bulk_calls == 2
+    
+    # Repeated hospitals reuse the route lookups of the first request,
+    # one bulk distance request per hospital, polylines only for winners
+    assert service.route_service.calls == len(hospitals) * len(providers)
+    assert service.route_service.requests == len(hospitals)
+    assert service.route_service.polyline_calls <= len(hospitals) * 2
+    assert all(r.route_polyline == 'test_polyline' for ranking in batch for r in ranking)
+    assert len(batch) == len(hospitals) + 1
+    
+    for hospital, ranking in zip(hospitals, batch):
+        single = service.generate_recommendations(hospital, providers, limit=2)
+        assert [r.provider.provider_id for r in ranking] == \
+            [r.provider.provider_id for r in single]
+        assert [r.weighted_score for r in ranking] == \
+            pytest.approx([r.weighted_score for r in single])
+    
+    reweighted = service.generate_recommendations(
+        hospitals[0], providers, alpha=0.1, beta=0.9, limit=2
+    )
+    assert [r.weighted_score for r in batch[-1]] == \
+        pytest.approx([r.weighted_score for r in reweighted])
+
+
+def test_route_matrix_persists_and_refreshes_incrementally(tmp_path):
+    """Test route matrix reloads from disk and recomputes only moved locations"""
+    import os
+    from dataclasses import replace
+    from route_matrix import RouteMatrix
+    
+    data = DataService()
+    hospitals = data.get_all_hospitals()
+    providers = data.get_all_providers()
+    path = str(tmp_path / 'route_matrix.npz')
+    
+    route_service = FakeRouteService()
+    matrix = RouteMatrix(route_service, path)
+    matrix.sync(hospitals, providers)
+    assert matrix.refresh(hospitals, providers) == len(hospitals) * len(providers)
+    
+    route = matrix.get_route(hospitals[0].hospital_id, providers[0].provider_id)
+    assert route['polyline'] is None
+    # New polylines are saved later in the background, not on the lookup
+    saved_at = os.path.getmtime(path)
+    assert matrix.polylines(hospitals[0], providers[:1]) == ['test_polyline']
+    assert route_service.polyline_calls == 1
+    assert os.path.getmtime(path) == saved_at
+    assert matrix.flush() and not matrix.flush()
+    assert route['emissions_kg']['air'] == pytest.approx(
+        route['distance_km'] * Config.EMISSION_FACTORS['air'])
+    
+    # A new process loads the saved matrix without routing again
+    reloaded_service = FakeRouteService()
+    reloaded = RouteMatrix(reloaded_service, path)
+    assert reloaded.sync(hospitals, providers) == 0
+    routes = reloaded.lookup(hospitals[0], providers)
+    assert reloaded_service.calls == 0
+    assert routes['distance_km'][0] == pytest.approx(route['distance_km'])
+    
+    # Moving one provider and adding one hospital recomputes only that
+    # column and that row
+    moved = list(providers)
+    moved[0] = replace(moved[0], latitude=moved[0].latitude + 0.5)
+    added = hospitals + [replace(hospitals[0], hospital_id='H999')]
+    cleared = reloaded.sync(added, moved)
+    assert cleared == len(added) + len(moved) - 1
+    assert reloaded.refresh(added, moved) == cleared
+    assert reloaded_service.calls == cleared
+    
+    # Upload refreshes run on a background thread
+    moved[1] = replace(moved[1], latitude=moved[1].latitude + 0.5)
+    assert reloaded.sync(added, moved) == len(added)
+    reloaded.refresh_in_background(added, moved)
+    thread = reloaded._refresh_thread
+    if thread is not None:
+        thread.join(5)
+    assert reloaded.get_route('H999', moved[1].provider_id) is not None
+
+
+def test_distance_matrix_batches_origins(monkeypatch):
+    """Test bulk routing splits origins into Distance Matrix sized requests"""
+    monkeypatch.setattr(Config, 'GOOGLE_MAPS_API_KEY', 'AIzaTestKey')
+    monkeypatch.setattr(Config, 'ROUTE_CACHE_ENABLED', False)
+    route_service = RouteService()
+    calls = []
+    
+    def fake_distance_matrix(origins, destinations, mode):
+        calls.append(len(origins))
+        return {
+            'origin_addresses': origins,
+            'destination_addresses': destinations,
+            'rows': [
+                {'elements': [{
+                    'status': 'OK' if i % 7 else 'ZERO_RESULTS',
+                    'distance': {'value': 1000 * (i + 1)},
+                    'duration': {'value': 60 * (i + 1), 'text': f'{i + 1} mins'}
+                }]}
+                for i in range(len(origins))
+            ]
+        }
+    
+    monkeypatch.setattr(route_service.gmaps, 'distance_matrix', fake_distance_matrix)
+    origins = [(26.0 + i * 0.01, -80.0) for i in range(60)]
+    routes = route_service.get_distances_to(origins, 25.76, -80.19)
+    
+    assert calls == [25, 25, 10]
+    assert len(routes) == 60
+    assert routes[0] is None  # ZERO_RESULTS element
+    assert routes[1]['distance_km'] == 2.0
+    assert routes[1]['polyline'] is None
+
+
+def test_route_cache_ttl_lru_and_stats(tmp_path, monkeypatch):
+    """Test route cache quantizes keys, expires entries and bounds size"""
+    import route_cache
+    from route_cache import RouteCache
+    
+    cache = RouteCache(str(tmp_path / 'routes.sqlite3'), ttl_seconds=60,
+                       max_entries=2, precision=4)
+    dest = (25.7617, -80.1918)
+    cache.set((26.12241, -80.13731), dest, 'driving', {'distance_km': 30.0})
+    
+    # Coordinates within the rounding precision share an entry
+    assert cache.get((26.122412, -80.137309), dest, 'driving') == {'distance_km': 30.0}
+    assert cache.get((26.12241, -80.13731), dest, 'walking') is None
+    
+    cache.set((27.0, -81.0), dest, 'driving', {'distance_km': 150.0})
+    cache.get((26.12241, -80.13731), dest, 'driving')  # keep first entry recent
+    cache.set((28.0, -82.0), dest, 'driving', {'distance_km': 300.0})
+    assert cache.stats()['entries'] == 2
+    assert cache.get((27.0, -81.0), dest, 'driving') is None  # least recently used
+    
+    now = route_cache.time.time()
+    monkeypatch.setattr(route_cache.time, 'time', lambda: now + 120)
+    assert cache.get((28.0, -82.0), dest, 'driving') is None
+    
+    stats = cache.stats()
+    assert stats['hits'] == 2
+    assert stats['misses'] == 3
+
+
+def test_route_service_serves_bulk_routes_from_cache(tmp_path, monkeypatch):
+    """Test repeated bulk routing only hits the API for uncached origins"""
+    from route_cache import RouteCache
+    monkeypatch.setattr(Config, 'GOOGLE_MAPS_API_KEY', 'AIzaTestKey')
+    cache = RouteCache(str(tmp_path / 'routes.sqlite3'), ttl_seconds=3600,
+                       max_entries=100)
+    route_service = RouteService(cache=cache)
+    calls = []
+    
+    def fake_distance_matrix(origins, destinations, mode):
+        calls.append(list(origins))
+        return {
+            'origin_addresses': origins,
+            'destination_addresses': destinations,
+            'rows': [{'elements': [{
+                'status': 'OK',
+                'distance': {'value': 5000},
+                'duration': {'value': 300, 'text': '5 mins'}
+            }]} for _ in origins]
+        }
+    
+    monkeypatch.setattr(route_service.gmaps, 'distance_matrix', fake_distance_matrix)
+    origins = [(26.0, -80.0), (26.5, -80.5)]
+    assert route_service.prefetch_routes(origins, 25.76, -80.19) == 2
+    
+    routes = route_service.get_distances_to(origins + [(27.0, -81.0)], 25.76, -80.19)
+    assert [r['distance_km'] for r in routes] == [5.0, 5.0, 5.0]
+    assert calls == [['26.0,-80.0', '26.5,-80.5'], ['27.0,-81.0']]
+
+
+def write_grid_road_network(path, size=6, spacing=0.1):
+    """Write a square grid road graph with a slow diagonal shortcut"""
+    import json
+    nodes = {f'n{r}_{c}': [25.0 + r * spacing, -81.0 + c * spacing]
+             for r in range(size) for c in range(size)}
+    edges = []
+    for r in range(size):
+        for c in range(size):
+            if c + 1 < size:
+                edges.append([f'n{r}_{c}', f'n{r}_{c + 1}', 10000, 600])
+            if r + 1 < size:
+                edges.append([f'n{r}_{c}', f'n{r + 1}_{c}', 11000, 660])
+    # Short but slow road between opposite corners
+    edges.append(['n0_0', f'n{size - 1}_{size - 1}', 50000, 100000])
+    with open(path, 'w') as f:
+        json.dump({'nodes': nodes, 'edges': edges}, f)
+
+
+def test_road_network_shortest_paths(tmp_path):
+    """Test bidirectional and one-to-many Dijkstra agree on the grid"""
+    from road_network import RoadNetwork
+    path = tmp_path / 'road_network.json'
+    write_grid_road_network(path)
+    network = RoadNetwork.from_file(str(path))
+    
+    origin, destination = (25.0, -81.0), (25.5, -80.5)
+    fastest = network.shortest_path(origin, destination)
+    # Five steps east and five north beat the slow diagonal
+    assert fastest['distance_km'] == pytest.approx(105.0)
+    assert fastest['duration_seconds'] == pytest.approx(6300)
+    
+    shortest = network.shortest_path(origin, destination, weight='distance')
+    assert shortest['distance_km'] == pytest.approx(50.0)
+    
+    origins = [(25.0, -81.0), (25.2, -80.7), (25.5, -80.5)]
+    bulk = network.one_to_many(origins, destination)
+    for point, route in zip(origins, bulk):
+        single = network.shortest_path(point, destination)
+        assert route['distance_km'] == pytest.approx(single['distance_km'])
+        assert route['duration_seconds'] == pytest.approx(single['duration_seconds'])
+
+
+def test_road_network_nearest_node_and_parallel_edges():
+    """Test snapping checks rings far enough east/west and totals follow the search weight"""
+    import numpy as np
+    from road_network import RoadNetwork
+    # At 80N a degree of longitude is about 19 km, so the node three grid
+    # cells east is closer than the one a cell north
+    coords = np.array([[80.075, 10.025], [80.025, 10.175], [80.025, 10.175]])
+    edges = [['0', '1', 20000, 100], ['0', '1', 10000, 1000]]
+    network = RoadNetwork(['0', '1', '2'], coords, edges)
+    node, distance_km = network.nearest_node(80.025, 10.025)
+    assert node == 1 and distance_km == pytest.approx(2.9, abs=0.1)
+    
+    fastest = network.shortest_path((80.075, 10.025), (80.025, 10.175))
+    shortest = network.shortest_path((80.075, 10.025), (80.025, 10.175), weight='distance')
+    assert fastest['distance_km'] == pytest.approx(20.0)
+    assert shortest['distance_km'] == pytest.approx(10.0)
+    assert shortest['duration_seconds'] == pytest.approx(1000)
+
+
+def test_route_service_local_backend(tmp_path, monkeypatch):
+    """Test the local backend routes without a Google Maps key"""
+    from road_network import RoadNetwork
+    path = tmp_path / 'road_network.json'
+    write_grid_road_network(path)
+    monkeypatch.setattr(Config, 'GOOGLE_MAPS_API_KEY', None)
+    
+    route_service = RouteService(road_network=RoadNetwork.from_file(str(path)),
+                                 backend='local')
+    assert route_service.gmaps is None
+    
+    route = route_service.get_route_with_directions(25.0, -81.0, 25.5, -80.5)
+    assert route['distance_km'] == pytest.approx(105.0)
+    assert route['duration_text'] == '1 hour 45 mins'
+    assert route['polyline']
+    
+    routes = route_service.get_distances_to([(25.0, -81.0), (25.5, -80.6)], 25.5, -80.5)
+    assert routes[0]['distance_km'] == pytest.approx(105.0)
+    assert routes[1]['distance_km'] == pytest.approx(10.0)
+    
+    # Points the graph cannot connect get a straight line, not a Google call
+    import types
+    calls = []
+    monkeypatch.setattr(route_service, 'gmaps', types.SimpleNamespace(
+        directions=lambda *args, **kwargs: calls.append(args)))
+    monkeypatch.setattr(route_service.road_network, 'shortest_path', lambda *args: None)
+    route = route_service.get_route_with_directions(25.0, -81.0, 25.5, -80.5)
+    assert calls == []
+    assert route['duration_text'] == 'Estimated' and route['polyline'] is None
+    assert route['distance_km'] == pytest.approx(
+        route_service.calculate_haversine_distance(25.0, -81.0, 25.5, -80.5))
+
+
+def write_flood_zone_geojson(path):
+    """Write an AE square with an X hole next to a VE square"""
+    import json
+    features = [
+        {
+            'type': 'Feature',
+            'properties': {'FLD_ZONE': 'AE'},
+            'geometry': {'type': 'Polygon', 'coordinates': [
+                [[-80.3, 25.7], [-80.1, 25.7], [-80.1, 25.9], [-80.3, 25.9], [-80.3, 25.7]],
+                [[-80.22, 25.78], [-80.18, 25.78], [-80.18, 25.82], [-80.22, 25.82],
+                 [-80.22, 25.78]]
+            ]}
+        },
+        {
+            'type': 'Feature',
+            'properties': {'FLD_ZONE': 'X'},
+            'geometry': {'type': 'Polygon', 'coordinates': [
+                [[-80.22, 25.78], [-80.18, 25.78], [-80.18, 25.82], [-80.22, 25.82],
+                 [-80.22, 25.78]]
+            ]}
+        },
+        {
+            'type': 'Feature',
+            'properties': {'FLD_ZONE': 'VE'},
+            'geometry': {'type': 'MultiPolygon', 'coordinates': [[
+                [[-80.1, 25.7], [-80.0, 25.7], [-80.0, 25.9], [-80.1, 25.9], [-80.1, 25.7]]
+            ]]}
+        }
+    ]
+    with open(path, 'w') as f:
+        json.dump({'type': 'FeatureCollection', 'features': features}, f)
+
+
+def test_flood_zone_index_point_in_polygon(tmp_path):
+    """Test polygon index resolves zones, holes and uncovered points"""
+    from flood_zone_index import FloodZoneIndex
+    path = tmp_path / 'zones.geojson'
+    write_flood_zone_geojson(path)
+    index = FloodZoneIndex.load(str(path))
+    
+    assert index.query(25.75, -80.25) == 'AE'
+    assert index.query(25.80, -80.20) == 'X'  # inside the AE hole
+    assert index.query(25.80, -80.05) == 'VE'
+    assert index.query(27.0, -82.0) is None
+    
+    zones = index.query_many([25.75, 25.80, 25.80, 27.0], [-80.25, -80.20, -80.05, -82.0])
+    assert zones == ['AE', 'X', 'VE', None]
+
+
+def test_flood_zone_index_keeps_large_polygons_out_of_cells():
+    """Test a county-sized polygon is not bucketed into thousands of cells"""
+    import numpy as np
+    from flood_zone_index import FloodZoneIndex, MAX_CELLS_PER_POLYGON
+    
+    def square(lon, lat, size):
+        return np.array([[lon, lat], [lon + size, lat], [lon + size, lat + size],
+                         [lon, lat + size], [lon, lat]], dtype=float)
+    
+    # A one degree zone X area listed first, then many small AE polygons
+    polygons = [('X', [square(-81.0, 25.0, 1.0)])]
+    polygons += [('AE', [square(-80.9 + 0.02 * i, 25.1, 0.01)]) for i in range(40)]
+    index = FloodZoneIndex(polygons)
+    
+    assert index.cell_degrees == pytest.approx(0.01)
+    assert max(len(cells) for cells in index._grid.values()) == 1
+    assert len(index._grid) <= 40 * MAX_CELLS_PER_POLYGON
+    # The first polygon covering a point wins, as before
+    assert index.query_many([25.105, 25.5, 26.5], [-80.895, -80.5, -80.5]) == ['X', 'X', None]
+    assert FloodZoneIndex(polygons[1:] + polygons[:1]).query(25.105, -80.895) == 'AE'
+
+
+def test_flood_zone_index_splits_multipart_shapes(monkeypatch):
+    """Test every clockwise shapefile ring starts a new exterior, not a hole"""
+    import sys
+    import types
+    from flood_zone_index import FloodZoneIndex
+
+    def square(x, y, size, clockwise=True):
+        ring = [(x, y), (x, y + size), (x + size, y + size), (x + size, y), (x, y)]
+        return ring if clockwise else ring[::-1]
+
+    # Two exteriors, the first with a hole
+    rings = [square(-80.3, 25.7, 0.2), square(-80.25, 25.75, 0.05, clockwise=False),
+             square(-80.0, 25.7, 0.1)]
+    shape = types.SimpleNamespace(points=[p for r in rings for p in r],
+                                  parts=[0, 5, 10])
+
+    class Reader:
+        fields = [('DeletionFlag',), ('FLD_ZONE',)]
+
+        def __init__(self, path):
+            pass
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def iterShapeRecords(self):
+            return [types.SimpleNamespace(record=['AE'], shape=shape)]
+
+    monkeypatch.setitem(sys.modules, 'shapefile', types.SimpleNamespace(Reader=Reader))
+    index = FloodZoneIndex.load('zones.shp')
+    assert len(index) == 2
+    assert index.query_many([25.72, 25.77, 25.75], [-80.28, -80.22, -79.95]) == \
+        ['AE', None, 'AE']
+
+
+def test_fema_service_uses_local_flood_zones(tmp_path, monkeypatch):
+    """Test FEMA lookups use local polygons and skip the remote API"""
+    import requests
+    from fema_service import FEMAService
+    path = tmp_path / 'zones.geojson'
+    write_flood_zone_geojson(path)
+    monkeypatch.setattr(Config, 'FEMA_FLOOD_ZONES_PATH', str(path))
+    monkeypatch.setattr(Config, 'FEMA_REMOTE_FALLBACK', False)
+    
+    def no_network(*args, **kwargs):
+        raise AssertionError("remote FEMA API should not be called")
+    monkeypatch.setattr(requests.Session, 'request', no_network)
+    
+    service = FEMAService()
+    result = service.get_flood_zone(25.80, -80.05)
+    assert result['zone'] == 'VE'
+    assert result['risk_score'] == 1.0
+    assert result['risk_level'] == 'high'
+    
+    bulk = service.get_flood_zones([(25.75, -80.25), (27.0, -82.0)])
+    assert bulk[0]['zone'] == 'AE'
+    assert bulk[1] == service._estimate_flood_zone(27.0, -82.0)
+
+
+class FakeResponse:
+    def __init__(self, status_code, zone=None):
+        self.status_code = status_code
+        self.zone = zone
+    
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            import requests
+            raise requests.HTTPError(f"{self.status_code} error")
+    
+    def json(self):
+        return {'result': {'flood.s_fld_haz_ar': [{'fld_zone': self.zone}]}}
+
+
+def test_flood_data_client_retries_with_timeouts():
+    """Test flood data client retries transient failures with timeouts"""
+    import requests
+    from flood_data_client import FloodDataClient
+    client = FloodDataClient(timeout=(1, 2), max_retries=2, backoff_seconds=0)
+    responses = [requests.Timeout('slow'), FakeResponse(503), FakeResponse(200, 'AE')]
+    calls = []
+    
+    def fake_get(url, params, timeout):
+        calls.append(timeout)
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+    
+    client.session.get = fake_get
+    assert client.get_zone(25.76, -80.19) == 'AE'
+    assert calls == [(1, 2)] * 3
+    
+    # Out of retries the last error surfaces
+    responses.extend([FakeResponse(503)] * 3)
+    with pytest.raises(requests.HTTPError):
+        client.get_zone(25.76, -80.19)
+
+
+def test_flood_data_client_bulk_lookup_keeps_order():
+    """Test bulk lookups keep input order and tolerate failures"""
+    from flood_data_client import FloodDataClient
+    client = FloodDataClient(max_retries=0, backoff_seconds=0, max_workers=4)
+    
+    def fake_get(url, params, timeout):
+        if params['lat'] < 0:
+            return FakeResponse(500)
+        return FakeResponse(200, f"Z{params['lat']}")
+    
+    client.session.get = fake_get
+    zones = client.get_zones([(1, 0), (2, 0), (-1, 0), (3, 0)])
+    assert zones == ['Z1', 'Z2', None, 'Z3']
+
+
+def test_geohash_encode():
+    """Test geohash encoding against a known value"""
+    import geohash
+    assert geohash.encode(57.64911, 10.40744, 11) == 'u4pruydqqvj'
+    assert geohash.encode(25.7617, -80.1918, 8) == geohash.encode(25.76171, -80.19181, 8)
+    assert geohash.encode(25.7617, -80.1918, 8) != geohash.encode(25.7627, -80.1918, 8)
+
+
+def test_ttl_cache_expiry_bound_and_negative_entries(monkeypatch):
+    """Test TTL cache expires, evicts least recently used and counts hits"""
+    import ttl_cache
+    from ttl_cache import TTLCache
+    now = [1000.0]
+    monkeypatch.setattr(ttl_cache.time, 'time', lambda: now[0])
+    
+    cache = TTLCache(max_entries=2, ttl_seconds=100, negative_ttl_seconds=10)
+    cache.set('a', 1)
+    cache.set_negative('b')
+    assert cache.get('b') == (True, None)
+    assert cache.get('a') == (True, 1)
+    
+    cache.set('c', 3)  # evicts 'b', the least recently used
+    assert cache.get('b') == (False, None)
+    
+    now[0] += 50
+    assert cache.get('a') == (True, 1)
+    now[0] += 60
+    assert cache.get('a') == (False, None)
+    
+    cache.set_negative('d')
+    now[0] += 20
+    assert cache.get('d') == (False, None)  # negative entries expire sooner
+    
+    stats = cache.stats()
+    assert (stats['hits'], stats['negative_hits'], stats['misses']) == (2, 1, 3)
+
+
+def test_fema_service_caches_by_geohash_with_negative_entries(monkeypatch):
+    """Test FEMA lookups are cached per tile and failures are not retried"""
+    from fema_service import FEMAService
+    monkeypatch.setattr(Config, 'FEMA_FLOOD_ZONES_PATH', None)
+    monkeypatch.setattr(Config, 'FEMA_REMOTE_FALLBACK', True)
+    
+    class FakeClient:
+        calls = []
+        
+        def get_zones(self, coordinates):
+            self.calls.append(list(coordinates))
+            return ['AE' if lat < 26 else None for lat, _ in coordinates]
+    
+    client = FakeClient()
+    service = FEMAService(client=client)
+    
+    # Two points in the same ~20 m tile share one upstream lookup
+    first = service.get_flood_zones([(25.76170, -80.19180), (25.76171, -80.19181)])
+    assert [r['zone'] for r in first] == ['AE', 'AE']
+    assert len(client.calls[0]) == 1
+    
+    # A failing upstream is answered from the negative entry
+    failed = service.get_flood_zone(27.0, -82.0)
+    assert failed == service._estimate_flood_zone(27.0, -82.0)
+    service.get_flood_zone(27.0, -82.0)
+    service.get_flood_zone(25.7617, -80.1918)
+    assert len(client.calls) == 2
+    
+    stats = service.cache_stats()
+    assert stats['hits'] == 1 and stats['negative_hits'] == 1
+
+
+def test_flood_susceptibility_score():
+    """Test susceptibility rises with precipitation and falls with elevation"""
+    from gee_service import flood_susceptibility_score
+    assert flood_susceptibility_score(0, 0) == pytest.approx(0.6)
+    assert flood_susceptibility_score(200, 0) == 0.0
+    assert flood_susceptibility_score(0, 1000) == pytest.approx(1.0)
+    assert flood_susceptibility_score(50, 250) == pytest.approx(0.5)
+
+
+def test_elevation_store_bilinear_sampling(tmp_path):
+    """Test HGT tiles are sampled bilinearly and voids/missing tiles are NaN"""
+    import numpy as np
+    from elevation_store import ElevationStore, VOID
+    
+    # 11x11 tile whose elevation rises 10 m per pixel eastwards and
+    # 1 m per pixel southwards
+    size = 11
+    rows, cols = np.mgrid[0:size, 0:size]
+    tile = (cols * 10 + rows).astype('>i2')
+    tile[0, 0] = VOID
+    tile.tofile(tmp_path / 'N25W081.hgt')
+    
+    store = ElevationStore(str(tmp_path))
+    assert len(store) == 1
+    assert store.has_tile(25.5, -80.5)
+    
+    # South-west corner is the last row, first column
+    assert store.get_elevation(25.0, -81.0) == pytest.approx(10)
+    # Half a pixel east and north of the south-west corner
+    assert store.get_elevation(25.05, -80.95) == pytest.approx(5 + 9.5)
+    
+    values = store.sample([25.5, 25.99, 27.0], [-80.5, -80.99, -80.5])
+    assert values[0] == pytest.approx(50 + 5)
+    assert np.isnan(values[1])  # next to the void pixel
+    assert np.isnan(values[2])  # no tile
+    assert store.get_elevation(27.0, -80.5) is None
+
+
+def test_elevation_store_geotiff_windows(tmp_path, monkeypatch):
+    """Test GeoTIFF tiles use their geotransform and nodata and are read in windows"""
+    import sys
+    import types
+    import numpy as np
+    from elevation_store import ElevationStore
+    
+    # 6 rows x 11 columns: 0.2 degree rows and 0.1 degree columns whose
+    # pixel centres fall on the tile edges; rises 10 m per column east
+    # and 1 m per row south
+    rows, cols = np.mgrid[0:6, 0:11]
+    band = (cols * 10 + rows).astype(np.int16)
+    band[0, 0] = -9999
+    windows = []
+    
+    class Dataset:
+        height, width = band.shape
+        nodata = -9999
+        transform = types.SimpleNamespace(a=0.1, b=0.0, c=-81.05, d=0.0, e=-0.2, f=26.1)
+        
+        def read(self, index, window):
+            (top, bottom), (left, right) = window
+            windows.append(window)
+            return band[top:bottom, left:right]
+    
+    monkeypatch.setitem(sys.modules, 'rasterio', types.SimpleNamespace(open=lambda path: Dataset()))
+    (tmp_path / 'N25W081.tif').write_bytes(b'')
+    store = ElevationStore(str(tmp_path))
+    
+    # South-west corner is the last row, first column
+    assert store.get_elevation(25.0, -81.0) == pytest.approx(5)
+    # Half a column east and half a row north of it
+    assert store.get_elevation(25.1, -80.95) == pytest.approx(5 + 4.5)
+    assert windows[-1] == ((4, 6), (0, 2))
+    
+    values = store.sample([25.45, 25.95], [-80.45, -80.99])
+    assert values[0] == pytest.approx(55 + 2.75)
+    assert np.isnan(values[1])  # next to the nodata pixel
+    assert windows[-1] == ((0, 4), (0, 7))
+    
+    # Without rasterio GeoTIFF tiles are skipped rather than failing later
+    monkeypatch.setitem(sys.modules, 'rasterio', None)
+    store = ElevationStore(str(tmp_path))
+    assert len(store) == 0 and store.get_elevation(25.5, -80.5) is None
+
+
+def test_flood_susceptibility_without_precipitation():
+    """Test terrain-only susceptibility uses the fallback precipitation risk"""
+    from gee_service import flood_susceptibility_score, FALLBACK_SUSCEPTIBILITY
+    assert flood_susceptibility_score(0, None) == pytest.approx(
+        0.6 + 0.4 * FALLBACK_SUSCEPTIBILITY)
+    assert flood_susceptibility_score(100, None) == pytest.approx(
+        0.4 * FALLBACK_SUSCEPTIBILITY)
+
+
+def test_precipitation_store_windows():
+    """Test the daily precipitation store reports gaps and sums windows"""
+    from datetime import date, timedelta
+    from precipitation_store import PrecipitationStore
+    store = PrecipitationStore(precision=2)
+    start = date(2024, 6, 1)
+    days = [start + timedelta(days=i) for i in range(10)]
+    
+    assert store.window_total(25.76, -80.19, days[0], days[-1]) == (None, 9)
+    store.add(25.761, -80.192, {day: float(i) for i, day in enumerate(days[:8])})
+    
+    # Nearby coordinates share the rounded location
+    end = start + timedelta(days=10)
+    assert store.missing_days(25.76, -80.19, days[0], end) == days[8:]
+    assert store.window_total(25.76, -80.19, days[2], days[5]) == (pytest.approx(2 + 3 + 4), 0)
+    # Partial windows report how many days are missing
+    assert store.window_total(25.76, -80.19, days[6], end) == (pytest.approx(6 + 7), 2)
+    
+    # Fetched days without data are not asked for again until the TTL passes
+    store.add(25.76, -80.19, {days[8]: 1.0}, fetched_days=days[8:])
+    assert store.missing_days(25.76, -80.19, days[0], end) == []
+    store.negative_ttl_seconds = -1
+    store.add(25.76, -80.19, {}, fetched_days=days[9:])
+    assert store.missing_days(25.76, -80.19, days[0], end) == days[9:]
+
+
+def test_parse_daily_precipitation_bands():
+    """Test per-day band values are read and old gaps stored as dry"""
+    from datetime import date, timedelta
+    from gee_service import GEEService
+    end = date.today() - timedelta(days=2)
+    start = end - timedelta(days=30)
+    recent = end - timedelta(days=1)
+    old = start + timedelta(days=1)
+    properties = {
+        'index': 0,
+        f"{start:%Y%m%d}_precipitation": 12.5,
+        f"{recent:%Y%m%d}_precipitation": 3.0,
+        'elevation': 4.0,
+    }
+    
+    values = GEEService._parse_daily_bands(properties, start, end)
+    assert values[start] == pytest.approx(12.5)
+    assert values[recent] == pytest.approx(3.0)
+    # Old days without an image are final; recent ones are left to refetch
+    assert values[old] == 0.0
+    assert (end - timedelta(days=3)) not in values
+
+
+def test_risk_scheduler_publishes_versioned_table():
+    """Test a refresh pass scores every known location in batches"""
+    import numpy as np
+    from dataclasses import replace
+    from risk_scheduler import RiskScheduler, HOSPITAL, PROVIDER
+    data = DataService()
+    scheduler = RiskScheduler(data, FakeFEMAService(), FakeGEEService(),
+                              max_workers=2, rate_limit_per_second=0, batch_size=3)
+    hospitals = data.get_all_hospitals()
+    providers = data.get_all_providers()
+    
+    assert scheduler.run_once() == len(hospitals) + len(providers)
+    table = scheduler.risk_table
+    assert table.version > 1
+    assert table.stats()['providers'] == len(providers)
+    
+    scores = table.get_scores(PROVIDER, providers)
+    assert not np.isnan(scores).any()
+    fema = FakeFEMAService()
+    zone = fema.get_flood_zone(hospitals[0].latitude, hospitals[0].longitude)
+    assert table.get_scores(HOSPITAL, hospitals[:1])[0] == pytest.approx(
+        fema.combine_risk_score(zone['risk_score'], 0.3))
+    
+    # A moved location no longer matches its published entry
+    moved = replace(providers[0], latitude=providers[0].latitude + 0.5)
+    assert table.get_entries(PROVIDER, [moved]) == [None]
+
+
+def test_recommendations_read_risk_table():
+    """Test known locations are scored from the risk table, not GEE"""
+    from risk_scheduler import RiskScheduler
+    data = DataService()
+    hospital = data.get_all_hospitals()[0]
+    providers = data.get_all_providers()
+    
+    service = make_recommendation_service()
+    scheduler = RiskScheduler(data, FakeFEMAService(), FakeGEEService(),
+                              rate_limit_per_second=0)
+    service.risk_table = scheduler.risk_table
+    
+    # Before the first pass only provisional FEMA-based scores are used
+    pending = service.get_entity_risk_details('provider', providers[:2])
+    assert all(d['pending'] for d in pending)
+    ranking = service.generate_recommendations(hospital, providers, limit=3)
+    assert service.gee_service.bulk_calls == 0
+    assert all(r.degraded for r in ranking)
+    
+    scheduler.run_once()
+    fema_calls = service.fema_service.calls
+    ranking = service.generate_recommendations(hospital, providers, limit=3)
+    assert service.gee_service.bulk_calls == 0
+    assert service.fema_service.calls == fema_calls
+    assert len(ranking) == 3
+    assert not any(r.degraded for r in ranking)
+
+
+def test_gee_service_bulk_susceptibility_single_round_trip(monkeypatch):
+    """Test bulk susceptibility samples every point in one getInfo call, in input order"""
+    import types
+    import gee_service
+    from datetime import timedelta
+    from gee_service import GEEService, flood_susceptibility_score
+    from elevation_store import ElevationStore
+    requests = []
+    
+    class FakeImage:
+        def select(self, *bands):
+            return self
+        
+        def addBands(self, other):
+            return self
+        
+        def toBands(self):
+            return self
+        
+        def filterDate(self, start, end):
+            return self
+        
+        def reduceRegions(self, collection, reducer, scale):
+            requests.append(collection)
+            start, end = service._precipitation_window()
+            days = [start + timedelta(days=i) for i in range((end - start).days)]
+            # Features come back in a different order than they were sent
+            features = []
+            for feature in reversed(collection):
+                lon, lat = feature['geometry']
+                properties = dict(feature['properties'], elevation=lat)
+                properties.update({f"{day:%Y%m%d}_precipitation": -lon / 10 for day in days})
+                features.append({'properties': properties})
+            return types.SimpleNamespace(getInfo=lambda: {'features': features})
+    
+    fake_ee = types.SimpleNamespace(
+        Image=lambda name: FakeImage(),
+        ImageCollection=lambda name: FakeImage(),
+        Geometry=types.SimpleNamespace(Point=lambda coords: coords),
+        Feature=lambda geometry, properties: {'geometry': geometry, 'properties': properties},
+        FeatureCollection=list,
+        Reducer=types.SimpleNamespace(mean=lambda: 'mean')
+    )
+    monkeypatch.setattr(gee_service, 'ee', fake_ee)
+    
+    service = GEEService(elevation_store=ElevationStore(None))
+    service._state = 'ready'
+    points = [(25.0, -80.0), (40.0, -75.0), (30.0, -90.0)]
+    scores = service.get_flood_susceptibility_bulk(points)
+    
+    assert len(requests) == 1
+    assert [f['properties']['index'] for f in requests[0]] == [0, 1, 2]
+    assert scores == [
+        pytest.approx(flood_susceptibility_score(lat, -lon / 10 * 30)) for lat, lon in points
+    ]
+
+
+def test_gee_service_initializes_in_background(monkeypatch):
+    """Test construction never blocks and the fallback is served until ready"""
+    import threading
+    import ee
+    from gee_service import GEEService, FALLBACK_SUSCEPTIBILITY
+    from elevation_store import ElevationStore
+    release = threading.Event()
+    monkeypatch.setattr(ee, 'Initialize', lambda **kwargs: release.wait(5))
+    monkeypatch.setattr(ee.data, 'setDeadline', lambda milliseconds: None)
+    
+    service = GEEService(elevation_store=ElevationStore(None))
+    assert service.status == 'idle'
+    assert not service.initialized  # starts initialization
+    assert service.status == 'pending'
+    assert service.get_flood_susceptibility(25.76, -80.19) == FALLBACK_SUSCEPTIBILITY
+    
+    release.set()
+    assert service.wait_until_ready(5)
+    assert service.initialized
+
+
+def test_gee_service_ready_after_late_initialization(monkeypatch):
+    """Test an initialization finishing after the timeout still makes the service ready"""
+    import threading
+    import ee
+    from gee_service import GEEService
+    from elevation_store import ElevationStore
+    release = threading.Event()
+    monkeypatch.setattr(ee, 'Initialize', lambda **kwargs: release.wait(5))
+    monkeypatch.setattr(ee.data, 'setDeadline', lambda milliseconds: None)
+    monkeypatch.setattr(Config, 'GEE_INIT_TIMEOUT_SECONDS', 0.05)
+    
+    service = GEEService(elevation_store=ElevationStore(None))
+    assert not service.wait_until_ready(0.5)
+    assert service.status == 'failed'
+    release.set()
+    assert service._ready.wait(5)
+    assert service.status == 'ready' and service.initialized
+
+
+def test_gee_service_skips_interactive_auth(monkeypatch):
+    """Test a failed initialization does not fall back to interactive auth"""
+    import ee
+    from gee_service import GEEService
+    from elevation_store import ElevationStore
+    
+    def fail(**kwargs):
+        raise RuntimeError('no credentials')
+    
+    def authenticate(*args, **kwargs):
+        raise AssertionError('interactive auth attempted')
+    
+    monkeypatch.setattr(ee, 'Initialize', fail)
+    monkeypatch.setattr(ee, 'Authenticate', authenticate)
+    service = GEEService(elevation_store=ElevationStore(None), interactive_auth=False)
+    assert not service.wait_until_ready(0.5)
+    assert service.status == 'failed'
+    assert not service.initialized  # no retry before the retry interval
+    assert service.status == 'failed'
+
+
+def test_recommendations_degrade_after_deadline():
+    """Test lookups missing the deadline fall back and are flagged"""
+    import threading
+    from scoring_engine import haversine_km
+    service = make_recommendation_service()
+    release = threading.Event()
+    slow_lookup = service.route_service.get_distances_to
+    
+    def get_distances_to(*args, **kwargs):
+        release.wait(5)
+        return slow_lookup(*args, **kwargs)
+    
+    service.route_service.get_distances_to = get_distances_to
+    data = DataService()
+    hospital = data.get_all_hospitals()[0]
+    providers = data.get_all_providers()
+    
+    try:
+        ranking = service.generate_batch_recommendations(
+            [{'hospital': hospital, 'limit': 3}], providers, deadline_seconds=0.2
+        )[0]
+    finally:
+        release.set()
+    assert len(ranking) == 3
+    assert all(r.degraded for r in ranking)
+    assert all(r.estimated_time == 'Estimated' for r in ranking)
+    for r in ranking:
+        assert r.distance_km == pytest.approx(float(haversine_km(
+            r.provider.latitude, r.provider.longitude,
+            hospital.latitude, hospital.longitude)))
+    
+    # Lookups answering in time are not flagged
+    service.route_service.get_distances_to = slow_lookup
+    ranking = service.generate_recommendations(hospital, providers, limit=3)
+    assert not any(r.degraded for r in ranking)
+
+
+def test_gather_not_blocked_by_late_lookups(monkeypatch):
+    """Test lookups left running past a deadline do not hold later requests"""
+    import threading
+    import time
+    monkeypatch.setattr(Config, 'RECOMMENDATION_FANOUT_WORKERS', 1)
+    service = make_recommendation_service()
+    release = threading.Event()
+    
+    try:
+        results = service._gather([lambda: release.wait(5), lambda: 'queued'],
+                                  time.monotonic() + 0.1)
+        assert results == [(False, None), (False, None)]
+        
+        # The first call still occupies its own request's worker
+        started = time.monotonic()
+        assert service._gather([lambda: 'answer'], time.monotonic() + 2) == [(True, 'answer')]
+        assert time.monotonic() - started < 1
+    finally:
+        release.set()
+
+
+def test_gather_sequential_degrades_failures(monkeypatch):
+    """Test sequential lookups keep the deadline and a failure only affects its call"""
+    import time
+    monkeypatch.setattr(Config, 'RECOMMENDATION_FANOUT_ENABLED', False)
+    service = make_recommendation_service()
+    
+    def fail():
+        raise RuntimeError('lookup failed')
+    
+    def slow():
+        time.sleep(0.2)
+        return 'slow'
+    
+    results = service._gather([lambda: 'answer', fail, slow, lambda: 'late'],
+                              time.monotonic() + 0.1)
+    assert results == [(True, 'answer'), (False, None), (True, 'slow'), (False, None)]
+
+
+def test_stream_recommendations_provisional_then_final():
+    """Test streaming starts from fallback scores and ends with the full ranking"""
+    service = make_recommendation_service()
+    data = DataService()
+    hospital = data.get_all_hospitals()[0]
+    providers = data.get_all_providers()
+    
+    events = list(service.stream_recommendations(hospital, providers, limit=3))
+    kinds = [event for event, _ in events]
+    assert kinds[0] == 'provisional' and kinds[-1] == 'final'
+    assert set(kinds[1:-1]) <= {'refined'} and len(kinds) > 2
+    
+    provisional = events[0][1]
+    assert len(provisional) == 3 and all(r.degraded for r in provisional)
+    
+    final = events[-1][1]
+    assert not any(r.degraded for r in final)
+    assert all(r.route_polyline == 'test_polyline' for r in final)
+    expected = service.generate_recommendations(hospital, providers, limit=3)
+    assert [r.provider.provider_id for r in final] == \
+        [r.provider.provider_id for r in expected]
+    assert [r.weighted_score for r in final] == \
+        pytest.approx([r.weighted_score for r in expected])
+
+
+def test_stream_recommendations_without_fanout(monkeypatch, capsys):
+    """Test streaming runs lookups in the calling thread when fan-out is off"""
+    import threading
+    monkeypatch.setattr(Config, 'RECOMMENDATION_FANOUT_ENABLED', False)
+    service = make_recommendation_service()
+    data = DataService()
+    hospital = data.get_all_hospitals()[0]
+    providers = data.get_all_providers()
+    threads = set()
+    lookup = service.route_matrix.lookup
+    
+    def recording_lookup(*args, **kwargs):
+        threads.add(threading.current_thread())
+        return lookup(*args, **kwargs)
+    
+    service.route_matrix.lookup = recording_lookup
+    events = list(service.stream_recommendations(hospital, providers, limit=3))
+    assert threads == {threading.current_thread()}
+    assert events[-1][0] == 'final' and not any(r.degraded for r in events[-1][1])
+    
+    # Snapshots are not logged, only the final ranking
+    assert capsys.readouterr().out.count('total recommendations') == 1
+
+
+def test_recommendations_prune_by_lower_bound(monkeypatch):
+    """Test providers that cannot make the top k are never routed"""
+    import numpy as np
+    monkeypatch.setattr(Config, 'RECOMMENDATION_WAVE_SIZE', 1)
+    data = DataService()
+    hospital = data.get_all_hospitals()[0]
+    providers = data.get_all_providers()
+    
+    full = make_recommendation_service().generate_recommendations(hospital, providers)
+    service = make_recommendation_service()
+    top = service.generate_recommendations(hospital, providers, limit=2)
+    
+    assert [r.provider.provider_id for r in top] == \
+        [r.provider.provider_id for r in full[:2]]
+    assert [r.weighted_score for r in top] == \
+        pytest.approx([r.weighted_score for r in full[:2]])
+    assert service.route_service.calls < len(providers)
+    
+    # Bounds never exceed the scores actually reached
+    engine = service.scoring_engine
+    rows = np.arange(len(providers))
+    bounds = engine.score_lower_bounds(hospital.latitude, hospital.longitude, rows)
+    scores = {r.provider.provider_id: r.weighted_score for r in full}
+    assert all(bounds[i] <= scores[p.provider_id] + 1e-9
+               for i, p in enumerate(engine.providers))
+
+
+def test_substitute_closure_is_transitive():
+    """Test substitutes of substitutes are accepted, ignoring case and spacing"""
+    from product_substitutes import build_substitute_closure, is_substitute
+    closure = build_substitute_closure({'A': ['B'], 'B': ['C'], 'C': ['A']})
+    assert set(closure['a']) == {'b', 'c'}
+    assert list(closure['b'].values()) == ['A', 'C']
+    assert is_substitute('  ventilator ', 'cpap')
+    assert not is_substitute('Ventilator', 'VENTILATOR')
+
+
+def test_device_index_matches_provider_scan():
+    """Test the inverted index finds the same providers as a full scan"""
+    from dataclasses import replace
+    from device_index import DeviceIndex
+    from product_substitutes import get_product_with_substitutes
+    providers = DataService().get_all_providers()
+    index = DeviceIndex(providers)
+    
+    for device in {d for p in providers for d in p.devices_supplied or []}:
+        acceptable = set(get_product_with_substitutes(device))
+        expected = [p.provider_id for p in providers
+                    if acceptable & set(p.devices_supplied or [])]
+        found, product_map = index.lookup(f"  {device.upper()} ")
+        assert [p.provider_id for p in found] == expected
+        assert all(product_map[pid] in acceptable for pid in expected)
+    
+    # Providers appended later are indexed incrementally
+    providers = list(providers)
+    index = DeviceIndex(providers)
+    extra = replace(providers[0], provider_id='PX', devices_supplied=['Widget'])
+    providers.append(extra)
+    index.add(extra)
+    assert [p.provider_id for p in index.lookup('widget')[0]] == ['PX']
+
+
+def test_basket_solver_exact_and_greedy():
+    """Test the basket solver finds the cheapest cover and drops redundant picks"""
+    import numpy as np
+    from basket_optimizer import solve_basket, assign_devices
+    coverage = np.array([
+        [1, 1, 0],   # 0: covers A, B
+        [0, 0, 1],   # 1: covers C
+        [1, 1, 1],   # 2: covers all
+        [1, 0, 0],   # 3: cheap A only
+    ], dtype=bool)
+    costs = np.array([0.3, 0.3, 0.7, 0.1])
+    
+    # Without a shipment penalty two providers beat the all-in-one
+    assert sorted(solve_basket(costs, coverage)) == [0, 1]
+    # A high enough penalty makes a single shipment cheaper
+    assert solve_basket(costs, coverage, shipment_cost=0.5) == [2]
+    # Greedy picks the cheap single-device provider first, then prunes it
+    assert sorted(solve_basket(costs, coverage, exact_max_devices=0)) == [0, 1]
+    assert assign_devices([0, 1, 3], costs, coverage) == [3, 0, 1]
+    assert solve_basket(costs, np.zeros((4, 1), dtype=bool)) is None
+
+
+def test_basket_covers_every_device():
+    """Test a basket assigns every available device to a chosen provider"""
+    data_service = DataService()
+    service = make_recommendation_service()
+    hospital = data_service.get_all_hospitals()[0]
+    providers = data_service.get_all_providers()
+    devices = sorted({d for p in providers for d in p.devices_supplied or []})[:3]
+    
+    basket = service.generate_basket(hospital, providers, devices + ['Nonexistent'])
+    assert basket['unavailable'] == ['Nonexistent']
+    assert basket['recommendations'][-1] is None
+    chosen = set(basket['providers'])
+    for device, rec in zip(devices, basket['recommendations']):
+        assert rec.provider.provider_id in chosen
+        assert rec.offered_device in rec.provider.devices_supplied
+    assert len(chosen) <= len(devices)
+
+
+def test_pareto_frontier_is_non_dominated():
+    """Test the frontier keeps exactly the points nothing beats on both axes"""
+    import numpy as np
+    from pareto_frontier import pareto_frontier
+    risk = np.array([0.2, 0.1, 0.5, 0.1, 0.3, 0.9])
+    carbon = np.array([0.5, 0.9, 0.1, 0.8, 0.6, 0.1])
+    assert pareto_frontier(risk, carbon).tolist() == [3, 0, 2]
+
+
+def test_rerank_from_frontier_matches_full_generation():
+    """Test re-ranking a cached frontier agrees with a fresh recommendation run"""
+    data_service = DataService()
+    service = make_recommendation_service()
+    hospital = data_service.get_all_hospitals()[0]
+    providers = data_service.get_all_providers()
+    
+    frontier = service.get_frontier(hospital, providers)
+    assert service.get_frontier(hospital, providers) is frontier
+    for alpha, beta in ((0.9, 0.1), (0.2, 0.8)):
+        reranked = service.rank_frontier(frontier, alpha, beta, 5)
+        expected = service.generate_recommendations(hospital, providers, alpha, beta, 5)
+        assert [r.provider.provider_id for r in reranked] == \
+            [r.provider.provider_id for r in expected]
+        assert [r.route_polyline for r in reranked] == ['test_polyline'] * 5
+        assert all(abs(a.weighted_score - b.weighted_score) < 1e-9
+                   for a, b in zip(reranked, expected))
+
+
+def test_rank_frontier_requests_polylines_once():
+    """Test re-ranking asks for a missing polyline once per provider and only within the limit"""
+    service = make_recommendation_service()
+    data_service = DataService()
+    hospital = data_service.get_all_hospitals()[0]
+    providers = data_service.get_all_providers()
+    frontier = service.get_frontier(hospital, providers)
+    
+    calls = []
+    
+    def get_route_polyline(*args):
+        calls.append(args)
+        return None
+    
+    service.route_service.get_route_polyline = get_route_polyline
+    service.rank_frontier(frontier, 0.9, 0.1)
+    assert calls == []
+    
+    ranked = service.rank_frontier(frontier, 0.9, 0.1, 2)
+    assert len(calls) == 2 and all(r.route_polyline is None for r in ranked)
+    for alpha, beta in ((0.9, 0.1), (0.5, 0.5), (0.9, 0.1)):
+        service.rank_frontier(frontier, alpha, beta, 2)
+    assert len(calls) == len(frontier.polylines_requested) <= 4
+
+
+def test_data_service_indices_match_scans():
+    """Test ID and order indices agree with linear scans, including added rows"""
+    from models import Order
+    service = DataService()
+    for hospital in service.get_all_hospitals():
+        assert service.get_hospital_by_id(hospital.hospital_id) is hospital
+        assert service.get_orders_by_hospital(hospital.hospital_id) == \
+            [o for o in service.get_all_orders() if o.hospital_id == hospital.hospital_id]
+    for provider in service.get_all_providers():
+        assert service.get_provider_by_id(provider.provider_id) is provider
+    assert service.get_hospital_by_id('missing') is None
+    
+    order = Order('OX', 'H001', 'P002', 'Ventilator', 1, '2024-06-01', '2024-06-02')
+    service.add_order(order)
+    expected = [o for o in service.get_all_orders() if 'vent' in o.device_name.lower()]
+    assert service.get_orders_by_device(' VENT') == expected
+    assert service.get_orders_by_device('ventilator')[-1] == order
+    assert service.get_orders_by_provider('P002')[-1] == order
+
+
+def test_csv_loader_reports_bad_rows(tmp_path):
+    """Test the columnar loader skips unparseable rows and reports them"""
+    from csv_loader import load_order_store, load_providers
+    orders_csv = tmp_path / 'orders.csv'
+    orders_csv.write_text(
+        "order_id,hospital_id,provider_id,device_name,quantity,order_date,delivery_date\n"
+        "O1,H001,P001,Ventilator,5,2024-01-15,2024-01-20\n"
+        "O2,H001,P001,CPAP,lots,2024-01-15,2024-01-20\n"
+        ",H002,P002,CPAP,2,2024-01-15,2024-01-20\n"
+    )
+    orders, errors = load_order_store(orders_csv)
+    assert [o.order_id for o in orders] == ['O1']
+    assert orders[0].quantity == 5 and isinstance(orders[0].quantity, int)
+    assert errors == ['row 2 (O2): invalid quantity', 'row 3: missing order_id']
+    
+    providers_csv = tmp_path / 'providers.csv'
+    providers_csv.write_text(
+        "provider_id,name,type,address,city,state,zip,latitude,longitude,"
+        "transport_mode,devices_supplied\n"
+        'P1,A,Warehouse,1 St,Miami,FL,02134,25.7,-80.1,truck,"[""CPAP""]"\n'
+        'P2,B,Warehouse,2 St,Miami,FL,33101,25.8,-80.2,van,not json\n'
+        'P3,C,Warehouse,3 St,Miami,FL,33102,25.9,-80.3,van,\n'
+    )
+    warnings = []
+    providers, errors = load_providers(providers_csv, warnings=warnings)
+    assert [p.devices_supplied for p in providers] == [['CPAP'], [], []]
+    assert providers[0].zip == '02134'
+    # The provider with a bad device list is kept, so it is only a warning
+    assert errors == []
+    assert warnings == ['Could not parse devices for provider P2']
+
+
+def test_order_dates_parse_mixed_formats(tmp_path):
+    """Test order dates in mixed formats survive chunked loading and bad dates are reported"""
+    from csv_loader import load_order_store
+    orders_csv = tmp_path / 'orders.csv'
+    orders_csv.write_text(
+        "order_id,hospital_id,provider_id,device_name,quantity,order_date,delivery_date\n"
+        "O1,H001,P001,CPAP,1,2024-01-15,\n"
+        "O2,H001,P001,CPAP,1,1/5/2024,2024-01-20\n"
+        "O3,H001,P001,CPAP,1,2024-01-15T10:00,01/22/2024\n"
+        "O4,H001,P001,CPAP,1,soon,2024-01-20\n"
+    )
+    store, errors = load_order_store(orders_csv, chunk_rows=2)
+    assert [(o.order_date, o.delivery_date) for o in store] == [
+        ('2024-01-15', None), ('2024-01-05', '2024-01-20'), ('2024-01-15', '2024-01-22')
+    ]
+    assert errors == ['row 4 (O4): invalid order_date']
+
+
+def test_order_store_round_trips_orders():
+    """Test the columnar order store returns the same orders and filters by mask"""
+    from models import Order
+    from order_store import OrderStore
+    orders = DataService().get_all_orders()
+    originals = list(orders)
+    store = OrderStore.from_orders(originals)
+    assert list(store) == originals and store[-1] == originals[-1]
+    
+    extra = Order('O-LATE-0001', 'H001', 'P999', 'New Device', 3, '2025-03-01', None)
+    store.append(extra)
+    assert store[len(originals)] == extra
+    assert store.take(store.positions('provider_id', ['P999'])) == [extra]
+    assert store.filter(hospital_id='H001', start_date='2025-01-01') == [extra]
+    assert store.filter(hospital_id='H001') == \
+        [o for o in originals + [extra] if o.hospital_id == 'H001']
+
+
+def test_ingest_job_loads_orders_in_chunks(tmp_path):
+    """Test a chunked ingest job applies the upload and reports progress"""
+    from ingest import IngestManager, DONE, FAILED
+    service = DataService()
+    completed = []
+    manager = IngestManager(service, on_complete=lambda csv_type, changes: completed.append(csv_type),
+                            chunk_rows=2)
+    
+    upload = tmp_path / 'orders.csv'
+    upload.write_text(
+        "order_id,hospital_id,provider_id,device_name,quantity,order_date,delivery_date\n"
+        + "".join(f"N{i},H001,P001,CPAP,{i + 1},2024-02-01,2024-02-03\n" for i in range(5))
+        + "N5,H001,P001,CPAP,many,2024-02-01,2024-02-03\n"
+    )
+    job = manager.submit('orders', str(upload), run_async=False)
+    assert job.status == DONE and completed == ['orders']
+    assert job.rows_read == 6 and job.bytes_read == job.total_bytes
+    assert job.row_errors == ['row 6 (N5): invalid quantity']
+    assert [o.order_id for o in service.get_all_orders()] == [f"N{i}" for i in range(5)]
+    assert not upload.exists()
+    
+    # A file without the expected columns fails and keeps the current orders
+    upload.write_text("order_id,quantity\nX1,1\n")
+    job = manager.submit('orders', str(upload))
+    assert job.done.wait(5) and job.status == FAILED
+    assert job.error.startswith('Missing required columns')
+    
+    # A provider with an unreadable device list is kept and only warned about
+    upload.write_text(
+        "provider_id,name,type,address,city,state,zip,latitude,longitude,"
+        "transport_mode,devices_supplied\n"
+        "PX,A,Warehouse,1 St,Miami,FL,33101,25.7,-80.1,truck,not json\n"
+    )
+    job = manager.submit('providers', str(upload), run_async=False, mode='upsert')
+    assert job.status == DONE
+    assert job.error_count == 0 and job.row_errors == []
+    assert job.warnings == ['Could not parse devices for provider PX']
+    assert service.get_provider_by_id('PX').devices_supplied == []
+    assert len(service.get_all_orders()) == 5
+    assert manager.get(job.job_id) is job
+    
+    # A synchronous upload does not wait behind queued uploads
+    import threading
+    release = threading.Event()
+    update = service.update_from_csv
+    
+    def slow_update(*args, **kwargs):
+        release.wait(5)
+        return update(*args, **kwargs)
+    
+    service.update_from_csv = slow_update
+    for name in ('first.csv', 'second.csv'):
+        (tmp_path / name).write_text(
+            "order_id,hospital_id,provider_id,device_name,quantity,order_date,delivery_date\n"
+            "N9,H001,P001,CPAP,1,2024-02-01,2024-02-03\n")
+    first = manager.submit('orders', str(tmp_path / 'first.csv'))
+    second = manager.submit('orders', str(tmp_path / 'second.csv'), run_async=False)
+    assert not second.finished
+    release.set()
+    assert first.done.wait(5) and second.done.wait(5) and second.status == DONE
+
+
+def test_upsert_upload_merges_by_id(tmp_path):
+    """Test upsert uploads merge rows, apply tombstones and report changed IDs"""
+    service = DataService()
+    hospitals = service.get_all_hospitals()
+    first, second = hospitals[0], hospitals[1]
+    upload = tmp_path / 'hospitals.csv'
+    upload.write_text(
+        "hospital_id,name,address,city,state,zip,latitude,longitude,deleted\n"
+        f"{first.hospital_id},Renamed,{first.address},{first.city},{first.state},"
+        f"{first.zip},{first.latitude},{first.longitude},\n"
+        f"{second.hospital_id},,,,,,,,true\n"
+        "HNEW,New Hospital,1 Main St,Tampa,FL,33601,27.95,-82.46,\n"
+    )
+    assert service.update_from_csv('hospitals', str(upload), mode='upsert')
+    assert service.last_changes == {'added': ['HNEW'], 'updated': [first.hospital_id],
+                                    'deleted': [second.hospital_id]}
+    assert service.get_hospital_by_id(first.hospital_id).name == 'Renamed'
+    assert service.get_hospital_by_id(second.hospital_id) is None
+    assert len(service.get_all_hospitals()) == len(hospitals)
+    orders = list(service.get_all_orders())
+    upload = tmp_path / 'orders.csv'
+    upload.write_text(
+        "order_id,hospital_id,provider_id,device_name,quantity,order_date,delivery_date,deleted\n"
+        f"{orders[0].order_id},,,,,,,1\n"
+        f"{orders[1].order_id},{orders[1].hospital_id},{orders[1].provider_id},"
+        f"{orders[1].device_name},{orders[1].quantity},{orders[1].order_date},"
+        f"{orders[1].delivery_date},\n"
+        "ONEW,H001,P001,CPAP,4,2024-05-01,2024-05-03,\n"
+    )
+    assert service.update_from_csv('orders', str(upload), mode='upsert')
+    assert service.last_changes == {'added': ['ONEW'], 'updated': [],
+                                    'deleted': [orders[0].order_id]}
+    assert [o.order_id for o in service.get_all_orders()] == \
+        [o.order_id for o in orders[1:]] + ['ONEW']
+    assert service.get_orders_by_hospital('H001')[-1].order_id == 'ONEW'
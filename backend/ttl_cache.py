@@ -0,0 +1,89 @@
+"""In-process TTL cache with LRU size bound and negative entries"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """
+    Thread-safe cache whose entries expire after a TTL, bounded to a
+    maximum size by evicting the least recently used entry. Negative
+    entries record failed lookups for a shorter TTL so a failing
+    upstream is not queried again right away.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float,
+                 negative_ttl_seconds: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = ttl_seconds if negative_ttl_seconds is None \
+            else negative_ttl_seconds
+        self._entries: 'OrderedDict[Hashable, Tuple[float, bool, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """
+        Look up a key
+        Returns (True, value) on a hit, (True, None) on a negative hit and
+        (False, None) on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, negative, value = entry
+                if expires_at > time.time():
+                    self._entries.move_to_end(key)
+                    if negative:
+                        self.negative_hits += 1
+                        return True, None
+                    self.hits += 1
+                    return True, value
+                del self._entries[key]
+
+            self.misses += 1
+            return False, None
+
+    def set(self, key: Hashable, value: Any):
+        """Store a value for the normal TTL"""
+        self._store(key, value, negative=False, ttl=self.ttl_seconds)
+
+    def set_negative(self, key: Hashable):
+        """Record a failed lookup for the negative TTL"""
+        self._store(key, None, negative=True, ttl=self.negative_ttl_seconds)
+
+    def _store(self, key: Hashable, value: Any, negative: bool, ttl: float):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, negative, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        """Drop one entry"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        """Hit/miss counters and current size"""
+        with self._lock:
+            lookups = self.hits + self.negative_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'negative_hits': self.negative_hits,
+                'misses': self.misses,
+                'hit_ratio': round((self.hits + self.negative_hits) / lookups, 3)
+                if lookups else 0.0
+            }